@@ -35,11 +35,15 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'clintrack.User'
 
 MIDDLEWARE = [
+    # Outermost so session and auth queries are counted; removes itself
+    # at startup unless CLINTRACK_QUERY_PROFILER is on
+    'clintrack.profiling.QueryProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'clintrack.audit.AuditContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -91,6 +95,65 @@ DATABASES = {
 }
 
 
+# Cache
+# Local memory by default so no external service is needed. For several
+# worker processes, use a shared backend such as
+# 'django.core.cache.backends.filebased.FileBasedCache' so invalidations
+# reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'clintrack',
+    }
+}
+
+# Dashboard and report contexts are cached until a participant, SUSAR,
+# study or attendance write invalidates them, or this many seconds pass.
+CLINTRACK_CONTEXT_CACHE_TIMEOUT = 300
+
+# Per-request SQL profiling (see clintrack/profiling.py). Off by default;
+# when on, each response carries X-Query-* headers and a JSON line per
+# request goes to the rotating log summarised by `manage.py query_report`.
+CLINTRACK_QUERY_PROFILER = os.environ.get('CLINTRACK_QUERY_PROFILER') == '1'
+CLINTRACK_QUERY_PROFILER_LOG = BASE_DIR / 'logs' / 'queries.jsonl'
+CLINTRACK_QUERY_PROFILER_MAX_BYTES = 10 * 1024 * 1024
+CLINTRACK_QUERY_PROFILER_BACKUPS = 5
+
+# Lower edges of the report age bins (exact years): <18, 18-30, 31-45, 46-60, >60
+CLINTRACK_AGE_BINS = [18, 31, 46, 61]
+
+# Display values of audit log subjects remembered per process (see clintrack/audit.py)
+CLINTRACK_AUDIT_TARGET_CACHE_SIZE = 10000
+
+# Complete months of audit history kept in audit_logs; older months are
+# moved to audit_logs_archive by `manage.py archive_audit_logs`
+CLINTRACK_AUDIT_LIVE_MONTHS = 12
+
+# Audit entries older than this many days are moved out of the database into
+# compressed segment files by `manage.py archive_audit_segments`
+# (see clintrack/segments.py); the audit views read them back transparently.
+CLINTRACK_AUDIT_SEGMENT_AFTER_DAYS = 90
+CLINTRACK_AUDIT_SEGMENT_DIR = BASE_DIR / 'archive' / 'audit'
+
+# Reports, dashboards and chart APIs aggregate over a memory-mapped columnar
+# snapshot of participants and SUSARs (see clintrack/snapshot.py) instead of
+# the tables. Once older than CLINTRACK_SNAPSHOT_MAX_AGE seconds it is refreshed
+# incrementally by a background thread (the previous copy is served meanwhile),
+# or by `manage.py refresh_snapshot`. Each database gets its own subdirectory.
+CLINTRACK_SNAPSHOT_ENABLED = True
+CLINTRACK_SNAPSHOT_DIR = BASE_DIR / 'archive' / 'snapshot'
+CLINTRACK_SNAPSHOT_MAX_AGE = 60
+
+# Audit and attendance rows are queued and bulk-inserted by a background
+# thread (see clintrack/writer.py); rows that cannot be written are spooled
+# to CLINTRACK_WRITE_SPOOL and replayed on the next start.
+CLINTRACK_WRITE_ASYNC = True
+CLINTRACK_WRITE_BATCH_SIZE = 200
+CLINTRACK_WRITE_FLUSH_INTERVAL = 1.0
+CLINTRACK_WRITE_SPOOL = BASE_DIR / 'logs' / 'write-spool.jsonl'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
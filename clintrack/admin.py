@@ -3,13 +3,16 @@
 # ============================================
 
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.html import format_html
 from django.urls import reverse
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Count, Q
 from .models import User, Study, Participant, SUSAR, StaffAttendance, AuditLog
+from .exports import streaming_export
+from .audit import resolve_targets
+from .metrics import study_stats
 
 # Custom admin site header and title
 admin.site.site_header = format_html(
@@ -86,7 +89,7 @@ def make_inactive(modeladmin, request, queryset):
 
 @admin.action(description='Export selected participants data')
 def export_participants(modeladmin, request, queryset):
-    modeladmin.message_user(request, f"Exporting data for {queryset.count()} participants...", messages.INFO)
+    return streaming_export(queryset, 'participants', 'csv')
 
 @admin.action(description='Mark SUSARs as reported to IRB')
 def mark_reported_to_irb(modeladmin, request, queryset):
@@ -144,6 +147,15 @@ class UserAdmin(ClinTrackAdmin, BaseUserAdmin):
     created_at_formatted.short_description = 'Created'
     created_at_formatted.admin_order_field = 'created_at'
 
+class StudyChangeList(ChangeList):
+    """Loads the participant counts of a page of studies in one query"""
+    
+    def get_results(self, request):
+        super().get_results(request)
+        stats = study_stats([study.pk for study in self.result_list])
+        for study in self.result_list:
+            study.participant_stats = stats[study.pk]
+
 @admin.register(Study)
 class StudyAdmin(ClinTrackAdmin):
     list_display = ['name', 'code', 'participant_count', 'active_status', 'dates']
@@ -166,13 +178,15 @@ class StudyAdmin(ClinTrackAdmin):
     )
     readonly_fields = ['get_participant_stats']
     
+    def get_changelist(self, request, **kwargs):
+        return StudyChangeList
+    
     def participant_count(self, obj):
-        total = obj.participants.count()
-        active = obj.participants.filter(status='active').count()
+        stats = getattr(obj, 'participant_stats', None) or study_stats([obj.pk])[obj.pk]
         return format_html(
             '{} <small class="text-muted">({} active)</small>',
-            total,
-            active
+            stats.total,
+            stats.active
         )
     participant_count.short_description = 'Participants'
     
@@ -198,7 +212,7 @@ class StudyAdmin(ClinTrackAdmin):
     dates.short_description = 'Timeline'
     
     def get_participant_stats(self, obj):
-        status_counts = obj.participants.values('status').annotate(count=Count('id'))
+        status_counts = study_stats([obj.pk])[obj.pk].status_breakdown
         stats_html = '<ul class="list-unstyled">'
         for stat in status_counts:
             stats_html += f'<li><strong>{stat["status"].title()}:</strong> {stat["count"]}</li>'
@@ -211,6 +225,7 @@ class ParticipantAdmin(ClinTrackAdmin):
     list_display = ['participant_id', 'full_name', 'study_link', 'status_pill', 'location', 'contact_info']
     list_filter = [ActiveStatusFilter, 'study', 'gender', 'county']
     search_fields = ['participant_id', 'first_name', 'last_name', 'primary_phone', 'email']
+    list_select_related = ['study']
     readonly_fields = ['created_at', 'updated_at', 'created_by', 'get_related_susars']
     actions = [export_participants]
     fieldsets = (
@@ -254,7 +269,7 @@ class ParticipantAdmin(ClinTrackAdmin):
     full_name.admin_order_field = 'last_name'
     
     def study_link(self, obj):
-        url = reverse('admin:clintrack_study_change', args=[obj.study.id])
+        url = reverse('admin:clintrack_study_change', args=[obj.study_id])
         return format_html(
             '<a href="{}">{}</a>',
             url,
@@ -316,6 +331,7 @@ class SUSARAdmin(ClinTrackAdmin):
     list_display = ['susar_id', 'participant_link', 'severity_badge', 'outcome_badge', 'follow_up_status', 'dates']
     list_filter = [FollowUpRequiredFilter, SeverityFilter, 'outcome', 'reported_to_irb', 'reported_to_sponsor', 'onset_date']
     search_fields = ['susar_id', 'participant__participant_id', 'event_description']
+    list_select_related = ['participant']
     readonly_fields = ['created_at', 'updated_at', 'get_timeline']
     actions = [mark_reported_to_irb]
     fieldsets = (
@@ -350,7 +366,7 @@ class SUSARAdmin(ClinTrackAdmin):
     )
     
     def participant_link(self, obj):
-        url = reverse('admin:clintrack_participant_change', args=[obj.participant.id])
+        url = reverse('admin:clintrack_participant_change', args=[obj.participant_id])
         return format_html(
             '<a href="{}">{}</a><br><small class="text-muted">{}</small>',
             url,
@@ -457,6 +473,7 @@ class StaffAttendanceAdmin(ClinTrackAdmin):
     list_display = ['staff', 'login_time_formatted', 'logout_time_formatted', 'duration', 'location_badge']
     list_filter = ['login_time', 'staff__role']
     search_fields = ['staff__username', 'staff__email', 'location', 'ip_address']
+    list_select_related = ['staff']
     readonly_fields = ['login_time', 'ip_address']
     
     def login_time_formatted(self, obj):
@@ -488,11 +505,20 @@ class StaffAttendanceAdmin(ClinTrackAdmin):
         return format_html('<span class="text-muted">Unknown</span>')
     location_badge.short_description = 'Location'
 
+class AuditLogChangeList(ChangeList):
+    """Resolves the objects behind a page of audit logs in one batch"""
+    
+    def get_results(self, request):
+        super().get_results(request)
+        resolve_targets(self.result_list)
+
 @admin.register(AuditLog)
 class AuditLogAdmin(ClinTrackAdmin):
     list_display = ['user', 'action_badge', 'model_name', 'object_link', 'timestamp_formatted']
     list_filter = ['action', 'model_name', 'timestamp']
     search_fields = ['user__username', 'object_id', 'changes']
+    list_select_related = ['user']
+    list_per_page = 100
     readonly_fields = ['user', 'action', 'model_name', 'object_id', 'changes', 'timestamp', 'ip_address']
     date_hierarchy = 'timestamp'
     
@@ -520,34 +546,15 @@ class AuditLogAdmin(ClinTrackAdmin):
     action_badge.short_description = 'Action'
     action_badge.admin_order_field = 'action'
     
+    def get_changelist(self, request, **kwargs):
+        return AuditLogChangeList
+    
     def object_link(self, obj):
-        # Try to get the admin URL for the object
-        try:
-            model_class = None
-            if obj.model_name.lower() == 'participant':
-                model_class = Participant
-                field = 'participant_id'
-            elif obj.model_name.lower() == 'study':
-                model_class = Study
-                field = 'code'
-            elif obj.model_name.lower() == 'susar':
-                model_class = SUSAR
-                field = 'susar_id'
-            elif obj.model_name.lower() == 'user':
-                model_class = User
-                field = 'username'
-            
-            if model_class:
-                try:
-                    instance = model_class.objects.get(id=obj.object_id)
-                    url = reverse(f'admin:clintrack_{obj.model_name.lower()}_change', args=[obj.object_id])
-                    display_value = getattr(instance, field, obj.object_id)
-                    return format_html('<a href="{}">{}</a>', url, display_value)
-                except (model_class.DoesNotExist, ValueError):
-                    pass
-        except:
-            pass
-        
+        # Resolved for the whole page by AuditLogChangeList
+        display_value = getattr(obj, 'target_display', None)
+        if display_value is not None:
+            url = reverse(f'admin:clintrack_{obj.model_name.lower()}_change', args=[obj.object_id])
+            return format_html('<a href="{}">{}</a>', url, display_value)
         return format_html('<code>{}</code>', obj.object_id)
     object_link.short_description = 'Object'
     
@@ -0,0 +1,265 @@
+# ============================================
+# analytics.py - ClinTrack Report Analytics
+# ============================================
+
+"""
+In-memory analytics backend for the reports dashboard.
+
+``load_frames`` takes the participant and SUSAR columns from the
+memory-mapped snapshot (see ``snapshot.py``) and reads studies and the
+selected period's attendance with one query each. Without a snapshot,
+participants and SUSARs are read the same way. Rows go straight from the
+database cursor into pandas columns (categoricals for choice fields,
+``datetime64`` for dates) without building model instances.
+
+``report_stats`` computes every chart, cross-tab and summary figure of
+``reports_index`` from those frames with vectorised pandas/NumPy
+operations. Audit activity is the one exception: that history is far too
+large to pull, so it is summarised with one grouped query per table plus
+the matching archive segments.
+"""
+
+from dataclasses import dataclass
+import json
+
+import numpy as np
+import pandas as pd
+from django.db.models import BooleanField, Count, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+from . import segments, snapshot
+from .cohorts import age_histogram, lost_to_follow_up
+from .metrics import study_stats
+from .models import Study, Participant, SUSAR, StaffAttendance, AuditLog, AuditLogArchive
+from .snapshot import column_frame
+
+
+# Longer ranges are plotted in weekly buckets
+REPORT_MAX_DAILY_POINTS = 366
+
+RESOLVED_OUTCOMES = ['recovered', 'recovered_sequelae']
+
+
+# ============================================
+# Loading
+# ============================================
+
+@dataclass
+class ReportFrames:
+    participants: pd.DataFrame
+    susars: pd.DataFrame
+    attendance: pd.DataFrame
+    studies: pd.DataFrame
+
+
+def load_frames(start, end):
+    """
+    Columns for a report over ``start <= t < end`` (aware datetimes);
+    participants and SUSARs come from the snapshot when it is enabled
+    """
+    current = snapshot.current()
+    if current is not None:
+        participants, susars = current.participants, current.susars
+    else:
+        participants = column_frame(
+            Participant.objects.all(),
+            'study_id', 'status', 'gender', 'date_of_birth', 'enrollment_date', 'created_at',
+            dates=['date_of_birth', 'enrollment_date'], datetimes=['created_at'],
+            categories=['status', 'gender'],
+        )
+        susars = column_frame(
+            SUSAR.objects.annotate(
+                study=F('participant__study_id'),
+                has_notes=ExpressionWrapper(Q(follow_up_notes__gt=''), output_field=BooleanField()),
+            ),
+            'study', 'severity', 'outcome', 'follow_up_required', 'has_notes', 'created_at',
+            datetimes=['created_at'], booleans=['follow_up_required', 'has_notes'],
+            categories=['severity', 'outcome'],
+        )
+    attendance = column_frame(
+        StaffAttendance.objects.filter(login_time__gte=start, login_time__lt=end),
+        'staff__username', 'login_time', 'logout_time',
+        datetimes=['login_time', 'logout_time'],
+    )
+    studies = column_frame(
+        Study.objects.all(),
+        'id', 'name', 'code', 'is_active', 'start_date', 'end_date',
+        dates=['start_date', 'end_date'], booleans=['is_active'],
+    ).set_index('id')
+    return ReportFrames(participants, susars, attendance, studies)
+
+
+# ============================================
+# Computations
+# ============================================
+
+def distribution(column, name):
+    """Non-zero value counts, largest first, as values() rows"""
+    counts = column.value_counts()
+    return [{name: value, 'count': int(count)} for value, count in counts[counts > 0].items()]
+
+
+def crosstab(frame, *dimensions):
+    """Non-zero counts for every combination of ``dimensions`` as long-format rows"""
+    counts = frame.groupby(list(dimensions), observed=True).size()
+    return [
+        {**dict(zip(dimensions, key if isinstance(key, tuple) else (key,))), 'count': int(count)}
+        for key, count in counts[counts > 0].items()
+    ]
+
+
+def percentage(part, whole):
+    return round(part / whole * 100, 1) if whole > 0 else 0.0
+
+
+def daily_series(days, start, end):
+    """Counts of ``days`` per day from ``start`` to ``end`` inclusive, weekly for long ranges"""
+    index = pd.date_range(start, end, freq='D')
+    counts = days.value_counts().reindex(index, fill_value=0).to_numpy()
+    step = 1 if len(index) <= REPORT_MAX_DAILY_POINTS else 7
+    if step > 1:
+        counts = np.add.reduceat(counts, np.arange(0, len(counts), step))
+        index = index[::step]
+    return [{'date': day.strftime('%Y-%m-%d'), 'count': int(count)} for day, count in zip(index, counts)]
+
+
+def monthly_series(moments):
+    counts = moments.dt.to_period('M').value_counts().sort_index()
+    return [{'month': str(month.start_time.date()), 'count': int(count)} for month, count in counts.items()]
+
+
+def audit_summary(start, end):
+    """Audit entries per action over ``start <= t < end``, live and archived, largest first"""
+    counts = segments.archived_action_counts(start, end)
+    for model in (AuditLog, AuditLogArchive):
+        rows = model.objects.filter(timestamp__gte=start, timestamp__lt=end).values('action').annotate(
+            count=Count('id')
+        ).order_by()
+        for row in rows:
+            counts[row['action']] = counts.get(row['action'], 0) + row['count']
+    return [
+        {'action': action, 'count': count}
+        for action, count in sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    ]
+
+
+def report_stats(start_date, end_date, study_id=None, frames=None, today=None):
+    """Chart data and summary statistics for ``reports_index`` (dates as ``YYYY-MM-DD``)"""
+    today = today or timezone.localdate()
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    if frames is None:
+        frames = load_frames(
+            timezone.make_aware(start.to_pydatetime()), timezone.make_aware(end.to_pydatetime())
+        )
+    participants, susars, studies = frames.participants, frames.susars, frames.studies
+
+    in_range = participants[(participants.created_at >= start) & (participants.created_at < end)]
+    susars_in_range = susars[(susars.created_at >= start) & (susars.created_at < end)]
+    if study_id:
+        in_range = in_range[in_range.study_id == int(study_id)]
+        susars_in_range = susars_in_range[susars_in_range.study == int(study_id)]
+
+    # Enrollment over the period, and by study x status x month
+    enrolled = participants[
+        (participants.enrollment_date >= start) & (participants.enrollment_date < end)
+    ]
+    by_study = enrolled if not study_id else enrolled[enrolled.study_id == int(study_id)]
+    enrollment_crosstab = crosstab(
+        by_study.assign(
+            study=by_study.study_id.map(studies.code),
+            month=by_study.enrollment_date.dt.to_period('M').dt.start_time.dt.strftime('%Y-%m-%d'),
+        ),
+        'study', 'status', 'month',
+    )
+
+    # Per-study status histogram
+    stats = study_stats(participants=participants)
+    study_rows = studies.assign(
+        total=[stats[pk].total for pk in studies.index],
+        active=[stats[pk].active for pk in studies.index],
+        completed=[stats[pk].completed for pk in studies.index],
+    ).sort_values('total', ascending=False, kind='stable')
+    study_distribution = [
+        {'name': row.name, 'code': row.code, 'total': int(row.total),
+         'active': int(row.active), 'completed': int(row.completed)}
+        for row in study_rows.itertuples()
+    ]
+    study_completion = [
+        {'study': row.name, 'code': row.code, 'total': int(row.total), 'completed': int(row.completed),
+         'completion_rate': stats[row.Index].completion_rate}
+        for row in study_rows.sort_values('name').itertuples() if row.is_active and row.total > 0
+    ]
+
+    ages = age_histogram(participants, as_of=today)
+    lost_analysis = lost_to_follow_up(as_of=today)
+
+    # Staff logins in the period
+    attendance = frames.attendance.assign(
+        duration=frames.attendance.logout_time - frames.attendance.login_time
+    )
+    logins = attendance.groupby('staff__username').agg(
+        login_count=('login_time', 'size'), avg_duration=('duration', 'mean')
+    ).sort_values('login_count', ascending=False, kind='stable').head(10)
+    staff_activity = [
+        {'staff__username': row.Index, 'login_count': int(row.login_count),
+         'avg_duration': row.avg_duration.to_pytimedelta() if pd.notna(row.avg_duration) else None}
+        for row in logins.itertuples()
+    ]
+
+    # Summary figures
+    month = pd.Period(today, freq='M')
+    enrolled_months = in_range.enrollment_date.dt.to_period('M')
+    current, previous = int((enrolled_months == month).sum()), int((enrolled_months == month - 1).sum())
+    follow_up = susars_in_range[susars_in_range.follow_up_required]
+    dated = studies.dropna(subset=['start_date', 'end_date'])
+
+
+    return {
+        # Chart data
+        'daily_enrollment': json.dumps(daily_series(
+            enrolled.enrollment_date, start, end - pd.Timedelta(days=1)
+        )),
+        'monthly_enrollment': json.dumps(monthly_series(enrolled.enrollment_date)),
+        'enrollment_crosstab': json.dumps(enrollment_crosstab),
+        'status_distribution': json.dumps(distribution(participants.status, 'status')),
+        'study_distribution': json.dumps(study_distribution),
+        'gender_distribution': json.dumps(distribution(participants.gender, 'gender')),
+        'age_distribution': json.dumps(ages.rows()),
+        'susar_severity_distribution': json.dumps(distribution(susars.severity, 'severity')),
+        'susar_outcome_distribution': json.dumps(distribution(susars.outcome, 'outcome')),
+        'monthly_susar_trend': json.dumps(monthly_series(
+            susars[(susars.created_at >= start) & (susars.created_at < end)].created_at
+        )),
+        'staff_attendance': json.dumps([
+            {
+                'staff': item['staff__username'],
+                'login_count': item['login_count'],
+                'avg_duration': item['avg_duration'].total_seconds() / 3600 if item['avg_duration'] else 0
+            } for item in staff_activity
+        ]),
+        'study_completion': json.dumps(study_completion),
+        'lost_analysis': json.dumps(lost_analysis),
+        'audit_summary': json.dumps(audit_summary(
+            timezone.make_aware(start.to_pydatetime()), timezone.make_aware(end.to_pydatetime())
+        )),
+
+        # Summary statistics
+        'total_participants': len(in_range),
+        'total_susars': len(susars_in_range),
+        'avg_participants_per_study': round(len(in_range) / max(len(studies), 1), 1),
+        'participant_growth_rate': percentage(current - previous, previous),
+        'susar_resolution_rate': percentage(
+            int(susars_in_range.outcome.isin(RESOLVED_OUTCOMES).sum()), len(susars_in_range)
+        ),
+        'avg_study_duration': round(float((dated.end_date - dated.start_date).dt.days.mean()), 1) if len(dated) else 0.0,
+        'follow_up_compliance': percentage(int(follow_up.has_notes.sum()), len(follow_up)),
+
+        # Data for tables
+        'top_studies': [
+            {'name': row['name'], 'code': row['code'], 'participant_count': row['total'],
+             'active_count': row['active'], 'completed_count': row['completed']}
+            for row in study_distribution[:5]
+        ],
+        'staff_activity': staff_activity,
+    }
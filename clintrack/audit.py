@@ -0,0 +1,348 @@
+# ============================================
+# audit.py - ClinTrack Audit Trail
+# ============================================
+
+"""
+Automatic capture and batched reading of the audit trail.
+
+Capture: participants, studies and SUSARs snapshot their tracked fields
+when loaded (``post_init``). Saving one compares it with the snapshot and
+queues an ``AuditLog`` holding only the fields that changed; ``update()``
+on their querysets reads the affected rows before and after and writes all
+of their entries with a single ``bulk_create``. ``AuditContextMiddleware``
+keeps the requesting user and IP in a thread-local so entries are
+attributed without views passing them around.
+
+Reading: ``AuditLog`` points at its subject with a ``model_name`` / ``object_id``
+string pair rather than a foreign key. ``resolve_targets`` turns a page of
+logs into display values (a participant ID, study code, SUSAR ID or
+username) with one ``in_bulk`` query per model, and remembers them in a
+bounded per-process LRU keyed by ``(model, id)`` so paging back and forth
+through history stops touching those tables at all.
+
+The model signals drop an entry when its object is saved or deleted.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import User, Study, Participant, SUSAR, AuditLog, AuditLogArchive
+from .writer import defer_write
+
+
+# AuditLog.model_name (lower-cased) -> model and the field displayed for it
+AUDIT_TARGETS = {
+    'participant': (Participant, 'participant_id'),
+    'study': (Study, 'code'),
+    'susar': (SUSAR, 'susar_id'),
+    'user': (User, 'username'),
+}
+
+# Site pages linked from the audit log; users have no detail page
+TARGET_URL_NAMES = {
+    'participant': 'participant_detail',
+    'study': 'study_detail',
+    'susar': 'susars_detail',
+}
+
+_MISSING = object()
+
+
+class TargetCache:
+    """Thread-safe LRU of ``(model, id) -> display value`` (``None`` once deleted)"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+target_cache = TargetCache(getattr(settings, 'CLINTRACK_AUDIT_TARGET_CACHE_SIZE', 10000))
+
+
+def target_key(model_name, object_id):
+    """``(model, pk)`` cache key for a log's subject, or ``None`` if it can't be resolved"""
+    name = model_name.lower()
+    if name not in AUDIT_TARGETS or not str(object_id).isdigit():
+        return None
+    return name, int(object_id)
+
+
+def forget_target(instance):
+    """Drop a saved or deleted object's cached display value"""
+    target_cache.discard((instance._meta.model_name, instance.pk))
+
+
+def resolve_targets(logs):
+    """
+    Set ``target_display`` on every log: the subject's display value, or
+    ``None`` when the model is unknown or the object no longer exists.
+    """
+    logs = list(logs)
+    resolved = {}
+    missing = {}
+    for log in logs:
+        key = target_key(log.model_name, log.object_id)
+        if key is None or key in resolved:
+            continue
+        value = target_cache.get(key)
+        if value is _MISSING:
+            missing.setdefault(key[0], set()).add(key[1])
+        else:
+            resolved[key] = value
+
+    for name, pks in missing.items():
+        model_class, field = AUDIT_TARGETS[name]
+        found = model_class.objects.only(field).in_bulk(pks)
+        for pk in pks:
+            resolved[name, pk] = getattr(found[pk], field) if pk in found else None
+            target_cache.set((name, pk), resolved[name, pk])
+
+    for log in logs:
+        key = target_key(log.model_name, log.object_id)
+        log.target_display = resolved.get(key)
+        log.target_url_name = TARGET_URL_NAMES.get(key[0]) if key else None
+    return logs
+
+
+# ============================================
+# Change capture
+# ============================================
+
+# Models whose saves, deletes and queryset updates are audited
+AUDITED_MODELS = [Participant, Study, SUSAR]
+
+# Rows re-read per query when auditing a queryset update
+UPDATE_BATCH_SIZE = 500
+
+_context = threading.local()
+
+
+class AuditContextMiddleware:
+    """Makes the requesting user and IP available to the capture layer"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        _context.user = request.user if request.user.is_authenticated else None
+        _context.ip = forwarded.split(',')[0].strip() if forwarded else request.META.get('REMOTE_ADDR')
+        try:
+            return self.get_response(request)
+        finally:
+            _context.user = _context.ip = None
+
+
+@contextmanager
+def suspend_capture():
+    """Skip audit capture in this thread, e.g. while seeding or rebuilding data"""
+    _context.suspended = getattr(_context, 'suspended', 0) + 1
+    try:
+        yield
+    finally:
+        _context.suspended -= 1
+
+
+def capturing():
+    return not getattr(_context, 'suspended', 0)
+
+
+@lru_cache(maxsize=None)
+def tracked_fields(model):
+    """Concrete fields whose changes are recorded; automatic timestamps are left out"""
+    return tuple(
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+        and not getattr(field, 'auto_now', False)
+        and not getattr(field, 'auto_now_add', False)
+    )
+
+
+def _loggable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _entry(model, pk, action, changes):
+    return AuditLog(
+        user=getattr(_context, 'user', None),
+        action=action,
+        model_name=model.__name__,
+        object_id=str(pk),
+        changes=changes,
+        ip_address=getattr(_context, 'ip', None),
+    )
+
+
+def snapshot(instance, fields=None):
+    """Remember the loaded value of every tracked field that was fetched, or only of ``fields``"""
+    loaded = instance.__dict__
+    values = {
+        field.attname: loaded[field.attname]
+        for field in tracked_fields(type(instance))
+        if field.attname in loaded and (fields is None or field.name in fields or field.attname in fields)
+    }
+    if fields is not None:
+        values = {**getattr(instance, '_audit_snapshot', {}), **values}
+    instance._audit_snapshot = values
+
+
+def record_save(instance, created):
+    """Queue an entry with the fields changed since the snapshot"""
+    if not capturing():
+        snapshot(instance)
+        return
+    model = type(instance)
+    if created:
+        action = 'create'
+        changes = {
+            field.attname: _loggable(field.value_from_object(instance))
+            for field in tracked_fields(model)
+        }
+    else:
+        action = 'update'
+        before = getattr(instance, '_audit_snapshot', {})
+        changes = {}
+        for field in tracked_fields(model):
+            if field.attname not in before:
+                continue
+            old, new = before[field.attname], field.value_from_object(instance)
+            if old != new:
+                changes[field.attname] = {'from': _loggable(old), 'to': _loggable(new)}
+        if not changes:
+            snapshot(instance)
+            return
+
+    entry = _entry(model, instance.pk, action, changes)
+    transaction.on_commit(lambda: defer_write(entry), using=instance._state.db)
+    snapshot(instance)
+
+
+def record_delete(instance):
+    if not capturing():
+        return
+    entry = _entry(type(instance), instance.pk, 'delete', None)
+    transaction.on_commit(lambda: defer_write(entry), using=instance._state.db)
+
+
+def audited_update(queryset, values, update):
+    """
+    Run ``update(**values)`` for ``queryset`` and record one entry per row
+    whose tracked fields changed, inserted together in one ``bulk_create``.
+    ``auto_now`` fields are stamped as ``save()`` would, so ``updated_at``
+    still tells incremental readers such as the snapshot which rows changed.
+    """
+    model = queryset.model
+    now = timezone.now()
+    stamped = {field.name: now for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)}
+    values = {**stamped, **values}
+    tracked = {field.name: field for field in tracked_fields(model)}
+    tracked.update({field.attname: field for field in tracked_fields(model)})
+    fields = list({tracked[name].attname: tracked[name] for name in values if name in tracked}.values())
+    if not capturing() or not fields:
+        return update(**values)
+
+    names = [field.attname for field in fields]
+    with transaction.atomic(using=queryset.db):
+        before = {row[0]: row[1:] for row in queryset.values_list('pk', *names)}
+        count = update(**values)
+
+        entries = []
+        pks = list(before)
+        for start in range(0, len(pks), UPDATE_BATCH_SIZE):
+            rows = model._base_manager.using(queryset.db).filter(
+                pk__in=pks[start:start + UPDATE_BATCH_SIZE]
+            ).values_list('pk', *names)
+            for pk, *after in rows:
+                changes = {
+                    name: {'from': _loggable(old), 'to': _loggable(new)}
+                    for name, old, new in zip(names, before[pk], after) if old != new
+                }
+                if changes:
+                    entries.append(_entry(model, pk, 'update', changes))
+        AuditLog.objects.using(queryset.db).bulk_create(entries, batch_size=UPDATE_BATCH_SIZE)
+    return count
+
+
+# ============================================
+# Archival
+# ============================================
+
+ARCHIVE_COLUMNS = ['id', 'user_id', 'action', 'model_name', 'object_id', 'changes', 'ip_address', 'timestamp']
+
+
+def month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(moment):
+    return month_start(moment.replace(day=28) + timedelta(days=4))
+
+
+def archivable_months(cutoff):
+    """(start, end) of every month in the live table that ends on or before ``cutoff``"""
+    oldest = AuditLog.objects.aggregate(oldest=Min('timestamp'))['oldest']
+    if oldest is None:
+        return []
+    months = []
+    start = month_start(timezone.localtime(oldest))
+    while next_month(start) <= cutoff:
+        months.append((start, next_month(start)))
+        start = next_month(start)
+    return months
+
+
+def archive_range(start, end):
+    """
+    Move audit entries with ``start <= timestamp < end`` to the archive
+    table with one INSERT ... SELECT and one DELETE in a transaction.
+    Returns the number of entries moved.
+    """
+    using = router.db_for_write(AuditLog)
+    live = AuditLog.objects.using(using).filter(timestamp__gte=start, timestamp__lt=end)
+    select_sql, params = live.order_by().values_list(*ARCHIVE_COLUMNS).query.sql_with_params()
+    columns = ', '.join(connections[using].ops.quote_name(column) for column in ARCHIVE_COLUMNS)
+
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {AuditLogArchive._meta.db_table} ({columns}) {select_sql}', params
+            )
+            moved = cursor.rowcount
+        live.delete()
+    return moved
@@ -0,0 +1,80 @@
+# ============================================
+# cache.py - ClinTrack Context Cache
+# ============================================
+
+"""
+Versioned cache for computed dashboard and report contexts.
+
+Every key embeds a global version number. Bumping the version (done by the
+model signals whenever participants, SUSARs, studies or attendance change)
+orphans every cached context at once; orphaned entries simply age out.
+The version starts from the clock in nanoseconds, so if the version key is
+evicted it restarts above every version used before and cannot revive an
+orphaned entry.
+Entries also expire after ``CLINTRACK_CONTEXT_CACHE_TIMEOUT`` seconds, which
+bounds staleness for writes that bypass signals and for per-process caches.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+VERSION_KEY = 'clintrack:context-version'
+
+
+def _cache():
+    return caches[getattr(settings, 'CLINTRACK_CONTEXT_CACHE', 'default')]
+
+
+def _timeout():
+    return getattr(settings, 'CLINTRACK_CONTEXT_CACHE_TIMEOUT', 300)
+
+
+def context_version():
+    """Current context version, initialised on first use"""
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        seed = time.time_ns()
+        cache.add(VERSION_KEY, seed, timeout=None)
+        version = cache.get(VERSION_KEY, seed)
+    return version
+
+
+def invalidate_contexts():
+    """Invalidate every cached context by bumping the version"""
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def context_cache_key(name, role=None, study=None, start=None, end=None, user=None):
+    """Cache key for a context, scoped by role, study filter, date range and user"""
+    parts = [name, role or '', study or '', start or '', end or '', getattr(user, 'pk', user) or '']
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'clintrack:ctx:{context_version()}:{name}:{digest}'
+
+
+def cached_context(name, builder, role=None, study=None, start=None, end=None, user=None):
+    """
+    Return the cached context for the given scope, building it on a miss.
+
+    ``builder`` is called with no arguments and must return a picklable dict
+    (evaluate querysets into lists). A fresh copy is returned so callers can
+    add request-specific entries without touching the cached value.
+    """
+    if _timeout() == 0:
+        return builder()
+
+    cache = _cache()
+    key = context_cache_key(name, role=role, study=study, start=start, end=end, user=user)
+    context = cache.get(key)
+    if context is None:
+        context = builder()
+        cache.set(key, context, timeout=_timeout())
+    return dict(context)
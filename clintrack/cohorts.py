@@ -0,0 +1,172 @@
+# ============================================
+# cohorts.py - ClinTrack Cohort Analytics
+# ============================================
+
+"""
+Per-group statistics for participant cohorts.
+
+``elapsed_stats`` counts a cohort per group and averages the time since a
+date field with database-side date arithmetic, in one grouped query, so
+only one small row per group reaches Python however many participants
+the cohort holds; ``lost_to_follow_up`` builds on it.
+
+``age_histogram`` bins exact ages of the participant frame the reports
+load (see ``analytics.load_frames``) with NumPy, overall and per study and
+gender at once; bin edges come from ``CLINTRACK_AGE_BINS``.
+"""
+
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg, Count, DateField, DurationField, ExpressionWrapper, F, Max, Min, Value
+from django.utils import timezone
+
+from .models import Participant
+
+
+DEFAULT_AGE_BINS = (18, 31, 46, 61)
+
+
+def elapsed(field, as_of):
+    """Database expression for the time from ``field`` until the date ``as_of``"""
+    return ExpressionWrapper(
+        Value(as_of, output_field=DateField()) - F(field),
+        output_field=DurationField(),
+    )
+
+
+def _days(duration):
+    return round(duration.total_seconds() / 86400, 1) if duration is not None else None
+
+
+def elapsed_stats(queryset, date_field, group_by, as_of=None):
+    """
+    One row per ``group_by`` combination with the cohort ``count`` and the
+    average, shortest and longest days from ``date_field`` to ``as_of``
+    (today by default) as ``avg_days`` / ``min_days`` / ``max_days``.
+
+    Rows without ``date_field`` are counted but left out of the day
+    figures, which are ``None`` when no row has the date. Largest groups
+    come first.
+    """
+    as_of = as_of or timezone.localdate()
+    since = elapsed(date_field, as_of)
+    rows = queryset.order_by().values(*group_by).annotate(
+        count=Count('id'),
+        avg_elapsed=Avg(since),
+        min_elapsed=Min(since),
+        max_elapsed=Max(since),
+    ).order_by('-count', *group_by)
+
+    return [
+        {
+            **{name: row[name] for name in group_by},
+            'count': row['count'],
+            'avg_days': _days(row['avg_elapsed']),
+            'min_days': _days(row['min_elapsed']),
+            'max_days': _days(row['max_elapsed']),
+        }
+        for row in rows
+    ]
+
+
+def lost_to_follow_up(queryset=None, as_of=None):
+    """Lost participants per study with the average days since their enrollment"""
+    queryset = Participant.objects.all() if queryset is None else queryset
+    return [
+        {'study__name': row['study__name'], 'count': row['count'], 'avg_enrollment_days': row['avg_days'] or 0}
+        for row in elapsed_stats(queryset.filter(status='lost'), 'enrollment_date', ['study__name'], as_of)
+    ]
+
+
+# ============================================
+# Age distribution
+# ============================================
+
+@dataclass
+class AgeHistogram:
+    """Participant counts per age bin, overall and per breakdown value"""
+    edges: tuple
+    counts: list
+    by_study: dict = field(default_factory=dict)
+    by_gender: dict = field(default_factory=dict)
+    unknown: int = 0
+
+    @property
+    def labels(self):
+        """``<18``, ``18-30``, ... ``>60`` for edges (18, 31, ..., 61)"""
+        if not self.edges:
+            return ['All']
+        labels = [f'<{self.edges[0]}']
+        labels += [f'{low}-{high - 1}' for low, high in zip(self.edges, self.edges[1:])]
+        labels.append(f'>{self.edges[-1] - 1}')
+        return labels
+
+    def rows(self, counts=None):
+        """``[{'label', 'count'}, ...]`` for the chart, overall by default"""
+        counts = self.counts if counts is None else counts
+        return [{'label': label, 'count': count} for label, count in zip(self.labels, counts)]
+
+
+def _date_keys(dates):
+    """``datetime64[D]`` values as ``YYYYMMDD`` integers"""
+    years = dates.astype('datetime64[Y]').astype(np.int64) + 1970
+    months = dates.astype('datetime64[M]')
+    days = (dates - months).astype(np.int64) + 1
+    return years * 10000 + (months.astype(np.int64) % 12 + 1) * 100 + days
+
+
+def _binned(codes, bins, size, labels=None):
+    """
+    Counts per (code, bin) as ``{code: [count per bin]}``; with ``labels``
+    the codes are positions in it and the result is keyed by label instead
+    """
+    if labels is None:
+        values, inverse = np.unique(codes, return_inverse=True)
+    else:
+        values, inverse = np.asarray(labels), codes
+    table = np.bincount(inverse * size + bins, minlength=len(values) * size).reshape(len(values), size)
+    return dict(zip(values.tolist(), table.tolist()))
+
+
+def bin_ages(dates, studies, genders, edges, as_of, unknown=0, gender_labels=None):
+    """
+    ``AgeHistogram`` of ``datetime64[D]`` birth dates with matching study and
+    gender arrays; ``gender_labels`` when ``genders`` holds integer codes
+    """
+    edges = tuple(edges)
+    size = len(edges) + 1
+    if not len(dates):
+        return AgeHistogram(edges, [0] * size, unknown=unknown)
+
+    today = as_of.year * 10000 + as_of.month * 100 + as_of.day
+    ages = (today - _date_keys(dates)) // 10000
+    bins = np.searchsorted(np.array(edges), ages, side='right')
+
+    return AgeHistogram(
+        edges=edges,
+        counts=np.bincount(bins, minlength=size).tolist(),
+        by_study=_binned(studies, bins, size),
+        by_gender=_binned(genders, bins, size, gender_labels),
+        unknown=unknown,
+    )
+
+
+def age_edges(edges=None):
+    return tuple(edges if edges is not None else getattr(settings, 'CLINTRACK_AGE_BINS', DEFAULT_AGE_BINS))
+
+
+def age_histogram(participants, edges=None, as_of=None):
+    """
+    Age distribution of a participant frame with exact ages on ``as_of``
+    (today) binned at ``edges``, ascending ages where each bin starts.
+    Participants without a date of birth are counted in ``unknown`` only.
+    """
+    born = participants[participants.date_of_birth.notna()]
+    return bin_ages(
+        born.date_of_birth.to_numpy().astype('datetime64[D]'),
+        born.study_id.to_numpy(), born.gender.cat.codes.to_numpy(),
+        age_edges(edges), as_of or timezone.localdate(), unknown=len(participants) - len(born),
+        gender_labels=born.gender.cat.categories.tolist(),
+    )
@@ -0,0 +1,210 @@
+# ============================================
+# exports.py - ClinTrack Streaming Exports
+# ============================================
+
+"""
+Streaming CSV and JSON Lines exports of participants, SUSARs, attendance
+and audit logs.
+
+Rows are read with ``values_list()`` in ``iterator(chunk_size=...)``
+batches and written to a ``StreamingHttpResponse`` one line at a time, so
+no model instances are built and memory use stays flat however many rows
+are exported. Audit exports also take the archive tiers as ``sources`` and
+walk them in keyset pages of ``EXPORT_CHUNK_SIZE`` rows, oldest tiers last.
+"""
+
+import csv
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import User, Participant, SUSAR, StaffAttendance, AuditLog
+from .pagination import TieredKeysetPaginator
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+@dataclass(frozen=True)
+class ExportColumn:
+    header: str
+    field: str
+    choices: dict = field(default_factory=dict)
+
+    def format(self, value):
+        if value is None:
+            return ''
+        if self.choices:
+            return self.choices.get(value, value)
+        if isinstance(value, datetime):
+            return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S')
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, default=str)
+        if isinstance(value, (bool, int, float, str)):
+            return value
+        return str(value)
+
+
+@dataclass(frozen=True)
+class ExportDataset:
+    name: str
+    model: type
+    columns: tuple
+    ordering: tuple
+
+    def select(self, *headers):
+        """The same dataset restricted to the named columns"""
+        return ExportDataset(
+            self.name, self.model,
+            tuple(column for column in self.columns if column.header in headers),
+            self.ordering
+        )
+
+
+DATASETS = {
+    'participants': ExportDataset('participants', Participant, (
+        ExportColumn('Participant ID', 'participant_id'),
+        ExportColumn('Study', 'study__code'),
+        ExportColumn('First Name', 'first_name'),
+        ExportColumn('Last Name', 'last_name'),
+        ExportColumn('Date of Birth', 'date_of_birth'),
+        ExportColumn('Gender', 'gender', dict(Participant.GENDER_CHOICES)),
+        ExportColumn('Primary Phone', 'primary_phone'),
+        ExportColumn('Secondary Phone', 'secondary_phone'),
+        ExportColumn('Email', 'email'),
+        ExportColumn('Location', 'location'),
+        ExportColumn('Sub-location', 'sub_location'),
+        ExportColumn('County', 'county'),
+        ExportColumn('Status', 'status', dict(Participant.STATUS_CHOICES)),
+        ExportColumn('Enrollment Date', 'enrollment_date'),
+        ExportColumn('Created By', 'created_by__username'),
+        ExportColumn('Created At', 'created_at'),
+    ), ('-created_at', '-id')),
+
+    'susars': ExportDataset('susars', SUSAR, (
+        ExportColumn('SUSAR ID', 'susar_id'),
+        ExportColumn('Participant ID', 'participant__participant_id'),
+        ExportColumn('Study', 'participant__study__code'),
+        ExportColumn('Onset Date', 'onset_date'),
+        ExportColumn('Detection Date', 'detection_date'),
+        ExportColumn('Severity', 'severity', dict(SUSAR.SEVERITY_CHOICES)),
+        ExportColumn('Outcome', 'outcome', dict(SUSAR.OUTCOME_CHOICES)),
+        ExportColumn('Related to Study', 'is_related_to_study'),
+        ExportColumn('Hospitalization Required', 'hospitalization_required'),
+        ExportColumn('Reported to IRB', 'reported_to_irb'),
+        ExportColumn('IRB Report Date', 'irb_report_date'),
+        ExportColumn('Reported to Sponsor', 'reported_to_sponsor'),
+        ExportColumn('Sponsor Report Date', 'sponsor_report_date'),
+        ExportColumn('Follow-up Required', 'follow_up_required'),
+        ExportColumn('Reported By', 'reported_by__username'),
+    ), ('-onset_date', '-id')),
+
+    'attendance': ExportDataset('attendance', StaffAttendance, (
+        ExportColumn('Staff', 'staff__username'),
+        ExportColumn('Role', 'staff__role', dict(User.ROLE_CHOICES)),
+        ExportColumn('Login Time', 'login_time'),
+        ExportColumn('Logout Time', 'logout_time'),
+        ExportColumn('Location', 'location'),
+        ExportColumn('IP Address', 'ip_address'),
+    ), ('-login_time', '-id')),
+
+    'audit': ExportDataset('audit', AuditLog, (
+        ExportColumn('Timestamp', 'timestamp'),
+        ExportColumn('User', 'user__username'),
+        ExportColumn('Action', 'action', dict(AuditLog.ACTION_CHOICES)),
+        ExportColumn('Model', 'model_name'),
+        ExportColumn('Object ID', 'object_id'),
+        ExportColumn('Changes', 'changes'),
+        ExportColumn('IP Address', 'ip_address'),
+    ), ('-timestamp', '-id')),
+}
+
+
+class _Echo:
+    """File-like object whose ``write`` hands the line back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def _lookup(obj, path):
+    """Value of a ``values()``-style field path on a model instance"""
+    for name in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, name)
+    return obj
+
+
+def _tiered_rows(queryset, dataset, sources, chunk_size):
+    """Value tuples across ``queryset`` and its archive ``sources``, one keyset page at a time"""
+    paginator = TieredKeysetPaginator(queryset, chunk_size, dataset.ordering, sources=sources)
+    page = paginator.page()
+    while True:
+        for obj in page:
+            yield [_lookup(obj, column.field) for column in dataset.columns]
+        if not page.has_next():
+            return
+        page = paginator.page(page.next_cursor)
+
+
+def export_rows(queryset, dataset, chunk_size=EXPORT_CHUNK_SIZE, sources=()):
+    """
+    Formatted value tuples for every row of ``queryset``, read in chunks.
+    With ``sources`` the rows of those extra tiers follow in the same order.
+    """
+    columns = dataset.columns
+    if sources:
+        rows = _tiered_rows(queryset, dataset, sources, chunk_size)
+    else:
+        rows = queryset.order_by(*dataset.ordering).values_list(
+            *[column.field for column in columns]
+        ).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield [column.format(value) for column, value in zip(columns, row)]
+
+
+def csv_lines(queryset, dataset, chunk_size=EXPORT_CHUNK_SIZE, sources=()):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([column.header for column in dataset.columns])
+    for row in export_rows(queryset, dataset, chunk_size, sources):
+        yield writer.writerow(row)
+
+
+def jsonl_lines(queryset, dataset, chunk_size=EXPORT_CHUNK_SIZE, sources=()):
+    headers = [column.header for column in dataset.columns]
+    for row in export_rows(queryset, dataset, chunk_size, sources):
+        yield json.dumps(dict(zip(headers, row)), default=str) + '\n'
+
+
+def streaming_export(queryset, dataset, export_format='csv', filename=None, sources=()):
+    """
+    ``StreamingHttpResponse`` downloading ``queryset`` as CSV or JSON Lines.
+
+    ``dataset`` is an ``ExportDataset`` or a key of ``DATASETS``; ``sources``
+    are extra tiers for ``TieredKeysetPaginator`` (archived audit entries).
+    """
+    if isinstance(dataset, str):
+        dataset = DATASETS[dataset]
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f'Unknown export format: {export_format}')
+
+    lines = csv_lines if export_format == 'csv' else jsonl_lines
+    filename = filename or f'{dataset.name}-{timezone.localdate()}'
+
+    response = StreamingHttpResponse(
+        lines(queryset, dataset, sources=sources),
+        content_type=EXPORT_FORMATS[export_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
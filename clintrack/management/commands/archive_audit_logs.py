@@ -0,0 +1,68 @@
+"""
+ClinTrack Audit Archival Command
+Moves whole months of old audit log entries to the audit_logs_archive table
+
+Each month is copied with one INSERT ... SELECT and deleted from the live
+table in the same transaction, so the live table (and its indexes) only
+holds recent history.
+
+Usage:
+    python manage.py archive_audit_logs                     # keep CLINTRACK_AUDIT_LIVE_MONTHS months
+    python manage.py archive_audit_logs --keep-months=3
+    python manage.py archive_audit_logs --dry-run
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from clintrack.audit import archivable_months, archive_range, month_start
+from clintrack.models import AuditLog, AuditLogArchive
+
+
+class Command(BaseCommand):
+    help = 'Moves audit log months older than the retention window to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-months',
+            type=int,
+            default=getattr(settings, 'CLINTRACK_AUDIT_LIVE_MONTHS', 12),
+            help='Complete months kept in the live table besides the current one'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='List the months that would be archived without moving them'
+        )
+
+    def handle(self, *args, **options):
+        if options['keep_months'] < 0:
+            raise CommandError('--keep-months cannot be negative')
+
+        cutoff = month_start(timezone.localtime())
+        for _ in range(options['keep_months']):
+            cutoff = month_start(cutoff - timedelta(days=1))
+
+        months = archivable_months(cutoff)
+        self.stdout.write(self.style.HTTP_INFO(
+            f'Archiving audit logs before {cutoff:%Y-%m} ({len(months)} month(s))...'
+        ))
+
+        total = 0
+        for start, end in months:
+            if options['dry_run']:
+                count = AuditLog.objects.filter(timestamp__gte=start, timestamp__lt=end).count()
+                self.stdout.write(f'  {start:%Y-%m}: {count} entries')
+            else:
+                count = archive_range(start, end)
+                self.stdout.write(self.style.SUCCESS(f'  ✓ {start:%Y-%m}: {count} entries'))
+            total += count
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {verb} {total} entries; {AuditLog.objects.count()} live, '
+            f'{AuditLogArchive.objects.count()} archived'
+        ))
@@ -0,0 +1,122 @@
+"""
+ClinTrack Audit Segment Command
+Moves audit log entries older than the cut-off into compressed segment files
+
+Entries are taken from both audit_logs and audit_logs_archive a month at a
+time, oldest first, in batches of at most SEGMENT_ROWS entries per segment
+file, so memory use does not grow with the size of a month. Each file is
+written and registered in the manifest before its rows are deleted, so an
+interrupted run leaves rows in both places rather than losing any; the next
+run skips writing rows a segment already holds and just deletes them.
+
+Usage:
+    python manage.py archive_audit_segments                 # CLINTRACK_AUDIT_SEGMENT_AFTER_DAYS
+    python manage.py archive_audit_segments --older-than-days=30
+    python manage.py archive_audit_segments --dry-run
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from clintrack.audit import month_start, next_month
+from clintrack.models import AuditLog, AuditLogArchive
+from clintrack.segments import COLUMNS, archived_ids, read_manifest, segment_dir, write_segment
+
+
+DELETE_BATCH_SIZE = 500
+
+# Most entries held in memory and written to one segment file
+SEGMENT_ROWS = 50_000
+
+
+class Command(BaseCommand):
+    help = 'Moves old audit log entries out of the database into compressed segment files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            default=getattr(settings, 'CLINTRACK_AUDIT_SEGMENT_AFTER_DAYS', 90),
+            help='Move entries older than this many days'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Count the entries per month without moving them'
+        )
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0:
+            raise CommandError('--older-than-days cannot be negative')
+
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        tables = [AuditLog, AuditLogArchive]
+        oldest = [model.objects.aggregate(oldest=Min('timestamp'))['oldest'] for model in tables]
+        oldest = [moment for moment in oldest if moment is not None]
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f'Moving audit logs before {cutoff:%Y-%m-%d %H:%M} to {segment_dir()}...'
+        ))
+
+        run = timezone.now().strftime('%Y%m%dT%H%M%S')
+        total = 0
+        start = month_start(timezone.localtime(min(oldest))) if oldest else cutoff
+        while start < cutoff:
+            end = min(next_month(start), cutoff)
+            selections = [
+                model.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by()
+                for model in tables
+            ]
+
+            if options['dry_run']:
+                count = sum(selection.count() for selection in selections)
+                if count:
+                    self.stdout.write(f'  {start:%Y-%m}: {count} entries')
+            else:
+                count, size = self._move(selections, f'audit-{start:%Y-%m}-{run}')
+                if count:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'  ✓ {start:%Y-%m}: {count} entries, {size // 1024} KB'
+                    ))
+            total += count
+            start = end
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        segments = read_manifest()['segments']
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {verb} {total} entries; {len(segments)} segment file(s) hold '
+            f'{sum(entry["rows"] for entry in segments)} entries'
+        ))
+
+    def _move(self, selections, prefix):
+        """
+        Move every row of ``selections`` to segment files named after
+        ``prefix``, oldest first, one batch at a time. Each batch is deleted
+        once written, so the next query picks up where it ended.
+        """
+        count = size = part = 0
+        for selection in selections:
+            batches = selection.order_by('timestamp', 'id').values_list(*[name for name, _ in COLUMNS])
+            while True:
+                rows = list(batches[:SEGMENT_ROWS])
+                if not rows:
+                    break
+                stored = archived_ids(rows[0][2], rows[-1][2] + timedelta(microseconds=1))
+                pending = [row for row in rows if row[0] not in stored]
+                if pending:
+                    part += 1
+                    size += write_segment(f'{prefix}-{part}.seg', pending)['bytes']
+                self._delete(selections, [row[0] for row in rows])
+                count += len(rows)
+        return count, size
+
+    def _delete(self, selections, ids):
+        with transaction.atomic():
+            for selection in selections:
+                for position in range(0, len(ids), DELETE_BATCH_SIZE):
+                    selection.filter(id__in=ids[position:position + DELETE_BATCH_SIZE]).delete()
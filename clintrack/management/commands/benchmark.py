@@ -0,0 +1,295 @@
+"""
+ClinTrack View Benchmark Command
+Seeds a fixed dataset into a throwaway test database and times every page
+
+Every GET view in clintrack/urls.py (dashboards, reports, lists, detail
+pages, chart APIs and exports) is requested through the Django test client
+as an administrator. For each URL the first, cold-cache request records the
+query count and peak Python memory; the remaining repeats record wall time.
+
+Usage:
+    python manage.py benchmark                                   # small_clinic profile
+    python manage.py benchmark --profile=regional --output=benchmarks/regional.json
+    python manage.py benchmark --profile=regional --compare=benchmarks/regional.json
+    python manage.py benchmark --keepdb --only=reports          # reuse the seeded database
+"""
+
+import io
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from clintrack import urls as clintrack_urls
+from clintrack.exports import DATASETS
+from clintrack.models import User, Study, Participant, SUSAR
+
+
+# Views that change state, need a POST, or just redirect
+SKIPPED_VIEWS = {
+    'login', 'logout', 'dashboard', 'participant_delete',
+    'update_profile', 'update_password', 'update_notifications', 'update_appearance',
+    'setup_2fa', 'revoke_session', 'revoke_all_sessions', 'delete_account',
+}
+
+# Model supplying the ``pk`` of each detail route
+DETAIL_MODELS = {
+    'participant': Participant,
+    'study': Study,
+    'susars': SUSAR,
+}
+
+# Query-string variants benchmarked in addition to the bare URL
+VARIANTS = {
+    'participant_list': ['?search=akinyi', '?status=active'],
+    'participant_search': ['?first_name=akinyi&last_name=otieno', '?phone=0712', '?last_name=odiambo&mode=fuzzy'],
+    'susars_list': ['?severity=severe'],
+    'reports_index': ['?start_date={year_ago}&end_date={today}'],
+}
+
+# A run regresses when it exceeds the baseline by this factor ...
+DEFAULT_THRESHOLD = 1.5
+# ... and by at least this many milliseconds, so noise on fast pages is ignored
+MIN_REGRESSION_MS = 5.0
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks every ClinTrack view against a seeded dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--profile',
+            default='small_clinic',
+            help='seed_data profile to benchmark against (default: small_clinic)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=42,
+            help='Random seed for the dataset (default: 42)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Requests per URL; the first is the cold run (default: 5)'
+        )
+        parser.add_argument(
+            '--only',
+            help='Benchmark only URLs containing this text'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the results to this JSON baseline file'
+        )
+        parser.add_argument(
+            '--compare',
+            help='Compare against this baseline file; exits non-zero on a regression'
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=DEFAULT_THRESHOLD,
+            help=f'Slowdown factor reported as a regression (default: {DEFAULT_THRESHOLD})'
+        )
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Keep the seeded test database between runs (needs DATABASES TEST NAME on SQLite)'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 2:
+            raise CommandError('--repeat must be at least 2 (one cold and one warm request)')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+
+        setup_test_environment()
+        test_db = connection.creation.create_test_db(verbosity=0, keepdb=options['keepdb'])
+        try:
+            self.stdout.write(self.style.HTTP_INFO(f'Test database: {test_db}'))
+            self.seed(options)
+            results = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(test_db, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+
+        report = {
+            'meta': {
+                'profile': options['profile'],
+                'seed': options['seed'],
+                'repeat': options['repeat'],
+                'rows': self.rows,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'created': timezone.now().isoformat(),
+            },
+            'results': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f'✓ Results written to {options["output"]}'))
+
+        if baseline is not None:
+            self.compare(baseline, report, options['threshold'])
+
+    # ----- dataset -----
+
+    def seed(self, options):
+        if options['keepdb'] and Participant.objects.exists():
+            self.stdout.write('Reusing seeded data')
+        else:
+            self.stdout.write(self.style.HTTP_INFO(f'Seeding {options["profile"]} dataset...'))
+            started = time.perf_counter()
+            call_command(
+                'seed_data', profile=options['profile'], seed=options['seed'], stdout=io.StringIO()
+            )
+            self.stdout.write(self.style.SUCCESS(f'✓ Seeded in {time.perf_counter() - started:.1f}s'))
+
+        self.rows = {
+            'studies': Study.objects.count(),
+            'participants': Participant.objects.count(),
+            'susars': SUSAR.objects.count(),
+        }
+
+    def urls(self, options):
+        """Every benchmarked URL, in urls.py order"""
+        today = timezone.localdate()
+        placeholders = {'today': today, 'year_ago': today.replace(year=today.year - 1)}
+
+        urls = []
+        for pattern in clintrack_urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or pattern.name in SKIPPED_VIEWS:
+                continue
+            params = pattern.pattern.converters
+
+            if not params:
+                base = [reverse(pattern.name)]
+            elif 'dataset' in params:
+                base = [reverse(pattern.name, args=[name]) for name in DATASETS]
+            else:
+                model = DETAIL_MODELS[pattern.name.split('_')[0]]
+                # A row from the middle of the table, not a freshly cached first row
+                pk = model.objects.order_by('pk').values_list('pk', flat=True)[model.objects.count() // 2]
+                base = [reverse(pattern.name, args=[pk])]
+
+            for url in base:
+                urls.append(url)
+                urls.extend(url + variant.format(**placeholders) for variant in VARIANTS.get(pattern.name, []))
+
+        if options['only']:
+            urls = [url for url in urls if options['only'] in url]
+        return list(dict.fromkeys(urls))
+
+    # ----- measurement -----
+
+    def request(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def run(self, options):
+        admin = User.objects.filter(role='admin').order_by('pk').first()
+        if admin is None:
+            raise CommandError('The seeded dataset has no administrator account')
+        client = Client(raise_request_exception=False)
+        client.force_login(admin)
+
+        urls = self.urls(options)
+        self.stdout.write(self.style.HTTP_INFO(f'\nBenchmarking {len(urls)} URLs x {options["repeat"]}'))
+        self.stdout.write(f'{"URL":<60} {"status":>6} {"queries":>8} {"cold ms":>9} {"warm ms":>9} {"peak KB":>9}')
+
+        results = {}
+        for url in urls:
+            for alias in caches:
+                caches[alias].clear()
+
+            # request_started resets the query log, so start from an empty one
+            connection.queries_log.clear()
+            tracemalloc.start()
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.request(client, url)
+            cold = (time.perf_counter() - started) * 1000
+            peak = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+
+            warm = []
+            for _ in range(options['repeat'] - 1):
+                started = time.perf_counter()
+                self.request(client, url)
+                warm.append((time.perf_counter() - started) * 1000)
+
+            results[url] = {
+                'status': response.status_code,
+                'queries': len(queries),
+                'cold_ms': round(cold, 2),
+                'warm_ms': round(statistics.median(warm), 2),
+                'peak_kb': round(peak, 1),
+            }
+            row = results[url]
+            style = self.style.ERROR if row['status'] >= 500 else (lambda text: text)
+            self.stdout.write(style(
+                f'{url[:60]:<60} {row["status"]:>6} {row["queries"]:>8} '
+                f'{row["cold_ms"]:>9.1f} {row["warm_ms"]:>9.1f} {row["peak_kb"]:>9.0f}'
+            ))
+        return results
+
+    # ----- comparison -----
+
+    def compare(self, baseline, report, threshold):
+        if baseline['meta'].get('profile') != report['meta']['profile']:
+            self.stdout.write(self.style.WARNING(
+                f'Baseline profile {baseline["meta"].get("profile")} differs from {report["meta"]["profile"]}'
+            ))
+
+        self.stdout.write(self.style.HTTP_INFO('\nComparison with baseline'))
+        regressions = []
+        for url, now in report['results'].items():
+            before = baseline['results'].get(url)
+            if before is None:
+                self.stdout.write(f'  new      {url}')
+                continue
+
+            problems = []
+            if now['status'] != before['status']:
+                problems.append(f'status {before["status"]} -> {now["status"]}')
+            if now['queries'] > before['queries']:
+                problems.append(f'queries {before["queries"]} -> {now["queries"]}')
+            for metric in ('cold_ms', 'warm_ms'):
+                if (now[metric] > before[metric] * threshold
+                        and now[metric] - before[metric] > MIN_REGRESSION_MS):
+                    problems.append(f'{metric} {before[metric]:.1f} -> {now[metric]:.1f}')
+            if now['peak_kb'] > before['peak_kb'] * threshold:
+                problems.append(f'peak_kb {before["peak_kb"]:.0f} -> {now["peak_kb"]:.0f}')
+
+            if problems:
+                regressions.append(url)
+                self.stdout.write(self.style.ERROR(f'  SLOWER   {url}: {", ".join(problems)}'))
+            elif now['warm_ms'] * threshold < before['warm_ms'] or now['queries'] < before['queries']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'  faster   {url}: warm {before["warm_ms"]:.1f} -> {now["warm_ms"]:.1f} ms, '
+                    f'queries {before["queries"]} -> {now["queries"]}'
+                ))
+
+        if regressions:
+            raise CommandError(f'{len(regressions)} URL(s) regressed against {len(baseline["results"])} baseline entries')
+        self.stdout.write(self.style.SUCCESS('✓ No regressions'))
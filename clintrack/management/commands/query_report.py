@@ -0,0 +1,135 @@
+"""
+ClinTrack Query Report Command
+Summarises the query profiler log by endpoint, worst first
+
+Reads the JSON Lines written by QueryProfilerMiddleware (including rotated
+files) and groups requests by view. Run the server with
+CLINTRACK_QUERY_PROFILER=1 to collect data.
+
+Usage:
+    python manage.py query_report
+    python manage.py query_report --sort=db_ms --limit=10
+    python manage.py query_report --sort=duplicates --statements
+"""
+
+import json
+import math
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+SORT_KEYS = ['queries', 'db_ms', 'duplicates', 'total_ms', 'requests']
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Summarises the per-request SQL profiler log by endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log',
+            default=str(getattr(settings, 'CLINTRACK_QUERY_PROFILER_LOG', 'logs/queries.jsonl')),
+            help='Profiler log file; rotated files next to it are read too'
+        )
+        parser.add_argument(
+            '--sort',
+            choices=SORT_KEYS,
+            default='queries',
+            help='Rank endpoints by mean queries, db_ms, duplicates, total_ms or requests (default: queries)'
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Number of endpoints to show (default: 20)'
+        )
+        parser.add_argument(
+            '--statements',
+            action='store_true',
+            help='Also list the most repeated and slowest statements of each endpoint'
+        )
+
+    def entries(self, log):
+        """Every logged request, oldest rotated file first"""
+        path = Path(log)
+        files = sorted(
+            path.parent.glob(path.name + '.*'),
+            key=lambda rotated: -int(rotated.suffix[1:]) if rotated.suffix[1:].isdigit() else 0
+        )
+        files.append(path)
+
+        found = False
+        for file in files:
+            if not file.exists():
+                continue
+            found = True
+            with open(file, encoding='utf-8') as handle:
+                for line in handle:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        if not found:
+            raise CommandError(f'No profiler log at {path}; enable CLINTRACK_QUERY_PROFILER first')
+
+    def handle(self, *args, **options):
+        endpoints = defaultdict(lambda: {
+            'queries': [], 'db_ms': [], 'duplicates': [], 'total_ms': [],
+            'repeated': Counter(), 'sql': {}, 'slowest': {},
+        })
+
+        for entry in self.entries(options['log']):
+            stats = endpoints[f'{entry["method"]} {entry.get("view") or entry["path"]}']
+            for metric in ('queries', 'db_ms', 'duplicates', 'total_ms'):
+                stats[metric].append(entry[metric])
+            for statement in entry.get('repeated', []):
+                stats['repeated'][statement['fingerprint']] += statement['count']
+                stats['sql'][statement['fingerprint']] = statement['sql']
+            for statement in entry.get('slowest', []):
+                if statement['ms'] > stats['slowest'].get(statement['sql'], 0):
+                    stats['slowest'][statement['sql']] = statement['ms']
+
+        if not endpoints:
+            self.stdout.write('The profiler log is empty')
+            return
+
+        def mean(values):
+            return sum(values) / len(values)
+
+        def rank(item):
+            stats = item[1]
+            if options['sort'] == 'requests':
+                return len(stats['queries'])
+            return mean(stats[options['sort']])
+
+        ranked = sorted(endpoints.items(), key=rank, reverse=True)[:options['limit']]
+        total = sum(len(stats['queries']) for stats in endpoints.values())
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f'{total} requests across {len(endpoints)} endpoints, ranked by {options["sort"]}'
+        ))
+        self.stdout.write(
+            f'{"Endpoint":<45} {"reqs":>6} {"queries":>8} {"p95":>6} {"max":>6} '
+            f'{"dupes":>6} {"db ms":>9} {"total ms":>9}'
+        )
+        for name, stats in ranked:
+            queries = stats['queries']
+            line = (
+                f'{name[:45]:<45} {len(queries):>6} {mean(queries):>8.1f} '
+                f'{percentile(queries, 0.95):>6} {max(queries):>6} {mean(stats["duplicates"]):>6.1f} '
+                f'{mean(stats["db_ms"]):>9.1f} {mean(stats["total_ms"]):>9.1f}'
+            )
+            self.stdout.write(self.style.WARNING(line) if mean(stats['duplicates']) >= 10 else line)
+
+            if options['statements']:
+                for key, count in stats['repeated'].most_common(3):
+                    self.stdout.write(f'    repeated x{count}: {stats["sql"][key][:150]}')
+                for sql, ms in sorted(stats['slowest'].items(), key=lambda item: -item[1])[:3]:
+                    self.stdout.write(f'    slowest {ms:.1f} ms: {sql[:150]}')
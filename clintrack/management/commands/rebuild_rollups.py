@@ -0,0 +1,24 @@
+"""
+ClinTrack Rollup Rebuild Command
+Recomputes the daily enrollment, status transition and SUSAR rollups
+
+Usage:
+    python manage.py rebuild_rollups
+"""
+
+from django.core.management.base import BaseCommand
+from clintrack.models import DailyEnrollmentRollup, DailyStatusTransitionRollup, DailySUSARRollup
+from clintrack.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily trend rollup tables from participants and SUSARs'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.HTTP_INFO('Rebuilding daily rollups...'))
+        rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {DailyEnrollmentRollup.objects.count()} enrollment, '
+            f'{DailyStatusTransitionRollup.objects.count()} status transition and '
+            f'{DailySUSARRollup.objects.count()} SUSAR rollup rows'
+        ))
@@ -0,0 +1,34 @@
+"""
+ClinTrack Search Index Rebuild Command
+Repopulates the full-text participant index, the fuzzy name/location keys
+and the normalized phone numbers
+
+Usage:
+    python manage.py rebuild_search_index
+"""
+
+from django.core.management.base import BaseCommand
+from clintrack.models import ParticipantSearchKey, ParticipantPhone
+from clintrack.search import (
+    rebuild_search_index, rebuild_search_keys, rebuild_phones, search_index_available
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the participant full-text index, fuzzy search keys and phone index'
+
+    def handle(self, *args, **options):
+        if search_index_available():
+            self.stdout.write(self.style.HTTP_INFO('Rebuilding full-text index...'))
+            rebuild_search_index()
+            self.stdout.write(self.style.SUCCESS('✓ Full-text index rebuilt'))
+        else:
+            self.stdout.write(self.style.WARNING('Full-text index not available on this database, skipping'))
+
+        self.stdout.write(self.style.HTTP_INFO('Rebuilding fuzzy search keys...'))
+        rebuild_search_keys()
+        self.stdout.write(self.style.SUCCESS(f'✓ {ParticipantSearchKey.objects.count()} fuzzy search keys'))
+
+        self.stdout.write(self.style.HTTP_INFO('Rebuilding phone index...'))
+        rebuild_phones()
+        self.stdout.write(self.style.SUCCESS(f'✓ {ParticipantPhone.objects.count()} normalized phone numbers'))
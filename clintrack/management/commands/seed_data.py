@@ -6,18 +6,147 @@ Usage:
     python manage.py seed_data --years=2 --participants=500
     python manage.py seed_data --clear  # Clear existing data first
     python manage.py seed_data --participants=1000 --susars=50
+    python manage.py seed_data --bulk --participants=1000000 --seed=42  # Load-test dataset
+    python manage.py seed_data --clear --profile=regional --seed=42      # Scale profile
+    python manage.py seed_data --clear --seed=42 --as-of=2026-01-01      # Same rows on any day
 """
 
 import random
-from datetime import datetime, timedelta
+from array import array
+from contextlib import contextmanager, nullcontext
+from datetime import date, datetime, time, timedelta
+from itertools import accumulate, islice
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from django.utils import timezone
-from clintrack.models import Study, Participant, SUSAR, StaffAttendance
+from phonenumber_field.phonenumber import PhoneNumber
+from clintrack.models import Study, Participant, SUSAR, StaffAttendance, AuditLog
+from clintrack.cache import invalidate_contexts
+from clintrack.audit import suspend_capture
+from clintrack.rollups import rebuild_rollups
+from clintrack.search import rebuild_search_keys, rebuild_phones
 
 User = get_user_model()
 
 
+# Dataset sizes for load testing. Explicit command-line counts override these.
+# ``counties`` is how many entries of SITES are used and ``skew`` the Zipf
+# exponent of both the study and the location frequencies (0 = uniform).
+PROFILES = {
+    'small_clinic': {
+        'studies': 2, 'participants': 500, 'susars': 30, 'staff': 10,
+        'audit_logs': 5_000, 'years': 2, 'counties': 1, 'skew': 0.8,
+    },
+    'regional': {
+        'studies': 10, 'participants': 100_000, 'susars': 2_000, 'staff': 60,
+        'audit_logs': 1_000_000, 'years': 3, 'counties': 4, 'skew': 1.0,
+    },
+    'national': {
+        'studies': 50, 'participants': 2_000_000, 'susars': 20_000, 'staff': 300,
+        'audit_logs': 20_000_000, 'years': 5, 'counties': 10, 'skew': 1.1,
+    },
+}
+
+# Settings used without --profile: the original two-study Kilifi dataset
+DEFAULTS = {
+    'studies': 2, 'participants': 500, 'susars': 30, 'staff': 10,
+    'audit_logs': 0, 'years': 2, 'counties': 1, 'skew': 0,
+}
+
+# Residential areas per county, most populous first
+SITES = {
+    'Kilifi': [
+        'Mtwapa', 'Shanzu', 'Bamburi', 'Nyali', 'Kongowea', 'Junda', 'Kisauni',
+        'Mtopanga', 'Kikambala', 'Vipingo', 'Takaungu', 'Kilifi', 'Mnarani',
+        'Tezo', 'Chumani', 'Mtwapa Creek', 'Jumba Ruins', 'Kanamai', 'Shimo La Tewa',
+        'Bombolulu', 'Mishomoroni', 'Majaoni', 'Bangladesh', 'Magongo', 'Ziwa La Ngombe'
+    ],
+    'Nairobi': [
+        'Kibera', 'Mathare', 'Kawangware', 'Embakasi', 'Kayole', 'Dandora', 'Kasarani',
+        'Githurai', 'Eastleigh', 'Westlands', 'Kangemi', 'Langata', 'Karen', 'Ruaraka'
+    ],
+    'Mombasa': [
+        'Likoni', 'Changamwe', 'Mvita', 'Old Town', 'Tudor', 'Mikindani', 'Port Reitz',
+        'Chaani', 'Jomvu', 'Miritini'
+    ],
+    'Kisumu': [
+        'Nyalenda', 'Manyatta', 'Obunga', 'Kondele', 'Nyamasaria', 'Kibos', 'Ahero',
+        'Maseno', 'Kombewa', 'Muhoroni'
+    ],
+    'Kiambu': [
+        'Thika', 'Ruiru', 'Juja', 'Kikuyu', 'Limuru', 'Githunguri', 'Kiambu Town', 'Gatundu'
+    ],
+    'Nakuru': [
+        'Nakuru Town', 'Naivasha', 'Molo', 'Njoro', 'Gilgil', 'Subukia', 'Rongai'
+    ],
+    'Kakamega': [
+        'Kakamega Town', 'Mumias', 'Butere', 'Lurambi', 'Malava', 'Shinyalu'
+    ],
+    'Machakos': [
+        'Machakos Town', 'Athi River', 'Kangundo', 'Tala', 'Mwala', 'Matuu'
+    ],
+    'Uasin Gishu': [
+        'Eldoret', 'Langas', 'Huruma', 'Kapseret', 'Moiben', 'Turbo'
+    ],
+    'Homa Bay': [
+        'Homa Bay Town', 'Mbita', 'Kendu Bay', 'Oyugis', 'Ndhiwa', 'Rangwe'
+    ],
+}
+
+STUDY_AREAS = [
+    'Malaria Vaccine', 'HIV Prevention', 'Tuberculosis Treatment', 'Maternal Health',
+    'Sickle Cell', 'Typhoid Conjugate Vaccine', 'Hypertension', 'Diabetes Care',
+    'Childhood Pneumonia', 'Cholera Vaccine', 'Malnutrition', 'Cervical Cancer Screening',
+]
+
+
+def kenyan_mobile():
+    """A random +2547xx number, built directly rather than parsed from text"""
+    return PhoneNumber(country_code=254, national_number=random.randint(700000000, 799999999))
+
+
+def zipf_cum_weights(count, skew):
+    """Cumulative Zipf weights for ``count`` items ranked by frequency, for ``random.choices``"""
+    return list(accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+@contextmanager
+def keep_timestamps(*fields):
+    """
+    Let ``auto_now_add`` fields keep the value already set on the instance,
+    so generated history is spread over the seeded years instead of today.
+    """
+    previous = [(field, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now_add in previous:
+            field.auto_now_add = auto_now_add
+
+
+class ParticipantRefs:
+    """Compact (pk, enrollment date) pairs of the created participants"""
+
+    def __init__(self):
+        self.pks = array('q')
+        self.enrollment_days = array('l')
+
+    def __len__(self):
+        return len(self.pks)
+
+    def append(self, participant):
+        self.pks.append(participant.pk)
+        self.enrollment_days.append(participant.enrollment_date.toordinal())
+
+    def choice(self):
+        index = random.randrange(len(self.pks))
+        return self.pks[index], date.fromordinal(self.enrollment_days[index])
+
+
 class Command(BaseCommand):
     help = 'Seeds the database with realistic Kenyan clinical research data'
 
@@ -25,63 +154,163 @@ class Command(BaseCommand):
         parser.add_argument(
             '--years',
             type=int,
-            default=2,
+            default=None,
             help='Number of years of historical data to generate (default: 2)'
         )
         parser.add_argument(
             '--participants',
             type=int,
-            default=500,
+            default=None,
             help='Number of participants to create (default: 500)'
         )
         parser.add_argument(
             '--susars',
             type=int,
-            default=30,
+            default=None,
             help='Number of SUSARs to create (default: 30)'
         )
         parser.add_argument(
             '--staff',
             type=int,
-            default=10,
+            default=None,
             help='Number of staff members to create (default: 10)'
         )
+        parser.add_argument(
+            '--studies',
+            type=int,
+            default=None,
+            help='Number of studies (default: 2)'
+        )
+        parser.add_argument(
+            '--audit-logs',
+            type=int,
+            default=None,
+            help='Number of audit log rows to create (default: 0)'
+        )
+        parser.add_argument(
+            '--profile',
+            choices=sorted(PROFILES),
+            help='Load-test scale profile; implies --bulk. Explicit counts override it'
+        )
         parser.add_argument(
             '--clear',
             action='store_true',
             help='Clear existing data before seeding'
         )
+        parser.add_argument(
+            '--bulk',
+            action='store_true',
+            help='Insert rows with bulk_create in a single transaction (signals do not run; '
+                 'rollups and search indexes are rebuilt at the end)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT in --bulk mode (default: 1000)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=None,
+            help='Random seed, for a reproducible dataset (pair it with --as-of)'
+        )
+        parser.add_argument(
+            '--as-of',
+            type=date.fromisoformat,
+            default=None,
+            help='Date (YYYY-MM-DD) the generated history runs up to, taken as its '
+                 'midnight (default: now)'
+        )
 
     def handle(self, *args, **options):
-        years = options['years']
-        num_participants = options['participants']
-        num_susars = options['susars']
-        num_staff = options['staff']
+        scale = dict(PROFILES[options['profile']] if options['profile'] else DEFAULTS)
+        for key in ('studies', 'participants', 'susars', 'staff', 'audit_logs', 'years'):
+            if options[key] is not None:
+                scale[key] = options[key]
+
+        years = scale['years']
+        num_participants = scale['participants']
+        num_susars = scale['susars']
+        num_staff = scale['staff']
         clear_data = options['clear']
+        self.bulk = options['bulk'] or options['profile'] is not None
+        self.batch_size = options['batch_size']
+        self.skew = scale['skew']
+        self.counties = list(SITES)[:scale['counties']]
+
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+        # Every generated date is relative to this, so --seed with --as-of
+        # reproduces the same rows on any day
+        self.now = datetime.combine(options['as_of'], time()) if options['as_of'] else datetime.now()
 
         self.stdout.write(self.style.SUCCESS('=' * 70))
         self.stdout.write(self.style.SUCCESS('ClinTrack Data Seeding Started'))
         self.stdout.write(self.style.SUCCESS('=' * 70))
 
-        if clear_data:
-            self.clear_existing_data()
+        # Generated rows are not user edits, so keep them out of the audit trail
+        with suspend_capture(), transaction.atomic() if self.bulk else nullcontext():
+            if clear_data:
+                self.clear_existing_data()
+
+            # Seed in order
+            with keep_timestamps(Study._meta.get_field('created_at'), User._meta.get_field('created_at')):
+                studies = self.create_studies(scale['studies'])
+                staff_users = self.create_staff_members(num_staff)
+            participants = self.create_participants(studies, staff_users, num_participants, years)
+            self.create_susars(participants, staff_users, num_susars, years)
+            self.create_staff_attendance(staff_users, years)
+            self.create_audit_logs(participants, staff_users, scale['audit_logs'], years)
 
-        # Seed in order
-        studies = self.create_studies()
-        staff_users = self.create_staff_members(num_staff)
-        participants = self.create_participants(studies, staff_users, num_participants, years)
-        self.create_susars(participants, staff_users, num_susars, years)
-        self.create_staff_attendance(staff_users, years)
+            if self.bulk:
+                self.rebuild_derived_tables()
 
         self.stdout.write(self.style.SUCCESS('\n' + '=' * 70))
         self.stdout.write(self.style.SUCCESS('✅ Data Seeding Completed Successfully!'))
         self.stdout.write(self.style.SUCCESS('=' * 70))
         self.print_summary(studies, staff_users, participants)
 
+    def insert(self, model, rows, label, progress_every=100):
+        """
+        Save the unsaved instances from ``rows`` one by one, or in
+        ``--batch-size`` INSERTs in bulk mode, yielding each once saved.
+        """
+        rows = iter(rows)
+        total = 0
+        if not self.bulk:
+            for row in rows:
+                row.save()
+                total += 1
+                if total % progress_every == 0:
+                    self.stdout.write(f'  ✓ Created {total} {label}...')
+                yield row
+            return
+
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            total += len(batch)
+            if total % (self.batch_size * 10) < len(batch):
+                self.stdout.write(f'  ✓ Created {total} {label}...')
+            yield from batch
+
+    def rebuild_derived_tables(self):
+        """bulk_create skips the model signals, so rebuild what they maintain"""
+        self.stdout.write(self.style.HTTP_INFO('\n🔁 Rebuilding rollups and search indexes...'))
+        rebuild_rollups()
+        rebuild_search_keys(batch_size=self.batch_size)
+        rebuild_phones(batch_size=self.batch_size)
+        invalidate_contexts()
+        self.stdout.write(self.style.SUCCESS('  ✓ Rollups and search indexes rebuilt'))
+
     def clear_existing_data(self):
         """Clear existing data from the database"""
         self.stdout.write(self.style.WARNING('\n🗑️  Clearing existing data...'))
         
+        AuditLog.objects.all().delete()
         StaffAttendance.objects.all().delete()
         SUSAR.objects.all().delete()
         Participant.objects.all().delete()
@@ -90,8 +319,8 @@ class Command(BaseCommand):
         
         self.stdout.write(self.style.SUCCESS('✓ Existing data cleared'))
 
-    def create_studies(self):
-        """Create the two main studies"""
+    def create_studies(self, count=2):
+        """Create the two main studies, plus generated ones for larger profiles"""
         self.stdout.write(self.style.HTTP_INFO('\n📚 Creating Studies...'))
         
         studies = []
@@ -101,8 +330,9 @@ class Command(BaseCommand):
             defaults={
                 'name': 'Gates MRI Study',
                 'description': 'Gates Foundation funded MRI research study focusing on malaria vaccine development',
-                'start_date': datetime.now().date() - timedelta(days=730),
-                'is_active': True
+                'start_date': self.now.date() - timedelta(days=730),
+                'is_active': True,
+                'created_at': timezone.make_aware(self.now - timedelta(days=730)),
             }
         )
         studies.append(gates_study)
@@ -113,13 +343,31 @@ class Command(BaseCommand):
             defaults={
                 'name': 'GB43374/OLE Study',
                 'description': 'Open Label Extension study for GB43374 vaccine trial',
-                'start_date': datetime.now().date() - timedelta(days=700),
-                'is_active': True
+                'start_date': self.now.date() - timedelta(days=700),
+                'is_active': True,
+                'created_at': timezone.make_aware(self.now - timedelta(days=700)),
             }
         )
         studies.append(ole_study)
         self.stdout.write(self.style.SUCCESS(f'  ✓ Created: {ole_study.name}'))
         
+        for i in range(3, count + 1):
+            area = STUDY_AREAS[i % len(STUDY_AREAS)]
+            started = self.now - timedelta(days=random.randint(90, 1800))
+            study, created = Study.objects.get_or_create(
+                code=f'KE-{area.split()[0].upper()}-{i:03d}',
+                defaults={
+                    'name': f'{area} Study {i:03d}',
+                    'description': f'Multi-site {area.lower()} trial',
+                    'start_date': started.date(),
+                    'is_active': random.random() > 0.2,
+                    'created_at': timezone.make_aware(started),
+                }
+            )
+            studies.append(study)
+        if count > 2:
+            self.stdout.write(self.style.SUCCESS(f'  ✓ Created {count - 2} more studies'))
+        
         return studies
 
     def create_staff_members(self, count):
@@ -142,6 +390,8 @@ class Command(BaseCommand):
         
         roles = ['admin', 'coordinator', 'staff', 'viewer']
         staff_users = []
+        # Hashing is deliberately slow; bulk mode hashes the shared password once
+        password = make_password('ClinTrack2024!') if self.bulk else None
         
         for i in range(count):
             first_name = random.choice(kenyan_first_names)
@@ -157,12 +407,16 @@ class Command(BaseCommand):
                     'role': roles[i % len(roles)],
                     'phone_number': f'+254{random.randint(700000000, 799999999)}',
                     'is_active': True,
-                    'is_staff': True if i < 3 else False
+                    'is_staff': True if i < 3 else False,
+                    'created_at': timezone.make_aware(self.now),
                 }
             )
             
             if created:
-                user.set_password('ClinTrack2024!')
+                if password:
+                    user.password = password
+                else:
+                    user.set_password('ClinTrack2024!')
                 user.save()
                 staff_users.append(user)
                 self.stdout.write(f'  ✓ Created: {user.username} ({user.get_role_display()})')
@@ -201,13 +455,11 @@ class Command(BaseCommand):
             'Ongeri', 'Onyancha', 'Nyamweya', 'Mogaka', 'Omare', 'Momanyi', 'Nyakerario', 'Bosire'
         ]
         
-        # Kenyan locations - Coastal region (Mtwapa area)
-        locations = [
-            'Mtwapa', 'Shanzu', 'Bamburi', 'Nyali', 'Kongowea', 'Junda', 'Kisauni',
-            'Mtopanga', 'Kikambala', 'Vipingo', 'Takaungu', 'Kilifi', 'Mnarani',
-            'Tezo', 'Chumani', 'Mtwapa Creek', 'Jumba Ruins', 'Kanamai', 'Shimo La Tewa',
-            'Bombolulu', 'Mishomoroni', 'Majaoni', 'Bangladesh', 'Magongo', 'Ziwa La Ngombe'
-        ]
+        # Kenyan locations - Coastal region (Mtwapa area) first, then the
+        # other counties of the profile; a few areas dominate when skewed
+        sites = [(county, location) for county in self.counties for location in SITES[county]]
+        site_weights = zipf_cum_weights(len(sites), self.skew)
+        study_weights = zipf_cum_weights(len(studies), self.skew)
         
         sub_locations = [
             'Township', 'Market Area', 'Chief\'s Camp', 'Shopping Centre', 'Beach Front',
@@ -224,56 +476,58 @@ class Command(BaseCommand):
         
         statuses = ['active', 'completed', 'withdrawn', 'lost', 'screening']
         
-        participants = []
-        start_date = datetime.now() - timedelta(days=years * 365)
+        start_date = self.now - timedelta(days=years * 365)
         
-        for i in range(count):
-            study = random.choice(studies)
-            
-            # Generate enrollment date within the time range
-            days_offset = random.randint(0, years * 365)
-            enrollment_date = start_date + timedelta(days=days_offset)
-            
-            # Generate participant ID
-            participant_id = f"{study.code}-{str(i+1).zfill(4)}"
-            
-            # Generate realistic age (18-65 years old)
-            age_years = random.randint(18, 65)
-            dob = enrollment_date.date() - timedelta(days=age_years * 365)
-            
-            # Status logic - newer participants more likely to be active
-            days_since_enrollment = (datetime.now().date() - enrollment_date.date()).days
-            if days_since_enrollment < 180:
-                status = random.choice(['active', 'screening', 'active', 'active'])
-            elif days_since_enrollment < 365:
-                status = random.choice(['active', 'active', 'completed'])
-            else:
-                status = random.choice(statuses)
-            
-            participant = Participant.objects.create(
-                participant_id=participant_id,
-                study=study,
-                first_name=random.choice(first_names),
-                last_name=random.choice(last_names),
-                date_of_birth=dob,
-                gender=random.choice(['M', 'F']),
-                primary_phone=f'+254{random.randint(700000000, 799999999)}',
-                secondary_phone=f'+254{random.randint(700000000, 799999999)}' if random.random() > 0.3 else None,
-                email=f'participant{i+1}@email.com' if random.random() > 0.5 else '',
-                location=random.choice(locations),
-                sub_location=random.choice(sub_locations),
-                county='Kilifi',
-                nearest_landmark=random.choice(landmarks),
-                status=status,
-                enrollment_date=enrollment_date.date(),
-                created_by=random.choice(staff_users),
-                created_at=enrollment_date
-            )
-            
-            participants.append(participant)
-            
-            if (i + 1) % 100 == 0:
-                self.stdout.write(f'  ✓ Created {i + 1}/{count} participants...')
+        def rows():
+            for i in range(count):
+                study = random.choices(studies, cum_weights=study_weights)[0]
+                county, location = random.choices(sites, cum_weights=site_weights)[0]
+                
+                # Generate enrollment date within the time range
+                days_offset = random.randint(0, years * 365)
+                enrollment_date = start_date + timedelta(days=days_offset)
+                
+                # Generate participant ID
+                participant_id = f"{study.code}-{str(i+1).zfill(4)}"
+                
+                # Generate realistic age (18-65 years old)
+                age_years = random.randint(18, 65)
+                dob = enrollment_date.date() - timedelta(days=age_years * 365)
+                
+                # Status logic - newer participants more likely to be active
+                days_since_enrollment = (self.now.date() - enrollment_date.date()).days
+                if days_since_enrollment < 180:
+                    status = random.choice(['active', 'screening', 'active', 'active'])
+                elif days_since_enrollment < 365:
+                    status = random.choice(['active', 'active', 'completed'])
+                else:
+                    status = random.choice(statuses)
+                
+                yield Participant(
+                    participant_id=participant_id,
+                    study=study,
+                    first_name=random.choice(first_names),
+                    last_name=random.choice(last_names),
+                    date_of_birth=dob,
+                    gender=random.choice(['M', 'F']),
+                    primary_phone=kenyan_mobile(),
+                    secondary_phone=kenyan_mobile() if random.random() > 0.3 else None,
+                    email=f'participant{i+1}@email.com' if random.random() > 0.5 else '',
+                    location=location,
+                    sub_location=random.choice(sub_locations),
+                    county=county,
+                    nearest_landmark=random.choice(landmarks),
+                    status=status,
+                    enrollment_date=enrollment_date.date(),
+                    created_by=random.choice(staff_users),
+                    created_at=timezone.make_aware(enrollment_date)
+                )
+        
+        # Keep only (pk, enrollment date) pairs, all the SUSAR generator needs
+        participants = ParticipantRefs()
+        with keep_timestamps(Participant._meta.get_field('created_at')):
+            for participant in self.insert(Participant, rows(), 'participants'):
+                participants.append(participant)
         
         self.stdout.write(self.style.SUCCESS(f'  ✓ Created all {count} participants'))
         return participants
@@ -311,89 +565,132 @@ class Command(BaseCommand):
         severities = ['mild', 'moderate', 'severe']
         outcomes = ['recovered', 'recovering', 'not_recovered', 'recovered_sequelae']
         
-        start_date = datetime.now() - timedelta(days=years * 365)
-        
-        for i in range(count):
-            participant = random.choice(participants)
-            
-            # SUSAR more likely in recently enrolled participants
-            max_days = min((datetime.now().date() - participant.enrollment_date).days, years * 365)
-            if max_days > 0:
-                days_offset = random.randint(0, max_days)
-                onset_date = participant.enrollment_date + timedelta(days=days_offset)
-                
-                detection_date = onset_date + timedelta(hours=random.randint(1, 72))
+        def rows():
+            for i in range(count):
+                participant_pk, enrollment_date = participants.choice()
                 
-                severity = random.choice(severities)
-                is_severe = severity == 'severe'
-                
-                susar = SUSAR.objects.create(
-                    susar_id=f"SUSAR-{datetime.now().year}-{str(i+1).zfill(4)}",
-                    participant=participant,
-                    event_description=random.choice(event_descriptions),
-                    onset_date=onset_date,
-                    detection_date=detection_date,
-                    severity=severity,
-                    outcome=random.choice(outcomes),
-                    is_related_to_study=random.choice([True, False, True]),
-                    causality_assessment='Under investigation' if random.random() > 0.5 else 'Possibly related to study intervention',
-                    actions_taken=random.choice(actions),
-                    hospitalization_required=is_severe,
-                    reported_to_irb=is_severe or random.random() > 0.5,
-                    irb_report_date=onset_date + timedelta(days=random.randint(1, 7)) if is_severe else None,
-                    reported_to_sponsor=is_severe or random.random() > 0.6,
-                    sponsor_report_date=onset_date + timedelta(days=random.randint(1, 5)) if is_severe else None,
-                    follow_up_required=True,
-                    reported_by=random.choice(staff_users)
-                )
-                
-                if (i + 1) % 10 == 0:
-                    self.stdout.write(f'  ✓ Created {i + 1}/{count} SUSARs...')
-        
-        self.stdout.write(self.style.SUCCESS(f'  ✓ Created all {count} SUSAR records'))
+                # SUSAR more likely in recently enrolled participants
+                max_days = min((self.now.date() - enrollment_date).days, years * 365)
+                if max_days > 0:
+                    days_offset = random.randint(0, max_days)
+                    onset_date = enrollment_date + timedelta(days=days_offset)
+                    
+                    detection_date = onset_date + timedelta(hours=random.randint(1, 72))
+                    
+                    severity = random.choice(severities)
+                    is_severe = severity == 'severe'
+                    
+                    yield SUSAR(
+                        susar_id=f"SUSAR-{self.now.year}-{str(i+1).zfill(4)}",
+                        participant_id=participant_pk,
+                        event_description=random.choice(event_descriptions),
+                        onset_date=onset_date,
+                        detection_date=detection_date,
+                        severity=severity,
+                        outcome=random.choice(outcomes),
+                        is_related_to_study=random.choice([True, False, True]),
+                        causality_assessment='Under investigation' if random.random() > 0.5 else 'Possibly related to study intervention',
+                        actions_taken=random.choice(actions),
+                        hospitalization_required=is_severe,
+                        reported_to_irb=is_severe or random.random() > 0.5,
+                        irb_report_date=onset_date + timedelta(days=random.randint(1, 7)) if is_severe else None,
+                        reported_to_sponsor=is_severe or random.random() > 0.6,
+                        sponsor_report_date=onset_date + timedelta(days=random.randint(1, 5)) if is_severe else None,
+                        follow_up_required=True,
+                        reported_by=random.choice(staff_users),
+                        created_at=timezone.make_aware(datetime.combine(detection_date, time())),
+                    )
+        
+        with keep_timestamps(SUSAR._meta.get_field('created_at')):
+            created = sum(1 for _ in self.insert(SUSAR, rows(), 'SUSARs', progress_every=10))
+        
+        self.stdout.write(self.style.SUCCESS(f'  ✓ Created {created} SUSAR records'))
 
     def create_staff_attendance(self, staff_users, years):
         """Create staff attendance records"""
         self.stdout.write(self.style.HTTP_INFO('\n📅 Creating Staff Attendance Records...'))
         
-        start_date = datetime.now() - timedelta(days=years * 365)
-        total_records = 0
-        
-        for user in staff_users:
-            # Create attendance for random workdays
-            current_date = start_date
-            while current_date < datetime.now():
-                # Skip weekends
-                if current_date.weekday() < 5:  # Monday = 0, Friday = 4
-                    # 85% chance of attendance on workdays
-                    if random.random() > 0.15:
-                        login_time = current_date + timedelta(
-                            hours=random.randint(7, 9),
-                            minutes=random.randint(0, 59)
-                        )
-                        
-                        # 95% chance they logged out
-                        if random.random() > 0.05:
-                            logout_time = login_time + timedelta(
-                                hours=random.randint(7, 10),
+        start_date = self.now - timedelta(days=years * 365)
+        
+        def rows():
+            for user in staff_users:
+                # Create attendance for random workdays
+                current_date = start_date
+                while current_date < self.now:
+                    # Skip weekends
+                    if current_date.weekday() < 5:  # Monday = 0, Friday = 4
+                        # 85% chance of attendance on workdays
+                        if random.random() > 0.15:
+                            login_time = current_date + timedelta(
+                                hours=random.randint(7, 9),
                                 minutes=random.randint(0, 59)
                             )
-                        else:
-                            logout_time = None
-                        
-                        StaffAttendance.objects.create(
-                            staff=user,
-                            login_time=login_time,
-                            logout_time=logout_time,
-                            location='Mtwapa Research Center',
-                            ip_address=f'192.168.1.{random.randint(10, 250)}'
-                        )
-                        total_records += 1
-                
-                current_date += timedelta(days=1)
+                            
+                            # 95% chance they logged out
+                            if random.random() > 0.05:
+                                logout_time = login_time + timedelta(
+                                    hours=random.randint(7, 10),
+                                    minutes=random.randint(0, 59)
+                                )
+                            else:
+                                logout_time = None
+                            
+                            yield StaffAttendance(
+                                staff=user,
+                                login_time=login_time,
+                                logout_time=logout_time,
+                                location='Mtwapa Research Center',
+                                ip_address=f'192.168.1.{random.randint(10, 250)}'
+                            )
+                    
+                    current_date += timedelta(days=1)
+        
+        total_records = sum(
+            1 for _ in self.insert(StaffAttendance, rows(), 'attendance records', progress_every=1000)
+        )
         
         self.stdout.write(self.style.SUCCESS(f'  ✓ Created {total_records} attendance records'))
 
+    def create_audit_logs(self, participants, staff_users, count, years):
+        """Create audit trail rows spread over the seeded period, mostly record views"""
+        if not count:
+            return
+        self.stdout.write(self.style.HTTP_INFO(f'\n🧾 Creating {count} Audit Log Records...'))
+        
+        actions = ['view', 'update', 'create', 'delete']
+        action_weights = [70, 20, 9, 1]
+        models = ['Participant', 'SUSAR', 'Study', 'User']
+        model_weights = [80, 10, 5, 5]
+        fields = ['status', 'primary_phone', 'location', 'notes', 'outcome', 'follow_up_notes']
+        
+        now = timezone.make_aware(self.now)
+        span_seconds = years * 365 * 24 * 3600
+        
+        def rows():
+            for _ in range(count):
+                action = random.choices(actions, weights=action_weights)[0]
+                model_name = random.choices(models, weights=model_weights)[0]
+                if model_name == 'Participant' and participants:
+                    object_id = participants.choice()[0]
+                else:
+                    object_id = random.randint(1, 5000)
+                
+                yield AuditLog(
+                    user=random.choice(staff_users),
+                    action=action,
+                    model_name=model_name,
+                    object_id=str(object_id),
+                    changes={random.choice(fields): 'updated'} if action == 'update' else None,
+                    ip_address=f'192.168.1.{random.randint(10, 250)}',
+                    timestamp=now - timedelta(seconds=random.randint(0, span_seconds))
+                )
+        
+        total_records = sum(
+            1 for _ in self.insert(AuditLog, rows(), 'audit log records', progress_every=1000)
+        )
+        
+        self.stdout.write(self.style.SUCCESS(f'  ✓ Created {total_records} audit log records'))
+
     def print_summary(self, studies, staff_users, participants):
         """Print summary of created data"""
         self.stdout.write('\n' + '=' * 70)
@@ -421,6 +718,9 @@ class Command(BaseCommand):
         attendance_count = StaffAttendance.objects.count()
         self.stdout.write(f'\n📅 Attendance Records: {attendance_count}')
         
+        audit_count = AuditLog.objects.count()
+        self.stdout.write(f'\n🧾 Audit Log Records: {audit_count}')
+        
         self.stdout.write('\n' + '=' * 70)
         self.stdout.write(self.style.SUCCESS('✅ You can now login with any staff account:'))
         self.stdout.write(self.style.WARNING('   Username: john.kamau1 (or any created username)'))
@@ -0,0 +1,277 @@
+# ============================================
+# metrics.py - ClinTrack Dashboard Metrics
+# ============================================
+
+"""
+Headline counters shared by the role dashboards.
+
+Participant and SUSAR counters are computed from the columnar snapshot
+(see ``snapshot.py``) when it is enabled, so dashboards do not touch those
+tables at all. Otherwise every counter is computed with conditional
+aggregation, so each table is scanned once per request instead of once per
+metric. Per-study status histograms come from ``study_stats``, one grouped
+pass however many studies are asked for.
+"""
+
+from dataclasses import dataclass
+from datetime import timedelta
+
+import pandas as pd
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from . import snapshot
+from .models import Study, Participant, SUSAR
+
+
+CRITICAL_SEVERITIES = ['severe', 'life_threatening', 'fatal']
+UNRESOLVED_OUTCOMES = ['recovering', 'not_recovered', 'unknown']
+IN_RECOVERY_OUTCOMES = ['recovering', 'not_recovered']
+
+
+@dataclass(frozen=True)
+class ParticipantMetrics:
+    total: int = 0
+    active: int = 0
+    completed: int = 0
+    screening: int = 0
+    lost: int = 0
+    withdrawn: int = 0
+    created_last_30_days: int = 0
+    created_previous_30_days: int = 0
+    created_today: int = 0
+    mine: int = 0
+    mine_last_7_days: int = 0
+
+    @property
+    def monthly_growth(self):
+        """Percentage change of the last 30 days against the 30 days before"""
+        if self.created_previous_30_days > 0:
+            change = self.created_last_30_days - self.created_previous_30_days
+            return round((change / self.created_previous_30_days) * 100, 1)
+        return 100 if self.created_last_30_days > 0 else 0
+
+    @property
+    def status_breakdown(self):
+        """Non-empty status counts, largest first, shaped like a values() row"""
+        counts = [
+            {'status': status, 'count': getattr(self, status)}
+            for status, _ in Participant.STATUS_CHOICES
+        ]
+        return sorted(
+            [item for item in counts if item['count']],
+            key=lambda item: -item['count']
+        )
+
+
+@dataclass(frozen=True)
+class StudyMetrics:
+    total: int = 0
+    active: int = 0
+
+
+@dataclass(frozen=True)
+class StudyStats:
+    """Participant status histogram of one study"""
+    total: int = 0
+    active: int = 0
+    completed: int = 0
+    withdrawn: int = 0
+    lost: int = 0
+    screening: int = 0
+
+    @property
+    def completion_rate(self):
+        """Percentage of participants who completed, 0 for an empty study"""
+        return round(self.completed / self.total * 100, 1) if self.total else 0.0
+
+    @property
+    def status_breakdown(self):
+        """Non-empty status counts in choice order, shaped like a values() row"""
+        return [
+            {'status': status, 'count': getattr(self, status)}
+            for status, _ in Participant.STATUS_CHOICES if getattr(self, status)
+        ]
+
+
+class StudyStatsMap(dict):
+    """``study pk -> StudyStats``; studies without participants read as empty"""
+
+    def __missing__(self, pk):
+        return StudyStats()
+
+
+@dataclass(frozen=True)
+class SUSARMetrics:
+    total: int = 0
+    pending_follow_up: int = 0
+    pending_unresolved: int = 0
+    pending_in_recovery: int = 0
+    critical: int = 0
+    detected_today: int = 0
+
+
+@dataclass(frozen=True)
+class DashboardMetrics:
+    participants: ParticipantMetrics
+    studies: StudyMetrics
+    susars: SUSARMetrics
+
+
+def _local(moment):
+    """Aware datetime as the naive local timestamp the snapshot holds"""
+    return pd.Timestamp(timezone.localtime(moment).replace(tzinfo=None))
+
+
+def _on_day(moments, day):
+    start = pd.Timestamp(day)
+    return int(((moments >= start) & (moments < start + pd.Timedelta(days=1))).sum())
+
+
+def participant_metrics(user=None, now=None):
+    """Aggregate participant counters in a single query (or snapshot pass)"""
+    now = now or timezone.now()
+    last_30_days = now - timedelta(days=30)
+    previous_30_days = last_30_days - timedelta(days=30)
+
+    current = snapshot.current()
+    if current is not None:
+        participants = current.participants
+        created = participants.created_at
+        statuses = participants.status.value_counts()
+        values = {status: int(statuses.get(status, 0)) for status, _ in Participant.STATUS_CHOICES}
+        values.update(
+            total=len(participants),
+            created_last_30_days=int((created >= _local(last_30_days)).sum()),
+            created_previous_30_days=int(
+                ((created >= _local(previous_30_days)) & (created < _local(last_30_days))).sum()
+            ),
+            created_today=_on_day(created, now.date()),
+        )
+        if user is not None:
+            mine = participants.created_by_id == user.pk
+            values['mine'] = int(mine.sum())
+            values['mine_last_7_days'] = int((mine & (created >= _local(now - timedelta(days=7)))).sum())
+        return ParticipantMetrics(**values)
+
+    aggregates = {
+        'total': Count('id'),
+        'created_last_30_days': Count('id', filter=Q(created_at__gte=last_30_days)),
+        'created_previous_30_days': Count('id', filter=Q(
+            created_at__gte=previous_30_days,
+            created_at__lt=last_30_days
+        )),
+        'created_today': Count('id', filter=Q(created_at__date=now.date())),
+    }
+    for status, _ in Participant.STATUS_CHOICES:
+        aggregates[status] = Count('id', filter=Q(status=status))
+
+    if user is not None:
+        aggregates['mine'] = Count('id', filter=Q(created_by=user))
+        aggregates['mine_last_7_days'] = Count('id', filter=Q(
+            created_by=user,
+            created_at__gte=now - timedelta(days=7)
+        ))
+
+    return ParticipantMetrics(**Participant.objects.aggregate(**aggregates))
+
+
+def study_metrics():
+    """Aggregate study counters in a single query"""
+    return StudyMetrics(**Study.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_active=True)),
+    ))
+
+
+def study_stats(studies=None, participants=None):
+    """
+    Status histograms for ``studies`` (pks, a Study queryset, or every study
+    when ``None``) from a single query grouped by study and status, or from
+    the snapshot. ``participants`` is a frame with ``study_id`` and
+    ``status`` columns to count instead, as the reports pass their own.
+    """
+    if participants is None:
+        current = snapshot.current()
+        participants = current.participants if current is not None else None
+    if participants is not None:
+        if studies is not None:
+            pks = studies.values_list('pk', flat=True) if hasattr(studies, 'values_list') else studies
+            participants = participants[participants.study_id.isin([getattr(pk, 'pk', pk) for pk in pks])]
+        rows = [
+            (int(study_id), status, int(count))
+            for (study_id, status), count in participants.groupby(['study_id', 'status'], observed=True).size().items()
+        ]
+    else:
+        participants = Participant.objects.order_by()
+        if studies is not None:
+            participants = participants.filter(study_id__in=studies)
+        rows = participants.values_list('study_id', 'status').annotate(count=Count('id'))
+
+    counts = {}
+    for study_id, status, count in rows:
+        counts.setdefault(study_id, {})[status] = count
+
+    return StudyStatsMap({
+        study_id: StudyStats(total=sum(by_status.values()), **by_status)
+        for study_id, by_status in counts.items()
+    })
+
+
+def susar_metrics(now=None):
+    """Aggregate SUSAR counters in a single query (or snapshot pass)"""
+    now = now or timezone.now()
+
+    current = snapshot.current()
+    if current is not None:
+        susars = current.susars
+        pending = susars.follow_up_required
+        return SUSARMetrics(
+            total=len(susars),
+            pending_follow_up=int(pending.sum()),
+            pending_unresolved=int((pending & susars.outcome.isin(UNRESOLVED_OUTCOMES)).sum()),
+            pending_in_recovery=int((pending & susars.outcome.isin(IN_RECOVERY_OUTCOMES)).sum()),
+            critical=int(susars.severity.isin(CRITICAL_SEVERITIES).sum()),
+            detected_today=_on_day(susars.detection_date, now.date()),
+        )
+
+    pending = Q(follow_up_required=True)
+
+    return SUSARMetrics(**SUSAR.objects.aggregate(
+        total=Count('id'),
+        pending_follow_up=Count('id', filter=pending),
+        pending_unresolved=Count('id', filter=pending & Q(outcome__in=UNRESOLVED_OUTCOMES)),
+        pending_in_recovery=Count('id', filter=pending & Q(outcome__in=IN_RECOVERY_OUTCOMES)),
+        critical=Count('id', filter=Q(severity__in=CRITICAL_SEVERITIES)),
+        detected_today=Count('id', filter=Q(detection_date__date=now.date())),
+    ))
+
+
+def participant_counts(field, limit=None):
+    """
+    Non-empty participant counts per value of ``field``, largest first
+    (ties by value), shaped like values() rows
+    """
+    current = snapshot.current()
+    if current is None:
+        rows = Participant.objects.values(field).annotate(count=Count('id')).order_by('-count', field)
+        return list(rows[:limit] if limit else rows)
+
+    counts = current.participants[field].value_counts().sort_index().sort_values(ascending=False, kind='stable')
+    rows = [{field: value, 'count': int(count)} for value, count in counts[counts > 0].items()]
+    return rows[:limit] if limit else rows
+
+
+def collect_dashboard_metrics(user=None, now=None):
+    """
+    Compute every dashboard headline counter in one query per table.
+
+    Pass ``user`` to include the "my participants" counters used by the
+    research staff dashboard.
+    """
+    now = now or timezone.now()
+    return DashboardMetrics(
+        participants=participant_metrics(user=user, now=now),
+        studies=study_metrics(),
+        susars=susar_metrics(now=now),
+    )
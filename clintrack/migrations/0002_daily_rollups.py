@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_rollups(apps, schema_editor):
+    from clintrack.rollups import rebuild_rollups
+    rebuild_rollups(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyEnrollmentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('enrollments', models.IntegerField(default=0)),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='enrollment_rollups', to='clintrack.study')),
+            ],
+            options={
+                'db_table': 'rollup_daily_enrollment',
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day'], name='rollup_dail_day_f412a0_idx')],
+                'constraints': [models.UniqueConstraint(fields=('study', 'day'), name='uniq_enrollment_rollup_study_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStatusTransitionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('transitions', models.IntegerField(default=0)),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='status_transition_rollups', to='clintrack.study')),
+            ],
+            options={
+                'db_table': 'rollup_daily_status_transition',
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day'], name='rollup_dail_day_78e3e3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('study', 'day', 'from_status', 'to_status'), name='uniq_transition_rollup_study_day_status')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySUSARRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('severity', models.CharField(max_length=20)),
+                ('outcome', models.CharField(max_length=20)),
+                ('onsets', models.IntegerField(default=0)),
+                ('detections', models.IntegerField(default=0)),
+                ('study', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='susar_rollups', to='clintrack.study')),
+            ],
+            options={
+                'db_table': 'rollup_daily_susar',
+                'ordering': ['day'],
+                'indexes': [models.Index(fields=['day'], name='rollup_dail_day_1d0829_idx')],
+                'constraints': [models.UniqueConstraint(fields=('study', 'day', 'severity', 'outcome'), name='uniq_susar_rollup_study_day_class')],
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Full-text participant search index (SQLite FTS5)
+
+from django.db import migrations
+
+
+COLUMNS = [
+    'participant_id', 'first_name', 'last_name',
+    'primary_phone', 'secondary_phone', 'location', 'sub_location',
+]
+
+
+def _values(prefix):
+    return ', '.join(f'{prefix}.{column}' for column in COLUMNS)
+
+
+CREATE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE participant_search USING fts5(
+        {', '.join(COLUMNS)},
+        content='participants',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER participant_search_ai AFTER INSERT ON participants BEGIN
+        INSERT INTO participant_search(rowid, {', '.join(COLUMNS)})
+        VALUES (new.id, {_values('new')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER participant_search_ad AFTER DELETE ON participants BEGIN
+        INSERT INTO participant_search(participant_search, rowid, {', '.join(COLUMNS)})
+        VALUES ('delete', old.id, {_values('old')});
+    END
+    """,
+    f"""
+    CREATE TRIGGER participant_search_au AFTER UPDATE OF {', '.join(COLUMNS)} ON participants BEGIN
+        INSERT INTO participant_search(participant_search, rowid, {', '.join(COLUMNS)})
+        VALUES ('delete', old.id, {_values('old')});
+        INSERT INTO participant_search(rowid, {', '.join(COLUMNS)})
+        VALUES (new.id, {_values('new')});
+    END
+    """,
+    "INSERT INTO participant_search(participant_search) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS participant_search_ai',
+    'DROP TRIGGER IF EXISTS participant_search_ad',
+    'DROP TRIGGER IF EXISTS participant_search_au',
+    'DROP TABLE IF EXISTS participant_search',
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0002_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_search_keys(apps, schema_editor):
+    from clintrack.search import rebuild_search_keys
+    rebuild_search_keys(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0003_participant_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipantSearchKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('first_name', 'First Name'), ('last_name', 'Last Name'), ('location', 'Location')], max_length=20)),
+                ('key', models.CharField(max_length=12)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_keys', to='clintrack.participant')),
+            ],
+            options={
+                'db_table': 'participant_search_keys',
+                'indexes': [models.Index(fields=['field', 'key', 'participant'], name='search_key_lookup_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_search_keys, migrations.RunPython.noop),
+    ]
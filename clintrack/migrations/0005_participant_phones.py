@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_phones(apps, schema_editor):
+    from clintrack.search import rebuild_phones
+    rebuild_phones(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0004_participant_search_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParticipantPhone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('primary', 'Primary'), ('secondary', 'Secondary')], max_length=10)),
+                ('digits', models.CharField(help_text='E.164 digits without the leading +', max_length=20)),
+                ('reversed_digits', models.CharField(help_text='digits reversed, for suffix lookup', max_length=20)),
+                ('participant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='phone_numbers', to='clintrack.participant')),
+            ],
+            options={
+                'db_table': 'participant_phones',
+                'indexes': [
+                    models.Index(fields=['digits', 'participant'], name='phone_digits_idx'),
+                    models.Index(fields=['reversed_digits', 'participant'], name='phone_reversed_digits_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('participant', 'kind'), name='uniq_participant_phone_kind'),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_phones, migrations.RunPython.noop),
+    ]
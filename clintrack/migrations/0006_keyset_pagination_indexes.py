@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0005_participant_phones'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['-timestamp', '-id'], name='audit_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['-created_at', '-id'], name='participant_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffattendance',
+            index=models.Index(fields=['-login_time', '-id'], name='attendance_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='susar',
+            index=models.Index(fields=['-onset_date', '-id'], name='susar_keyset_idx'),
+        ),
+    ]
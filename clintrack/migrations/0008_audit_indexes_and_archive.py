@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0007_audit_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('action', models.CharField(choices=[('create', 'Create'), ('update', 'Update'), ('delete', 'Delete'), ('view', 'View')], max_length=20)),
+                ('model_name', models.CharField(max_length=100)),
+                ('object_id', models.CharField(max_length=100)),
+                ('changes', models.JSONField(blank=True, null=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('timestamp', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'audit_logs_archive',
+                'ordering': ['-timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='audit_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['timestamp', 'action'], name='audit_time_action_idx'),
+        ),
+        migrations.AddField(
+            model_name='auditlogarchive',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='auditlogarchive',
+            index=models.Index(fields=['-timestamp', '-id'], name='audit_archive_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlogarchive',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='audit_archive_user_time_idx'),
+        ),
+    ]
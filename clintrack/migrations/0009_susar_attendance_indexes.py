@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0008_audit_indexes_and_archive'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='staffattendance',
+            index=models.Index(fields=['staff', '-login_time'], name='attendance_staff_login_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='staffattendance',
+            index=models.Index(condition=models.Q(('logout_time__isnull', True)), fields=['staff', '-login_time'], name='attendance_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='susar',
+            index=models.Index(fields=['severity', '-onset_date', '-id'], name='susar_severity_onset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='susar',
+            index=models.Index(fields=['outcome'], name='susar_outcome_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='susar',
+            index=models.Index(condition=models.Q(('follow_up_required', True)), fields=['-onset_date', '-id'], name='susar_pending_onset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='susar',
+            index=models.Index(condition=models.Q(('follow_up_required', True)), fields=['severity'], name='susar_pending_severity_idx'),
+        ),
+    ]
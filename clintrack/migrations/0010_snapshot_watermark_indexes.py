@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clintrack', '0009_susar_attendance_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='participant',
+            index=models.Index(fields=['updated_at'], name='participant_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='susar',
+            index=models.Index(fields=['updated_at'], name='susar_updated_idx'),
+        ),
+    ]
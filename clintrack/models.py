@@ -15,6 +15,27 @@ from django.contrib.auth.models import AbstractUser
 from phonenumber_field.modelfields import PhoneNumberField
 from django.utils import timezone
 
+
+class AuditedQuerySet(models.QuerySet):
+    """QuerySet whose ``update()`` writes one batch of audit entries for the rows it changed"""
+    
+    def update(self, **kwargs):
+        from .audit import audited_update
+        return audited_update(self, kwargs, super().update)
+
+
+class AuditedModel(models.Model):
+    """Model whose audit snapshot (taken on load) follows ``refresh_from_db()``"""
+    
+    class Meta:
+        abstract = True
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        from .audit import snapshot
+        snapshot(self, fields)
+
+
 # Custom User Model with Role-Based Access
 class User(AbstractUser):
     ROLE_CHOICES = [
@@ -37,7 +58,7 @@ class User(AbstractUser):
 
 
 # Study Model
-class Study(models.Model):
+class Study(AuditedModel):
     name = models.CharField(max_length=200, unique=True)
     code = models.CharField(max_length=50, unique=True)
     description = models.TextField(blank=True)
@@ -47,6 +68,8 @@ class Study(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AuditedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'studies'
         ordering = ['name']
@@ -56,7 +79,7 @@ class Study(models.Model):
 
 
 # Participant Model - Core of the Locator System
-class Participant(models.Model):
+class Participant(AuditedModel):
     GENDER_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -105,6 +128,8 @@ class Participant(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AuditedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'participants'
         ordering = ['-created_at']
@@ -112,6 +137,9 @@ class Participant(models.Model):
             models.Index(fields=['participant_id']),
             models.Index(fields=['study', 'status']),
             models.Index(fields=['last_name', 'first_name']),
+            models.Index(fields=['-created_at', '-id'], name='participant_keyset_idx'),
+            # Watermark reads of the analytics snapshot
+            models.Index(fields=['updated_at'], name='participant_updated_idx'),
         ]
     
     def __str__(self):
@@ -122,7 +150,7 @@ class Participant(models.Model):
 
 
 # SUSAR (Suspected Unexpected Serious Adverse Reaction) Tracking
-class SUSAR(models.Model):
+class SUSAR(AuditedModel):
     SEVERITY_CHOICES = [
         ('mild', 'Mild'),
         ('moderate', 'Moderate'),
@@ -175,11 +203,29 @@ class SUSAR(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = AuditedQuerySet.as_manager()
+    
     class Meta:
         db_table = 'susars'
         ordering = ['-onset_date']
         verbose_name = 'SUSAR'
         verbose_name_plural = 'SUSARs'
+        indexes = [
+            models.Index(fields=['-onset_date', '-id'], name='susar_keyset_idx'),
+            models.Index(fields=['severity', '-onset_date', '-id'], name='susar_severity_onset_idx'),
+            models.Index(fields=['outcome'], name='susar_outcome_idx'),
+            # Pending follow-ups are a small slice of the table; index only them
+            models.Index(
+                fields=['-onset_date', '-id'], name='susar_pending_onset_idx',
+                condition=models.Q(follow_up_required=True),
+            ),
+            models.Index(
+                fields=['severity'], name='susar_pending_severity_idx',
+                condition=models.Q(follow_up_required=True),
+            ),
+            # Watermark reads of the analytics snapshot
+            models.Index(fields=['updated_at'], name='susar_updated_idx'),
+        ]
     
     def __str__(self):
         return f"{self.susar_id} - {self.participant.participant_id}"
@@ -197,6 +243,15 @@ class StaffAttendance(models.Model):
     class Meta:
         db_table = 'staff_attendance'
         ordering = ['-login_time']
+        indexes = [
+            models.Index(fields=['-login_time', '-id'], name='attendance_keyset_idx'),
+            models.Index(fields=['staff', '-login_time'], name='attendance_staff_login_idx'),
+            # Open sessions (no logout yet), looked up per user at logout
+            models.Index(
+                fields=['staff', '-login_time'], name='attendance_open_idx',
+                condition=models.Q(logout_time__isnull=True),
+            ),
+        ]
     
     def __str__(self):
         return f"{self.staff.username} - {self.login_time.strftime('%Y-%m-%d %H:%M')}"
@@ -223,12 +278,165 @@ class AuditLog(models.Model):
     object_id = models.CharField(max_length=100)
     changes = models.JSONField(blank=True, null=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the entry is built, not when it is inserted, so buffered and
+    # spooled entries keep the time of the event (see writer.py)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
         db_table = 'audit_logs'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='audit_keyset_idx'),
+            # One user's history, newest first (settings exports, activity log)
+            models.Index(fields=['user', '-timestamp', '-id'], name='audit_user_time_idx'),
+            # Action counts over a time range (reports) without touching the table
+            models.Index(fields=['timestamp', 'action'], name='audit_time_action_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user} - {self.action} - {self.model_name} - {self.timestamp}"
 
+
+# Audit log entries moved out of the live table by archive_audit_logs
+class AuditLogArchive(models.Model):
+    # Keeps the id the entry had in audit_logs
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    action = models.CharField(max_length=20, choices=AuditLog.ACTION_CHOICES)
+    model_name = models.CharField(max_length=100)
+    object_id = models.CharField(max_length=100)
+    changes = models.JSONField(blank=True, null=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    timestamp = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'audit_logs_archive'
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='audit_archive_keyset_idx'),
+            models.Index(fields=['user', '-timestamp', '-id'], name='audit_archive_user_time_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} - {self.action} - {self.model_name} - {self.timestamp} (archived)"
+
+
+
+# ============================================
+# Daily Rollups - pre-aggregated trend data
+# ============================================
+
+class DailyEnrollmentRollup(models.Model):
+    study = models.ForeignKey(Study, on_delete=models.CASCADE, related_name='enrollment_rollups')
+    day = models.DateField()
+    enrollments = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'rollup_daily_enrollment'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(fields=['study', 'day'], name='uniq_enrollment_rollup_study_day'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.study_id} - {self.day}: {self.enrollments}"
+
+
+class DailyStatusTransitionRollup(models.Model):
+    study = models.ForeignKey(Study, on_delete=models.CASCADE, related_name='status_transition_rollups')
+    day = models.DateField()
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    transitions = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'rollup_daily_status_transition'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['study', 'day', 'from_status', 'to_status'],
+                name='uniq_transition_rollup_study_day_status'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.study_id} - {self.day}: {self.from_status or '-'} -> {self.to_status}"
+
+
+class DailySUSARRollup(models.Model):
+    study = models.ForeignKey(Study, on_delete=models.CASCADE, related_name='susar_rollups')
+    day = models.DateField()
+    severity = models.CharField(max_length=20)
+    outcome = models.CharField(max_length=20)
+    onsets = models.IntegerField(default=0)
+    detections = models.IntegerField(default=0)
+    
+    class Meta:
+        db_table = 'rollup_daily_susar'
+        ordering = ['day']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['study', 'day', 'severity', 'outcome'],
+                name='uniq_susar_rollup_study_day_class'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.study_id} - {self.day}: {self.severity}/{self.outcome}"
+
+
+# Fuzzy Search Keys - phonetic codes and trigrams of participant names/locations
+class ParticipantSearchKey(models.Model):
+    FIELD_CHOICES = [
+        ('first_name', 'First Name'),
+        ('last_name', 'Last Name'),
+        ('location', 'Location'),
+    ]
+    
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='search_keys')
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    key = models.CharField(max_length=12)
+    
+    class Meta:
+        db_table = 'participant_search_keys'
+        indexes = [
+            models.Index(fields=['field', 'key', 'participant'], name='search_key_lookup_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.participant_id} - {self.field}: {self.key}"
+
+
+# Normalized Phone Numbers - E.164 digits for indexed exact and suffix lookup
+class ParticipantPhone(models.Model):
+    KIND_CHOICES = [
+        ('primary', 'Primary'),
+        ('secondary', 'Secondary'),
+    ]
+    
+    participant = models.ForeignKey(Participant, on_delete=models.CASCADE, related_name='phone_numbers')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    digits = models.CharField(max_length=20, help_text="E.164 digits without the leading +")
+    reversed_digits = models.CharField(max_length=20, help_text="digits reversed, for suffix lookup")
+    
+    class Meta:
+        db_table = 'participant_phones'
+        constraints = [
+            models.UniqueConstraint(fields=['participant', 'kind'], name='uniq_participant_phone_kind'),
+        ]
+        indexes = [
+            models.Index(fields=['digits', 'participant'], name='phone_digits_idx'),
+            models.Index(fields=['reversed_digits', 'participant'], name='phone_reversed_digits_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.participant_id} - {self.kind}: +{self.digits}"
@@ -0,0 +1,275 @@
+# ============================================
+# pagination.py - ClinTrack Keyset Pagination
+# ============================================
+
+"""
+Cursor (keyset) pagination for the long list views.
+
+Django's ``Paginator`` counts the whole result and then skips ``OFFSET``
+rows, so page N reads N pages worth of rows. Keyset pagination instead
+remembers the sort key of the last row shown and asks for the rows after
+it (``WHERE (created_at, id) < (...)``), which the ordering index answers
+directly: every page costs the same as the first one.
+
+Cursors are opaque url-safe tokens. The trade-off is that pages have no
+numbers; templates get next/previous tokens and, optionally, an estimated
+total that is cached per filter instead of being counted on each page.
+"""
+
+import base64
+import hashlib
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+
+from .cache import _cache
+
+
+# Cached totals are reused for this many seconds, whatever is written meanwhile
+ESTIMATED_COUNT_TIMEOUT = 300
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode(payload):
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _decode(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as exc:
+        raise InvalidCursor(token) from exc
+    if not isinstance(payload, dict) or payload.get('d') not in ('next', 'prev'):
+        raise InvalidCursor(token)
+    return payload
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, iterable like a ``Page``"""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate ``queryset`` by ``ordering``, a sequence of field names that
+    must end with a unique field (``'-created_at', '-id'``).
+
+    Set ``estimate_count`` to expose ``paginator.count``, a total cached
+    for ``ESTIMATED_COUNT_TIMEOUT`` seconds per filter. Writes do not reset
+    it, so it can lag by that long, but paging through a busy list counts
+    it once rather than after every write.
+    """
+
+    def __init__(self, queryset, per_page, ordering, estimate_count=False):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = int(per_page)
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering
+        ]
+        self.estimate_count = estimate_count
+        self._count = None
+
+    # ----- cursors -----
+
+    def _key(self, obj):
+        fields = self.queryset.model._meta
+        values = []
+        for name, _ in self.ordering:
+            field = fields.get_field('id' if name == 'pk' else name)
+            values.append(field.value_to_string(obj))
+        return values
+
+    def _cursor(self, direction, obj):
+        return _encode({'d': direction, 'k': self._key(obj)})
+
+    def _values(self, keys):
+        """Cursor key strings converted back to field values"""
+        meta = self.queryset.model._meta
+        return [
+            meta.get_field('id' if name == 'pk' else name).to_python(value)
+            for (name, _), value in zip(self.ordering, keys)
+        ]
+
+    def _after(self, values, backwards):
+        """Condition selecting the rows after (or before) the row with key ``values``"""
+        # (a, b) < (x, y)  ==>  a < x OR (a = x AND b < y)
+        condition = Q()
+        for position, (name, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != backwards else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[position]})
+            for (earlier, _), value in zip(self.ordering[:position], values):
+                clause &= Q(**{earlier: value})
+            condition |= clause
+
+        # Redundant bound on the leading column so the index is range-seeked
+        # instead of scanned from the top
+        name, descending = self.ordering[0]
+        bound = 'lte' if descending != backwards else 'gte'
+        return Q(**{f'{name}__{bound}': values[0]}) & condition
+
+    # ----- pages -----
+
+    def _rows(self, values, backwards, limit):
+        """Up to ``limit`` rows after key ``values`` (from the start if ``None``), in fetch order"""
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+        if backwards:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+    def page(self, cursor=None):
+        """Page after ``cursor``; raises ``InvalidCursor`` for a malformed token"""
+        if not cursor:
+            rows = self._rows(None, False, self.per_page + 1)
+            more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return KeysetPage(
+                rows, self,
+                next_cursor=self._cursor('next', rows[-1]) if more else None,
+            )
+
+        payload = _decode(cursor)
+        keys = payload.get('k')
+        if not isinstance(keys, list) or len(keys) != len(self.ordering):
+            raise InvalidCursor(cursor)
+        backwards = payload['d'] == 'prev'
+
+        try:
+            values = self._values(keys)
+            rows = self._rows(values, backwards, self.per_page + 1)
+        except (ValidationError, ValueError, TypeError) as exc:
+            raise InvalidCursor(cursor) from exc
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return KeysetPage(rows, self)
+
+        if backwards:
+            return KeysetPage(
+                rows, self,
+                next_cursor=self._cursor('next', rows[-1]),
+                previous_cursor=self._cursor('prev', rows[0]) if more else None,
+            )
+        return KeysetPage(
+            rows, self,
+            next_cursor=self._cursor('next', rows[-1]) if more else None,
+            previous_cursor=self._cursor('prev', rows[0]),
+        )
+
+    def get_page(self, cursor=None):
+        """Like ``page`` but falls back to the first page for a bad cursor"""
+        try:
+            return self.page(cursor)
+        except InvalidCursor:
+            return self.page()
+
+    # ----- totals -----
+
+    def _total(self):
+        return self.queryset.count()
+
+    @property
+    def count(self):
+        """Cached total row count, or ``None`` when ``estimate_count`` is off"""
+        if not self.estimate_count:
+            return None
+        if self._count is None:
+            cache = _cache()
+            query = f'{type(self).__name__}:{self.queryset.order_by().values("pk").query}'
+            key = 'clintrack:count:{}'.format(hashlib.md5(query.encode()).hexdigest())
+            self._count = cache.get(key)
+            if self._count is None:
+                self._count = self._total()
+                cache.set(key, self._count, timeout=ESTIMATED_COUNT_TIMEOUT)
+        return self._count
+
+
+class QuerySetSource:
+    """An extra tier for ``TieredKeysetPaginator`` backed by another queryset"""
+
+    def __init__(self, queryset, ordering):
+        self.paginator = KeysetPaginator(queryset, 0, ordering)
+
+    def fetch(self, values, backwards, limit, bound=None):
+        paginator = self.paginator
+        if bound is not None:
+            paginator = KeysetPaginator(
+                paginator.queryset.filter(paginator._after(bound, not backwards)), 0,
+                [('-' if descending else '') + name for name, descending in paginator.ordering]
+            )
+        return paginator._rows(values, backwards, limit)
+
+    def count(self):
+        return self.paginator.queryset.count()
+
+
+class TieredKeysetPaginator(KeysetPaginator):
+    """
+    Keyset pagination across ``queryset`` and further row ``sources`` that
+    share its ordering, such as archived copies of the same table. Pages
+    merge whichever tiers hold rows next to the cursor, so lists run on
+    from live rows into archived ones.
+
+    A source is a queryset or an object with ``fetch(values, backwards,
+    limit, bound)`` and ``count()``. ``fetch`` returns rows in fetch order
+    and, given ``bound``, only rows that come before that key, since rows
+    past it can no longer make the page. Every field in ``ordering`` must
+    sort in the same direction.
+    """
+
+    def __init__(self, queryset, per_page, ordering, sources=(), estimate_count=False):
+        super().__init__(queryset, per_page, ordering, estimate_count)
+        if len({descending for _, descending in self.ordering}) > 1:
+            raise ValueError('Tiered pagination needs a single sort direction')
+        self.sources = [
+            QuerySetSource(source, ordering) if isinstance(source, QuerySet) else source
+            for source in sources
+        ]
+
+    def _sort_key(self, row):
+        return tuple(getattr(row, name) for name, _ in self.ordering)
+
+    def _rows(self, values, backwards, limit):
+        rows = super()._rows(values, backwards, limit)
+        reverse = self.ordering[0][1] != backwards
+        for source in self.sources:
+            bound = list(self._sort_key(rows[limit - 1])) if len(rows) >= limit else None
+            rows.extend(source.fetch(values, backwards, limit, bound))
+            rows.sort(key=self._sort_key, reverse=reverse)
+            del rows[limit:]
+        return rows
+
+    def _total(self):
+        return super()._total() + sum(source.count() for source in self.sources)
@@ -0,0 +1,198 @@
+# ============================================
+# profiling.py - ClinTrack Query Profiler
+# ============================================
+
+"""
+Opt-in per-request SQL profiling.
+
+``QueryProfilerMiddleware`` wraps every database connection with an
+``execute_wrapper`` for the duration of a request and records each
+statement's SQL and time. Statements are fingerprinted (parameters and
+``IN`` lists collapsed) so an N+1 loop shows up as one fingerprint repeated
+many times.
+
+Each request gets ``X-Query-Count``, ``X-Query-Time-Ms`` and
+``X-Query-Duplicates`` headers plus a ``Server-Timing`` entry, and one JSON
+line in the rotating ``CLINTRACK_QUERY_PROFILER_LOG`` file, which the
+``query_report`` command summarises.
+
+The middleware is listed in ``MIDDLEWARE`` permanently but raises
+``MiddlewareNotUsed`` unless ``CLINTRACK_QUERY_PROFILER`` is on, so Django
+drops it at startup and disabled profiling costs nothing per request.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+
+LOGGER_NAME = 'clintrack.queries'
+
+# Entries kept in the log line for the slowest and most repeated statements
+DEFAULT_TOP_STATEMENTS = 5
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def fingerprint(sql):
+    """Short hash of ``sql`` with literals, placeholders and IN lists collapsed"""
+    normalized = _WHITESPACE_RE.sub(' ', sql).strip()
+    normalized = _IN_LIST_RE.sub('IN (...)', normalized)
+    normalized = _LITERAL_RE.sub('?', normalized.replace('%s', '?'))
+    return hashlib.md5(normalized.encode()).hexdigest()[:12], normalized
+
+
+@dataclass
+class QueryProfile:
+    """Statements executed while handling one request"""
+    statements: list = field(default_factory=list)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append((
+                context['connection'].alias, sql, (time.perf_counter() - started) * 1000
+            ))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, _, duration in self.statements)
+
+    def repeated(self):
+        """(fingerprint, normalized sql, count) for statements run more than once"""
+        counts = Counter()
+        samples = {}
+        for _, sql, _ in self.statements:
+            key, normalized = fingerprint(sql)
+            counts[key] += 1
+            samples.setdefault(key, normalized)
+        return [
+            (key, samples[key], count)
+            for key, count in counts.most_common() if count > 1
+        ]
+
+    @property
+    def duplicates(self):
+        """Statements that repeated an earlier fingerprint"""
+        return sum(count - 1 for _, _, count in self.repeated())
+
+    def slowest(self, limit=DEFAULT_TOP_STATEMENTS):
+        return sorted(self.statements, key=lambda statement: -statement[2])[:limit]
+
+    def record(self, top=DEFAULT_TOP_STATEMENTS):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.total_ms, 2),
+            'duplicates': self.duplicates,
+            'repeated': [
+                {'fingerprint': key, 'count': count, 'sql': sql}
+                for key, sql, count in self.repeated()[:top]
+            ],
+            'slowest': [
+                {'db': alias, 'ms': round(duration, 2), 'sql': sql}
+                for alias, sql, duration in self.slowest(top)
+            ],
+        }
+
+
+def profile_queries(profile):
+    """Context manager routing every connection's statements to ``profile``"""
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(profile))
+    return stack
+
+
+def query_logger():
+    """The JSON Lines logger, given its rotating file handler on first use"""
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers:
+        path = Path(getattr(settings, 'CLINTRACK_QUERY_PROFILER_LOG', 'logs/queries.jsonl'))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=getattr(settings, 'CLINTRACK_QUERY_PROFILER_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=getattr(settings, 'CLINTRACK_QUERY_PROFILER_BACKUPS', 5),
+            encoding='utf-8',
+        )
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+class QueryProfilerMiddleware:
+    """Records the SQL each request runs; enabled by ``CLINTRACK_QUERY_PROFILER``"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'CLINTRACK_QUERY_PROFILER', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.top = getattr(settings, 'CLINTRACK_QUERY_PROFILER_TOP', DEFAULT_TOP_STATEMENTS)
+        self.logger = query_logger()
+
+    def __call__(self, request):
+        profile = QueryProfile()
+        started = time.perf_counter()
+        with profile_queries(profile):
+            response = self.get_response(request)
+
+        if response.streaming:
+            # Export rows are read while the body is sent, after this returns
+            response.streaming_content = self._stream(
+                response.streaming_content, profile, request, response, started
+            )
+            return response
+
+        self._annotate(response, profile)
+        self._log(request, response, profile, started)
+        return response
+
+    def _stream(self, content, profile, request, response, started):
+        with profile_queries(profile):
+            yield from content
+        self._log(request, response, profile, started)
+
+    def _annotate(self, response, profile):
+        response['X-Query-Count'] = str(profile.count)
+        response['X-Query-Time-Ms'] = f'{profile.total_ms:.2f}'
+        response['X-Query-Duplicates'] = str(profile.duplicates)
+        timing = f'db;dur={profile.total_ms:.2f};desc="{profile.count} queries"'
+        if response.has_header('Server-Timing'):
+            timing = f'{response["Server-Timing"]}, {timing}'
+        response['Server-Timing'] = timing
+
+    def _log(self, request, response, profile, started):
+        match = request.resolver_match
+        entry = {
+            'timestamp': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'streaming': response.streaming,
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+        entry.update(profile.record(self.top))
+        self.logger.info(json.dumps(entry, default=str))
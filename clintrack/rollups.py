@@ -0,0 +1,264 @@
+# ============================================
+# rollups.py - ClinTrack Daily Rollups
+# ============================================
+
+"""
+Per-day, per-study rollups behind the trend charts.
+
+The rollup tables are maintained incrementally by the model signals in
+``signals.py``. Writes that bypass signals (``bulk_create``, queryset
+``update()``, raw SQL) must be followed by ``rebuild_rollups()`` or the
+``rebuild_rollups`` management command.
+"""
+
+from datetime import datetime
+
+from django.apps import apps as global_apps
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import (
+    Participant, SUSAR, DailyEnrollmentRollup, DailyStatusTransitionRollup, DailySUSARRollup
+)
+
+
+def _as_day(value):
+    """Reduce a date or (aware or naive) datetime to the day it falls on"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            return timezone.localdate(value)
+        return value.date()
+    return value
+
+
+def _bump(model, keys, **deltas):
+    """Add ``deltas`` to the rollup row identified by ``keys``, creating it if needed"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**keys).update(**increments):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**keys, **deltas)
+    except IntegrityError:
+        # Another writer created the row first
+        model.objects.filter(**keys).update(**increments)
+
+
+# ============================================
+# Incremental maintenance
+# ============================================
+
+def participant_state(participant):
+    """The participant fields that feed the enrollment and status rollups"""
+    return {
+        'study_id': participant.study_id,
+        'enrollment_date': _as_day(participant.enrollment_date),
+        'status': participant.status,
+    }
+
+
+def apply_participant_change(old, new, today=None):
+    """
+    Move a participant's contribution from ``old`` to ``new`` state.
+
+    Either side may be ``None`` for a create or a delete.
+    """
+    today = today or timezone.localdate()
+    old_key = (old['study_id'], old['enrollment_date']) if old else None
+    new_key = (new['study_id'], new['enrollment_date']) if new else None
+
+    if old_key != new_key:
+        if old_key and old_key[1]:
+            _bump(DailyEnrollmentRollup, {'study_id': old_key[0], 'day': old_key[1]}, enrollments=-1)
+        if new_key and new_key[1]:
+            _bump(DailyEnrollmentRollup, {'study_id': new_key[0], 'day': new_key[1]}, enrollments=1)
+
+    if new and (old is None or old['status'] != new['status']):
+        _bump(DailyStatusTransitionRollup, {
+            'study_id': new['study_id'],
+            'day': today,
+            'from_status': old['status'] if old else '',
+            'to_status': new['status'],
+        }, transitions=1)
+
+
+def susar_state(susar, study_id=None):
+    """The SUSAR fields that feed the SUSAR rollup"""
+    if study_id is None:
+        study_id = Participant.objects.filter(
+            pk=susar.participant_id
+        ).values_list('study_id', flat=True).first()
+
+    return {
+        'study_id': study_id,
+        'onset_day': _as_day(susar.onset_date),
+        'detection_day': _as_day(susar.detection_date),
+        'severity': susar.severity,
+        'outcome': susar.outcome,
+    }
+
+
+def apply_susar_change(old, new):
+    """Move a SUSAR's onset and detection counts from ``old`` to ``new`` state"""
+    if old == new:
+        return
+
+    for state, sign in ((old, -1), (new, 1)):
+        if not state or state['study_id'] is None:
+            continue
+        classification = {
+            'study_id': state['study_id'],
+            'severity': state['severity'],
+            'outcome': state['outcome'],
+        }
+        if state['onset_day'] == state['detection_day']:
+            _bump(DailySUSARRollup, {**classification, 'day': state['onset_day']},
+                  onsets=sign, detections=sign)
+            continue
+        if state['onset_day']:
+            _bump(DailySUSARRollup, {**classification, 'day': state['onset_day']}, onsets=sign)
+        if state['detection_day']:
+            _bump(DailySUSARRollup, {**classification, 'day': state['detection_day']}, detections=sign)
+
+
+def move_participant_susars(participant_id, old_study_id, new_study_id):
+    """Move the SUSAR counts of a participant who changed study to the new study"""
+    if old_study_id == new_study_id:
+        return
+    susars = SUSAR.objects.filter(participant_id=participant_id).only(
+        'onset_date', 'detection_date', 'severity', 'outcome'
+    )
+    for susar in susars:
+        apply_susar_change(susar_state(susar, old_study_id), susar_state(susar, new_study_id))
+
+
+# ============================================
+# Full rebuild
+# ============================================
+
+def rebuild_rollups(apps=None):
+    """
+    Recompute every rollup table from the raw participant and SUSAR tables.
+
+    Status transition history cannot be recovered from current rows, so the
+    rebuild records each participant's current status as a transition on the
+    day it was created. Accepts a migration ``apps`` registry.
+    """
+    apps = apps or global_apps
+    Participant = apps.get_model('clintrack', 'Participant')
+    SUSAR = apps.get_model('clintrack', 'SUSAR')
+    DailyEnrollmentRollup = apps.get_model('clintrack', 'DailyEnrollmentRollup')
+    DailyStatusTransitionRollup = apps.get_model('clintrack', 'DailyStatusTransitionRollup')
+    DailySUSARRollup = apps.get_model('clintrack', 'DailySUSARRollup')
+
+    with transaction.atomic():
+        DailyEnrollmentRollup.objects.all().delete()
+        DailyStatusTransitionRollup.objects.all().delete()
+        DailySUSARRollup.objects.all().delete()
+
+        enrollments = Participant.objects.filter(
+            enrollment_date__isnull=False
+        ).values('study_id', 'enrollment_date').annotate(
+            count=Count('id')
+        ).order_by()
+        DailyEnrollmentRollup.objects.bulk_create([
+            DailyEnrollmentRollup(
+                study_id=row['study_id'],
+                day=row['enrollment_date'],
+                enrollments=row['count']
+            ) for row in enrollments.iterator()
+        ], batch_size=1000)
+
+        transitions = Participant.objects.annotate(
+            day=TruncDate('created_at')
+        ).values('study_id', 'day', 'status').annotate(
+            count=Count('id')
+        ).order_by()
+        DailyStatusTransitionRollup.objects.bulk_create([
+            DailyStatusTransitionRollup(
+                study_id=row['study_id'],
+                day=row['day'],
+                from_status='',
+                to_status=row['status'],
+                transitions=row['count']
+            ) for row in transitions.iterator()
+        ], batch_size=1000)
+
+        susar_rows = {}
+        for field, counter in (('onset_date', 'onsets'), ('detection_date', 'detections')):
+            grouped = SUSAR.objects.annotate(
+                day=TruncDate(field)
+            ).values('participant__study_id', 'day', 'severity', 'outcome').annotate(
+                count=Count('id')
+            ).order_by()
+            for row in grouped.iterator():
+                key = (row['participant__study_id'], row['day'], row['severity'], row['outcome'])
+                susar_rows.setdefault(key, {'onsets': 0, 'detections': 0})[counter] += row['count']
+        DailySUSARRollup.objects.bulk_create([
+            DailySUSARRollup(
+                study_id=study_id,
+                day=day,
+                severity=severity,
+                outcome=outcome,
+                **counts
+            ) for (study_id, day, severity, outcome), counts in susar_rows.items()
+        ], batch_size=1000)
+
+
+# ============================================
+# Trend queries
+# ============================================
+
+def _rollup_range(queryset, start=None, end=None, study=None):
+    if start:
+        queryset = queryset.filter(day__gte=_as_day(start))
+    if end:
+        queryset = queryset.filter(day__lte=_as_day(end))
+    if study:
+        queryset = queryset.filter(study=study)
+    return queryset
+
+
+def daily_enrollments(start=None, end=None, study=None):
+    """Enrollments per day as a ``{date: count}`` dict (days without enrollments are absent)"""
+    rows = _rollup_range(DailyEnrollmentRollup.objects, start, end, study).values('day').annotate(
+        count=Sum('enrollments')
+    ).order_by('day')
+    return {row['day']: row['count'] for row in rows if row['count']}
+
+
+def monthly_enrollments(start=None, end=None, study=None):
+    """Enrollments per calendar month as ``[{'month': date, 'count': n}]``"""
+    rows = _rollup_range(DailyEnrollmentRollup.objects, start, end, study).annotate(
+        month=TruncMonth('day')
+    ).values('month').annotate(
+        count=Sum('enrollments')
+    ).order_by('month')
+    return [row for row in rows if row['count']]
+
+
+def daily_susars(start=None, end=None, study=None, counter='onsets'):
+    """SUSARs per day by onset (``counter='onsets'``) or detection date"""
+    rows = _rollup_range(DailySUSARRollup.objects, start, end, study).values('day').annotate(
+        count=Sum(counter)
+    ).order_by('day')
+    return {row['day']: row['count'] for row in rows if row['count']}
+
+
+def monthly_susars(start=None, end=None, study=None, counter='onsets'):
+    """SUSARs per calendar month as ``[{'month': date, 'count': n}]``"""
+    rows = _rollup_range(DailySUSARRollup.objects, start, end, study).annotate(
+        month=TruncMonth('day')
+    ).values('month').annotate(
+        count=Sum(counter)
+    ).order_by('month')
+    return [row for row in rows if row['count']]
@@ -0,0 +1,465 @@
+# ============================================
+# search.py - ClinTrack Participant Search
+# ============================================
+
+"""
+Participant lookup backed by the ``participant_search`` FTS5 index.
+
+The index is an external-content FTS5 table over ``participants`` kept in
+sync by triggers (see migration 0003), so every write path, including
+``bulk_create`` and queryset ``update()``, is reflected immediately. Each
+search word matches as a token prefix and results are ranked with bm25.
+
+On databases without the index (anything other than SQLite) the helpers
+fall back to the original ``icontains`` filters.
+
+Phone lookups never go through either text index: ``ParticipantPhone`` holds
+both phone fields normalized to E.164 digits, plus the digits reversed so a
+suffix search ("345678") is an index range seek like an exact one.
+
+Fuzzy matching uses a second, portable index: ``ParticipantSearchKey`` rows
+holding a phonetic code and the trigrams of every name and location word,
+so differently spelled names (Akinyi/Akiny, Wanjiru/Wanjiro) score highly
+without scanning the participants table.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Case, CharField, When, IntegerField, Q, Sum, Value
+from django.db.models.functions import Cast
+from phonenumber_field.phonenumber import to_python as to_phone_number
+
+from .models import Participant, ParticipantSearchKey, ParticipantPhone
+
+
+SEARCH_TABLE = 'participant_search'
+
+# Ranked candidates fetched per search; enough for any list a person pages through
+SEARCH_RESULT_LIMIT = 500
+
+# Search form field -> index columns
+SEARCH_COLUMNS = {
+    'participant_id': ['participant_id'],
+    'first_name': ['first_name'],
+    'last_name': ['last_name'],
+    'phone': ['primary_phone', 'secondary_phone'],
+    'location': ['location', 'sub_location'],
+}
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Free text made only of these characters is treated as a phone number
+PHONE_TEXT_RE = re.compile(r'^\+?[\d\s().-]{4,}$')
+
+# Shortest digit string matched as a phone suffix or prefix
+PHONE_MIN_DIGITS = 4
+
+
+@lru_cache(maxsize=None)
+def _index_exists(alias, name):
+    connection = connections[alias]
+    return SEARCH_TABLE in connection.introspection.table_names()
+
+
+def search_index_available():
+    """Whether the FTS5 participant index exists on the participant database"""
+    alias = router.db_for_read(Participant)
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        return False
+    return _index_exists(alias, str(connection.settings_dict['NAME']))
+
+
+def _prefix_phrase(text):
+    """FTS5 phrase matching the tokens of ``text``, the last one as a prefix"""
+    tokens = TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    return '"{}"*'.format(' '.join(tokens))
+
+
+def build_match_expression(text='', **fields):
+    """
+    FTS5 MATCH expression for free text and/or per-field search terms.
+
+    Every whitespace-separated word of ``text`` must match some column;
+    each entry of ``fields`` must match within its own columns.
+    """
+    clauses = []
+    for word in text.split():
+        phrase = _prefix_phrase(word)
+        if phrase:
+            clauses.append(phrase)
+    for field, value in fields.items():
+        phrase = _prefix_phrase(value or '')
+        if phrase:
+            columns = ' '.join(SEARCH_COLUMNS[field])
+            clauses.append(f'{{{columns}}} : {phrase}')
+    return ' AND '.join(clauses)
+
+
+def _filtered_ids(queryset, connection):
+    """``(sql, params)`` selecting the ids of a filtered ``queryset``, ``None`` if unfiltered"""
+    if queryset is None or not queryset.query.has_filters():
+        return None
+    return queryset.order_by().values('pk').query.get_compiler(connection=connection).as_sql()
+
+
+def ranked_participant_ids(match, queryset=None, limit=None):
+    """
+    Participant ids matching an FTS5 expression, best match first.
+
+    The filters of ``queryset`` (study, status, ...) apply before the
+    ``limit``, so a common name never crowds out the rows being asked for.
+    """
+    connection = connections[router.db_for_read(Participant)]
+    sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    params = [match]
+    restriction = _filtered_ids(queryset, connection)
+    if restriction is not None:
+        sql += f' AND rowid IN ({restriction[0]})'
+        params.extend(restriction[1])
+    with connection.cursor() as cursor:
+        cursor.execute(f'{sql} ORDER BY rank LIMIT %s', [*params, limit or SEARCH_RESULT_LIMIT])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def rebuild_search_index():
+    """Repopulate the FTS5 index from the participants table"""
+    if not search_index_available():
+        return
+    connection = connections[router.db_for_write(Participant)]
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def _insert_rows(model, columns, rows, batch_size):
+    """
+    Plain ``executemany`` INSERT of value tuples into ``model``'s table.
+
+    The index rebuilds write tens of rows per participant; skipping model
+    instances and ``bulk_create`` SQL compilation makes them several times
+    faster.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(model._meta.get_field(column).column) for column in columns),
+        ', '.join(['%s'] * len(columns))
+    )
+    with connection.cursor() as cursor:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(sql, batch)
+                batch = []
+        if batch:
+            cursor.executemany(sql, batch)
+
+
+def order_by_ids(queryset, ids):
+    """Restrict ``queryset`` to ``ids``, preserving their order"""
+    if not ids:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+        output_field=IntegerField()
+    )
+    return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+def search_participants(queryset, text):
+    """
+    Free-text participant search across ids, names, phones and location.
+
+    Text that looks like a phone number matches phones as well as ids and
+    names, phone matches first.
+    """
+    phone_like = PHONE_TEXT_RE.match(text.strip())
+
+    if not search_index_available():
+        query = (
+            Q(participant_id__icontains=text) |
+            Q(first_name__icontains=text) |
+            Q(last_name__icontains=text) |
+            Q(primary_phone__icontains=text)
+        )
+        if phone_like:
+            query |= Q(pk__in=phone_matches(text))
+        return queryset.filter(query)
+
+    ids = []
+    if phone_like:
+        ids = list(queryset.filter(pk__in=phone_matches(text)).order_by().values_list(
+            'pk', flat=True
+        )[:SEARCH_RESULT_LIMIT])
+    match = build_match_expression(text)
+    if match:
+        found = set(ids)
+        ids += [pk for pk in ranked_participant_ids(match, queryset) if pk not in found]
+    return order_by_ids(queryset, ids)
+
+
+def filter_participants(queryset, participant_id='', first_name='', last_name='', phone='', location=''):
+    """Per-field participant search, every non-empty field must match"""
+    fields = {
+        'participant_id': participant_id,
+        'first_name': first_name,
+        'last_name': last_name,
+        'phone': phone,
+        'location': location,
+    }
+
+    if phone:
+        queryset = queryset.filter(pk__in=phone_matches(phone))
+    del fields['phone']
+
+    if not search_index_available():
+        query = Q()
+        if participant_id:
+            query &= Q(participant_id__icontains=participant_id)
+        if first_name:
+            query &= Q(first_name__icontains=first_name)
+        if last_name:
+            query &= Q(last_name__icontains=last_name)
+        if location:
+            query &= Q(location__icontains=location)
+        return queryset.filter(query)
+
+    match = build_match_expression(**fields)
+    if not match:
+        return queryset
+    return order_by_ids(queryset, ranked_participant_ids(match, queryset))
+
+
+# ============================================
+# Normalized phone lookup
+# ============================================
+
+PHONE_FIELDS = [('primary', 'primary_phone'), ('secondary', 'secondary_phone')]
+
+
+def normalize_phone(value):
+    """E.164 digits without the leading + for a number in any common format, '' if none"""
+    if not value:
+        return ''
+    value = str(value)
+    if value.startswith('+'):
+        # International format, as PhoneNumberField stores numbers
+        return re.sub(r'\D', '', value)
+    number = to_phone_number(value, region=settings.PHONENUMBER_DEFAULT_REGION)
+    if number is not None and number.is_valid():
+        return number.as_e164.lstrip('+')
+    return re.sub(r'\D', '', str(value))
+
+
+def _digit_prefix(field, digits):
+    """Index range condition matching values of ``field`` that start with ``digits``"""
+    # ':' sorts directly after '9'
+    return Q(**{f'{field}__gte': digits, f'{field}__lt': digits + ':'})
+
+
+def phone_matches(text):
+    """
+    Subquery of participant ids with a phone matching ``text``.
+
+    Matches the exact normalized number, or numbers ending with (or, when
+    the search includes the country code, starting with) the typed digits.
+    """
+    digits = re.sub(r'\D', '', text)
+    if len(digits) < PHONE_MIN_DIGITS:
+        return ParticipantPhone.objects.none().values('participant_id')
+
+    condition = Q(digits=normalize_phone(text))
+    national = digits.lstrip('0')
+    if len(national) >= PHONE_MIN_DIGITS:
+        condition |= _digit_prefix('reversed_digits', national[::-1])
+    if text.strip().startswith('+'):
+        condition |= _digit_prefix('digits', digits)
+
+    return ParticipantPhone.objects.filter(condition).values('participant_id')
+
+
+PHONE_COLUMNS = ('participant', 'kind', 'digits', 'reversed_digits')
+
+
+def participant_phones(participant_id, values):
+    """``PHONE_COLUMNS`` tuples for one participant from ``{field: value}``"""
+    phones = []
+    for kind, field in PHONE_FIELDS:
+        digits = normalize_phone(values.get(field))
+        if digits:
+            phones.append((participant_id, kind, digits, digits[::-1]))
+    return phones
+
+
+def refresh_phones(participant):
+    """Replace a participant's normalized phone rows"""
+    values = {field: getattr(participant, field) for _, field in PHONE_FIELDS}
+    with transaction.atomic():
+        ParticipantPhone.objects.filter(participant_id=participant.pk).delete()
+        ParticipantPhone.objects.bulk_create([
+            ParticipantPhone(participant_id=participant.pk, kind=kind, digits=digits, reversed_digits=reversed_digits)
+            for _, kind, digits, reversed_digits in participant_phones(participant.pk, values)
+        ])
+
+
+def rebuild_phones(apps=None, batch_size=2000):
+    """Recompute the normalized phones of every participant. Accepts a migration ``apps`` registry."""
+    apps = apps or global_apps
+    Participant = apps.get_model('clintrack', 'Participant')
+    ParticipantPhone = apps.get_model('clintrack', 'ParticipantPhone')
+    fields = [field for _, field in PHONE_FIELDS]
+    # Read the stored text; PhoneNumber objects would re-parse every number
+    raw = {field: Cast(field, CharField()) for field in fields}
+
+    with transaction.atomic():
+        ParticipantPhone.objects.all().delete()
+        rows = Participant.objects.values_list('pk', *[raw[field] for field in fields])
+        _insert_rows(ParticipantPhone, PHONE_COLUMNS, (
+            phone
+            for pk, *values in rows.iterator(chunk_size=batch_size)
+            for phone in participant_phones(pk, dict(zip(fields, values)))
+        ), batch_size)
+
+
+# ============================================
+# Fuzzy name and location matching
+# ============================================
+
+FUZZY_FIELDS = ['first_name', 'last_name', 'location']
+
+# Best-scoring candidates returned by a fuzzy search
+FUZZY_CANDIDATE_LIMIT = 50
+
+# A phonetic code match counts as much as this many shared trigrams
+PHONETIC_WEIGHT = 3
+
+# Spellings that sound alike, applied before building phonetic codes
+PHONETIC_DIGRAPHS = [('ph', 'f'), ('ck', 'k'), ('x', 'ks')]
+PHONETIC_LETTERS = str.maketrans({'c': 'k', 'q': 'k', 'z': 's', 'v': 'f', 'l': 'r'})
+PHONETIC_SILENT = set('aeiouyhw')
+
+
+def _words(text):
+    """Lowercase ASCII words of ``text``"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode()
+    return re.findall(r'[a-z]+', text.lower())
+
+
+def phonetic_code(word):
+    """
+    First letter followed by the consonant skeleton of ``word``.
+
+    Vowels, y, h and w are dropped after the first letter and repeated
+    sounds are collapsed, so Akinyi and Akiny both give ``akn``.
+    """
+    for digraph, replacement in PHONETIC_DIGRAPHS:
+        word = word.replace(digraph, replacement)
+    word = word.translate(PHONETIC_LETTERS)
+    if not word:
+        return ''
+
+    code = word[0]
+    previous = word[0]
+    for letter in word[1:]:
+        if letter not in PHONETIC_SILENT and letter != previous:
+            code += letter
+        previous = letter
+    return code[:8]
+
+
+def trigrams(word):
+    """Padded character trigrams of ``word``"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@lru_cache(maxsize=8192)
+def text_keys(text):
+    """Phonetic (``p:``) and trigram (``t:``) keys for every word of ``text``"""
+    keys = set()
+    for word in _words(text):
+        keys.add(f'p:{phonetic_code(word)}')
+        keys.update(f't:{gram}' for gram in trigrams(word))
+    return frozenset(keys)
+
+
+SEARCH_KEY_COLUMNS = ('participant', 'field', 'key')
+
+
+def participant_search_keys(participant_id, values):
+    """``SEARCH_KEY_COLUMNS`` tuples for one participant from ``{field: text}``"""
+    return [
+        (participant_id, field, key)
+        for field in FUZZY_FIELDS
+        for key in sorted(text_keys(values.get(field)))
+    ]
+
+
+def refresh_search_keys(participant):
+    """Replace a participant's fuzzy search keys"""
+    values = {field: getattr(participant, field) for field in FUZZY_FIELDS}
+    with transaction.atomic():
+        ParticipantSearchKey.objects.filter(participant_id=participant.pk).delete()
+        ParticipantSearchKey.objects.bulk_create([
+            ParticipantSearchKey(participant_id=participant.pk, field=field, key=key)
+            for _, field, key in participant_search_keys(participant.pk, values)
+        ])
+
+
+def rebuild_search_keys(apps=None, batch_size=2000):
+    """Recompute the fuzzy search keys of every participant. Accepts a migration ``apps`` registry."""
+    apps = apps or global_apps
+    Participant = apps.get_model('clintrack', 'Participant')
+    ParticipantSearchKey = apps.get_model('clintrack', 'ParticipantSearchKey')
+
+    with transaction.atomic():
+        ParticipantSearchKey.objects.all().delete()
+        rows = Participant.objects.values_list('pk', *FUZZY_FIELDS)
+        _insert_rows(ParticipantSearchKey, SEARCH_KEY_COLUMNS, (
+            key
+            for pk, *values in rows.iterator(chunk_size=batch_size)
+            for key in participant_search_keys(pk, dict(zip(FUZZY_FIELDS, values)))
+        ), batch_size)
+
+
+def fuzzy_search_participants(queryset, text='', first_name='', last_name='', location=''):
+    """
+    Participants whose names/location sound or are spelled like the search terms.
+
+    Candidates are scored from the key index in one grouped query (phonetic
+    matches weigh PHONETIC_WEIGHT, shared trigrams 1 each) and returned best
+    first. Free ``text`` is matched against every fuzzy field. Only
+    participants in ``queryset`` are scored.
+    """
+    conditions = Q()
+    for field, value in (('first_name', first_name), ('last_name', last_name), ('location', location)):
+        keys = text_keys(value)
+        if keys:
+            conditions |= Q(field=field, key__in=keys)
+    keys = text_keys(text)
+    if keys:
+        conditions |= Q(key__in=keys)
+    if not conditions:
+        return queryset
+
+    candidates = ParticipantSearchKey.objects.filter(conditions)
+    if queryset.query.has_filters():
+        # Score only the participants the caller's filters allow
+        candidates = candidates.filter(participant_id__in=queryset.order_by().values('pk'))
+    scores = candidates.values('participant_id').annotate(
+        score=Sum(Case(
+            When(key__startswith='p:', then=Value(PHONETIC_WEIGHT)),
+            default=Value(1)
+        ))
+    ).filter(score__gt=1).order_by('-score')[:FUZZY_CANDIDATE_LIMIT]
+
+    return order_by_ids(queryset, [row['participant_id'] for row in scores])
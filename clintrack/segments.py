@@ -0,0 +1,404 @@
+# ============================================
+# segments.py - ClinTrack Audit Segments
+# ============================================
+
+"""
+Append-only, compressed columnar files for cold audit history.
+
+``archive_audit_segments`` moves audit entries older than
+``CLINTRACK_AUDIT_SEGMENT_AFTER_DAYS`` out of the database, in segment
+files of at most ``SEGMENT_ROWS`` entries from one month. A segment is a
+small JSON header followed by zlib-compressed column data: ids, user ids
+and timestamps as packed 64-bit integers, action and model name as
+dictionary codes, and the string and JSON columns as JSON lines compressed
+in blocks of ``BLOCK_ROWS`` rows.
+
+``manifest.json`` lists every segment with its time range, id range and
+the users it contains, so a reader opens only segments that can match.
+Rows are stored in (timestamp, id) order: inside a segment the reader
+bisects the key columns to the cursor position, stops once it has enough
+rows and decompresses only the blocks holding those rows. Files are read
+through ``mmap`` and never rewritten.
+
+``SegmentSource`` plugs the segments (and the audit_logs_archive table) into
+``TieredKeysetPaginator`` so audit history pages continue past the live
+table without the views noticing where rows come from.
+"""
+
+import json
+import mmap
+from bisect import bisect_left, bisect_right
+import os
+import struct
+import threading
+import zlib
+from array import array
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+from .models import User, AuditLog
+
+
+MAGIC = b'CTSEG1\n'
+MANIFEST = 'manifest.json'
+COMPRESSION_LEVEL = 6
+
+# Column layout: (attribute, encoding)
+COLUMNS = [
+    ('id', 'int'),
+    ('user_id', 'int'),
+    ('timestamp', 'int'),
+    ('action', 'dict'),
+    ('model_name', 'dict'),
+    ('object_id', 'jsonl'),
+    ('changes', 'jsonl'),
+    ('ip_address', 'jsonl'),
+]
+# Rows per compressed block of a JSON lines column
+BLOCK_ROWS = 1024
+KEY_COLUMNS = ('id', 'user_id', 'timestamp')
+NO_USER = -1
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_manifest_lock = threading.Lock()
+
+
+def segment_dir():
+    return Path(getattr(settings, 'CLINTRACK_AUDIT_SEGMENT_DIR', 'archive/audit'))
+
+
+def to_micros(moment):
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(value):
+    return datetime.fromtimestamp(value // 1_000_000, dt_timezone.utc).replace(microsecond=value % 1_000_000)
+
+
+# ----- manifest -----
+
+def read_manifest():
+    path = segment_dir() / MANIFEST
+    if not path.exists():
+        return {'version': 1, 'segments': []}
+    return _load_manifest(str(path), path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=1)
+def _load_manifest(path, mtime_ns):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def _add_to_manifest(entry):
+    """Append a segment to the manifest, replacing the file atomically"""
+    with _manifest_lock:
+        manifest = dict(read_manifest())
+        manifest['segments'] = manifest['segments'] + [entry]
+        path = segment_dir() / MANIFEST
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=1)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temporary, path)
+
+
+# ----- writing -----
+
+def write_segment(name, rows):
+    """
+    Write ``rows`` (tuples ordered like ``COLUMNS``, timestamps as aware
+    datetimes) to a new segment file and register it in the manifest.
+    Returns the manifest entry.
+    """
+    rows = sorted(rows, key=lambda row: (row[2], row[0]))
+    columns = list(zip(*rows))
+    header = {'rows': len(rows), 'columns': {}, 'dictionaries': {}}
+    blocks = []
+    offset = 0
+
+    for position, (attribute, encoding) in enumerate(COLUMNS):
+        values = columns[position]
+        if attribute == 'timestamp':
+            values = [to_micros(value) for value in values]
+        if attribute == 'user_id':
+            values = [NO_USER if value is None else value for value in values]
+
+        info = {'offset': offset, 'encoding': encoding}
+        if encoding == 'jsonl':
+            # Compact JSON never contains a newline, so each row is one line
+            info['block_rows'] = BLOCK_ROWS
+            info['blocks'] = []
+            for start in range(0, len(values), BLOCK_ROWS):
+                raw = b'\n'.join(
+                    json.dumps(value, separators=(',', ':'), default=str).encode()
+                    for value in values[start:start + BLOCK_ROWS]
+                )
+                block = zlib.compress(raw, COMPRESSION_LEVEL)
+                info['blocks'].append([offset - info['offset'], len(block)])
+                blocks.append(block)
+                offset += len(block)
+        else:
+            if encoding == 'int':
+                raw = array('q', values).tobytes()
+            else:
+                dictionary = sorted(set(values))
+                codes = {value: code for code, value in enumerate(dictionary)}
+                header['dictionaries'][attribute] = dictionary
+                raw = array('H', [codes[value] for value in values]).tobytes()
+            block = zlib.compress(raw, COMPRESSION_LEVEL)
+            blocks.append(block)
+            offset += len(block)
+        info['length'] = offset - info['offset']
+        header['columns'][attribute] = info
+
+    encoded_header = json.dumps(header, separators=(',', ':')).encode()
+    directory = segment_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / name
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'wb') as handle:
+        handle.write(MAGIC)
+        handle.write(struct.pack('<I', len(encoded_header)))
+        handle.write(encoded_header)
+        for block in blocks:
+            handle.write(block)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+    users = sorted({value for value in columns[1] if value is not None})
+    entry = {
+        'file': name,
+        'rows': len(rows),
+        'bytes': path.stat().st_size,
+        'min_timestamp': to_micros(rows[0][2]),
+        'max_timestamp': to_micros(rows[-1][2]),
+        'min_id': min(columns[0]),
+        'max_id': max(columns[0]),
+        'users': users,
+        'has_anonymous': any(value is None for value in columns[1]),
+    }
+    _add_to_manifest(entry)
+    return entry
+
+
+# ----- reading -----
+
+class Segment:
+    """A memory-mapped segment file"""
+
+    def __init__(self, name):
+        self.name = name
+        path = segment_dir() / name
+        with open(path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a ClinTrack segment')
+        start = len(MAGIC)
+        (length,) = struct.unpack_from('<I', self._map, start)
+        self.header = json.loads(self._map[start + 4:start + 4 + length])
+        self._data_start = start + 4 + length
+
+    def _raw(self, start, length):
+        start += self._data_start
+        return zlib.decompress(self._map[start:start + length])
+
+    def column(self, attribute):
+        """Every value of a column"""
+        info = self.header['columns'][attribute]
+        if info['encoding'] == 'jsonl':
+            return [
+                json.loads(line)
+                for block_offset, length in info['blocks']
+                for line in self._raw(info['offset'] + block_offset, length).split(b'\n')
+            ]
+        raw = self._raw(info['offset'], info['length'])
+        if info['encoding'] == 'int':
+            values = array('q')
+            values.frombytes(raw)
+            return values
+        if info['encoding'] == 'dict':
+            codes = array('H')
+            codes.frombytes(raw)
+            dictionary = self.header['dictionaries'][attribute]
+            return [dictionary[code] for code in codes]
+        return json.loads(raw)
+
+    def values(self, attribute, positions):
+        """Values of a column at ``positions`` only, in that order"""
+        info = self.header['columns'][attribute]
+        if info['encoding'] != 'jsonl':
+            column = self.column(attribute)
+            return [column[position] for position in positions]
+        size = info['block_rows']
+        lines = {}
+        for block in sorted({position // size for position in positions}):
+            block_offset, length = info['blocks'][block]
+            lines[block] = self._raw(info['offset'] + block_offset, length).split(b'\n')
+        return [json.loads(lines[position // size][position % size]) for position in positions]
+
+
+@lru_cache(maxsize=32)
+def _segment(name):
+    return Segment(name)
+
+
+@lru_cache(maxsize=16)
+def _key_columns(name):
+    segment = _segment(name)
+    return tuple(segment.column(attribute) for attribute in KEY_COLUMNS)
+
+
+def _entries(name, positions, users):
+    """AuditLog instances (unsaved, with their original ids) for rows at ``positions``"""
+    segment = _segment(name)
+    ids, user_ids, timestamps = _key_columns(name)
+    columns = {
+        attribute: segment.values(attribute, positions)
+        for attribute, _ in COLUMNS if attribute not in KEY_COLUMNS
+    }
+    entries = []
+    for order, position in enumerate(positions):
+        user_id = user_ids[position]
+        entry = AuditLog(
+            id=ids[position],
+            user_id=None if user_id == NO_USER else user_id,
+            action=columns['action'][order],
+            model_name=columns['model_name'][order],
+            object_id=columns['object_id'][order],
+            changes=columns['changes'][order],
+            ip_address=columns['ip_address'][order],
+            timestamp=from_micros(timestamps[position]),
+        )
+        entry.user = users.get(entry.user_id)
+        entry.archived = True
+        entries.append(entry)
+    return entries
+
+
+def read_segments(user_id=None, before=None, after=None, limit=None, newest_first=True):
+    """
+    Archived entries as ``AuditLog`` instances ordered by (timestamp, id),
+    newest first by default.
+
+    ``before`` / ``after`` are exclusive ``(timestamp, id)`` bounds and
+    ``user_id`` restricts to one user; segments the manifest rules out are
+    never opened. Inside a segment the bounds are bisected on the sorted
+    key columns, the scan stops at ``limit`` rows, and only the rows
+    returned have their other columns decoded.
+    """
+    before = (to_micros(before[0]), before[1]) if before else None
+    after = (to_micros(after[0]), after[1]) if after else None
+
+    segments = [
+        entry for entry in read_manifest()['segments']
+        if (user_id is None or user_id in entry['users'])
+        and (before is None or (entry['min_timestamp'], entry['min_id']) < before)
+        and (after is None or (entry['max_timestamp'], entry['max_id']) > after)
+    ]
+    segments.sort(key=lambda entry: entry['max_timestamp'], reverse=newest_first)
+
+    matches = []
+    for entry in segments:
+        # Segments are visited newest (or oldest) first; once enough rows are
+        # held, a segment entirely beyond the last of them cannot contribute
+        if limit is not None and len(matches) >= limit:
+            boundary = matches[limit - 1][0]
+            if newest_first and entry['max_timestamp'] < boundary[0]:
+                break
+            if not newest_first and entry['min_timestamp'] > boundary[0]:
+                break
+
+        ids, users, timestamps = _key_columns(entry['file'])
+
+        def key(position):
+            return timestamps[position], ids[position]
+
+        rows = range(len(ids))
+        low = 0 if after is None else bisect_right(rows, after, key=key)
+        high = len(ids) if before is None else bisect_left(rows, before, key=key)
+
+        found = 0
+        for position in (reversed(rows[low:high]) if newest_first else rows[low:high]):
+            if user_id is not None and users[position] != user_id:
+                continue
+            matches.append((key(position), entry['file'], position))
+            found += 1
+            if found == limit:
+                break
+        matches.sort(reverse=newest_first)
+        if limit is not None:
+            del matches[limit:]
+
+    user_ids = {_key_columns(name)[1][position] for _, name, position in matches}
+    user_ids.discard(NO_USER)
+    users = User.objects.in_bulk(user_ids) if user_ids else {}
+
+    by_segment = {}
+    for order, (_, name, position) in enumerate(matches):
+        by_segment.setdefault(name, []).append((order, position))
+    results = [None] * len(matches)
+    for name, items in by_segment.items():
+        for (order, _), entry in zip(items, _entries(name, [position for _, position in items], users)):
+            results[order] = entry
+    return results
+
+
+def archived_ids(start, end):
+    """Ids already stored in segments for entries with ``start <= timestamp < end``"""
+    start, end = to_micros(start), to_micros(end)
+    ids = set()
+    for entry in read_manifest()['segments']:
+        if entry['max_timestamp'] < start or entry['min_timestamp'] >= end:
+            continue
+        segment_ids, _, timestamps = _key_columns(entry['file'])
+        ids.update(
+            value for value, timestamp in zip(segment_ids, timestamps) if start <= timestamp < end
+        )
+    return ids
+
+
+def archived_action_counts(start, end):
+    """``{action: count}`` over segment entries with ``start <= timestamp < end``"""
+    start, end = to_micros(start), to_micros(end)
+    counts = {}
+    for entry in read_manifest()['segments']:
+        if entry['max_timestamp'] < start or entry['min_timestamp'] >= end:
+            continue
+        timestamps = _key_columns(entry['file'])[2]
+        actions = _segment(entry['file']).column('action')
+        for action, timestamp in zip(actions, timestamps):
+            if start <= timestamp < end:
+                counts[action] = counts.get(action, 0) + 1
+    return counts
+
+
+def archived_count(user_id=None):
+    segments = read_manifest()['segments']
+    if user_id is None:
+        return sum(entry['rows'] for entry in segments)
+    return sum(
+        len([value for value in _key_columns(entry['file'])[1] if value == user_id])
+        for entry in segments if user_id in entry['users']
+    )
+
+
+class SegmentSource:
+    """Segment rows for ``TieredKeysetPaginator``, restricted to one user if given"""
+
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+    def fetch(self, values, backwards, limit, bound=None):
+        if backwards:
+            return read_segments(self.user_id, before=bound, after=values, limit=limit, newest_first=False)
+        return read_segments(self.user_id, before=values, after=bound, limit=limit)
+
+    def count(self):
+        return archived_count(self.user_id)
@@ -0,0 +1,186 @@
+# ============================================
+# signals.py - ClinTrack Model Signals
+# ============================================
+
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.db.models.signals import post_init, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import User, Participant, Study, SUSAR, StaffAttendance
+from . import audit, rollups, search
+from .cache import invalidate_contexts
+
+
+# ============================================
+# Previous state capture
+# ============================================
+
+# Stored participant fields the post_save receivers compare against
+PARTICIPANT_PREVIOUS_FIELDS = [
+    'study_id', 'enrollment_date', 'status',
+    'first_name', 'last_name', 'location',
+    'primary_phone', 'secondary_phone',
+]
+
+
+@receiver(pre_save, sender=Participant)
+def remember_previous_participant(sender, instance, raw=False, **kwargs):
+    """
+    Keep the stored fields so post_save receivers can see what changed:
+    from the audit snapshot taken when the row was loaded, or from the
+    table for instances that weren't loaded with those fields
+    """
+    instance._previous = None
+    if raw or not instance.pk:
+        return
+    loaded = getattr(instance, '_audit_snapshot', {})
+    if not instance._state.adding and all(field in loaded for field in PARTICIPANT_PREVIOUS_FIELDS):
+        instance._previous = SimpleNamespace(**{field: loaded[field] for field in PARTICIPANT_PREVIOUS_FIELDS})
+        return
+    instance._previous = Participant.objects.filter(pk=instance.pk).only(
+        *PARTICIPANT_PREVIOUS_FIELDS
+    ).first()
+
+
+# ============================================
+# Daily rollup maintenance
+# ============================================
+
+@receiver(post_save, sender=Participant)
+def update_participant_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    with transaction.atomic():
+        rollups.apply_participant_change(
+            rollups.participant_state(previous) if previous else None,
+            rollups.participant_state(instance)
+        )
+        # SUSAR counts are kept per study too and follow the participant
+        if previous and previous.study_id != instance.study_id:
+            rollups.move_participant_susars(instance.pk, previous.study_id, instance.study_id)
+
+
+@receiver(post_delete, sender=Participant)
+def remove_participant_rollups(sender, instance, **kwargs):
+    rollups.apply_participant_change(rollups.participant_state(instance), None)
+
+
+@receiver(pre_save, sender=SUSAR)
+def remember_susar_rollup_state(sender, instance, raw=False, **kwargs):
+    """Capture the stored state so post_save can move its rollup contribution"""
+    instance._rollup_previous = None
+    if raw or not instance.pk:
+        return
+    previous = SUSAR.objects.filter(pk=instance.pk).select_related('participant').only(
+        'participant__study_id', 'onset_date', 'detection_date', 'severity', 'outcome'
+    ).first()
+    if previous is not None:
+        instance._rollup_previous = rollups.susar_state(previous, previous.participant.study_id)
+
+
+@receiver(post_save, sender=SUSAR)
+def update_susar_rollups(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    study_id = instance.participant.study_id if SUSAR.participant.is_cached(instance) else None
+    rollups.apply_susar_change(
+        getattr(instance, '_rollup_previous', None),
+        rollups.susar_state(instance, study_id)
+    )
+
+
+@receiver(post_delete, sender=SUSAR)
+def remove_susar_rollups(sender, instance, **kwargs):
+    rollups.apply_susar_change(rollups.susar_state(instance), None)
+
+
+# ============================================
+# Fuzzy search key maintenance
+# ============================================
+
+@receiver(post_save, sender=Participant)
+def update_participant_search_keys(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if created or previous is None or any(
+        getattr(previous, field) != getattr(instance, field)
+        for field in search.FUZZY_FIELDS
+    ):
+        search.refresh_search_keys(instance)
+
+
+@receiver(post_save, sender=Participant)
+def update_participant_phones(sender, instance, created=False, raw=False, **kwargs):
+    """Renormalize the participant's phone numbers when either one changes"""
+    if raw:
+        return
+    previous = getattr(instance, '_previous', None)
+    if not created and previous is not None and all(
+        getattr(previous, field) == getattr(instance, field)
+        for _, field in search.PHONE_FIELDS
+    ):
+        return
+    search.refresh_phones(instance)
+
+
+# ============================================
+# Context cache invalidation
+# ============================================
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=SUSAR)
+@receiver(post_delete, sender=SUSAR)
+@receiver(post_save, sender=Study)
+@receiver(post_delete, sender=Study)
+@receiver(post_save, sender=StaffAttendance)
+@receiver(post_delete, sender=StaffAttendance)
+def invalidate_cached_contexts(sender, **kwargs):
+    invalidate_contexts()
+
+
+# ============================================
+# Audit log target cache
+# ============================================
+
+@receiver(post_save, sender=Participant)
+@receiver(post_delete, sender=Participant)
+@receiver(post_save, sender=SUSAR)
+@receiver(post_delete, sender=SUSAR)
+@receiver(post_save, sender=Study)
+@receiver(post_delete, sender=Study)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_audit_target(sender, instance, **kwargs):
+    audit.forget_target(instance)
+
+
+# ============================================
+# Audit change capture
+# ============================================
+
+@receiver(post_init, sender=Participant)
+@receiver(post_init, sender=Study)
+@receiver(post_init, sender=SUSAR)
+def snapshot_audited_fields(sender, instance, **kwargs):
+    audit.snapshot(instance)
+
+
+@receiver(post_save, sender=Participant)
+@receiver(post_save, sender=Study)
+@receiver(post_save, sender=SUSAR)
+def audit_saved_object(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    audit.record_save(instance, created)
+
+
+@receiver(post_delete, sender=Participant)
+@receiver(post_delete, sender=Study)
+@receiver(post_delete, sender=SUSAR)
+def audit_deleted_object(sender, instance, **kwargs):
+    audit.record_delete(instance)
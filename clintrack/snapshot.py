@@ -0,0 +1,440 @@
+# ============================================
+# snapshot.py - ClinTrack Analytics Snapshot
+# ============================================
+
+"""
+Columnar, memory-mapped copy of the participant and SUSAR fields that the
+reports, dashboards and chart APIs aggregate over.
+
+Every table is stored as one ``.npy`` array per column under
+``CLINTRACK_SNAPSHOT_DIR``, in a subdirectory per database: ids and foreign keys as integers (0 for NULL),
+dates and timestamps as ``datetime64`` in local time, and choice or text
+fields (status, gender, location, severity, outcome) as ``int32`` codes
+into dictionaries kept in ``manifest.json``. Readers open the arrays with
+``numpy.load(mmap_mode='r')``, so worker processes share one copy through
+the page cache and building the DataFrames copies nothing.
+
+``refresh`` updates the snapshot incrementally. Only rows whose
+``updated_at`` is past the table's watermark (less ``WATERMARK_OVERLAP``
+for writes that committed late) are read and merged by id into the
+previous arrays; deletions are found by comparing the row count with the
+table and, only when they differ, the id list. A changed table is written
+to a new directory and published by replacing the manifest atomically.
+Queryset ``update()`` on participants and SUSARs stamps ``updated_at``
+(see ``AuditedQuerySet``); writes that bypass it (raw SQL,
+``bulk_update``) need ``refresh(full=True)`` or
+``manage.py refresh_snapshot --full``.
+
+``current()`` is what the analytics read. It never refreshes on the
+request path: a snapshot older than ``CLINTRACK_SNAPSHOT_MAX_AGE`` seconds
+is served as it is while a background thread refreshes it, and ``None``
+(query the tables) is returned until the first one is built, or when
+``CLINTRACK_SNAPSHOT_ENABLED`` is off. Set
+``CLINTRACK_SNAPSHOT_REFRESH_ASYNC = False`` (e.g. in tests) to refresh
+in place instead.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import BooleanField, ExpressionWrapper, Q
+from django.utils import timezone
+
+from .cache import invalidate_contexts
+from .models import Participant, SUSAR
+
+
+MANIFEST = 'manifest.json'
+LOCK = 'refresh.lock'
+
+# Re-read rows updated this long before the watermark: auto_now stamps a
+# row when it is saved, which can be a moment before its transaction commits
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# A lock older than this was left by a crashed refresh
+LOCK_TIMEOUT = 600
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# Column reads
+# ============================================
+
+def column_frame(queryset, *columns, dates=(), datetimes=(), booleans=(), categories=()):
+    """
+    ``queryset.values_list(*columns)`` as a DataFrame, read with one query
+    and parsed column-wise. ``datetimes`` are converted to naive local time.
+    """
+    queryset = queryset.order_by()
+    sql, params = queryset.values_list(*columns).query.get_compiler(queryset.db).as_sql()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    frame = pd.DataFrame.from_records(rows, columns=list(columns))
+    local = timezone.get_current_timezone_name()
+    for name in dates:
+        frame[name] = pd.to_datetime(frame[name], format='ISO8601')
+    for name in datetimes:
+        frame[name] = pd.to_datetime(frame[name], format='ISO8601', utc=True).dt.tz_convert(local).dt.tz_localize(None)
+    for name in booleans:
+        frame[name] = frame[name].astype(bool)
+    for name in categories:
+        frame[name] = frame[name].astype('category')
+    return frame
+
+
+# ============================================
+# Tables
+# ============================================
+
+@dataclass(frozen=True)
+class Table:
+    """A snapshotted model: ``columns`` are ``(name, kind)`` pairs"""
+    name: str
+    model: type
+    columns: tuple
+    annotations: tuple = ()
+
+    def queryset(self):
+        return self.model.objects.annotate(**{name: expression() for name, expression in self.annotations})
+
+    def kind(self, *kinds):
+        return [name for name, kind in self.columns if kind in kinds]
+
+
+PARTICIPANTS = Table('participants', Participant, (
+    ('id', 'int'),
+    ('study_id', 'int'),
+    ('created_by_id', 'int'),
+    ('status', 'code'),
+    ('gender', 'code'),
+    ('location', 'code'),
+    ('date_of_birth', 'date'),
+    ('enrollment_date', 'date'),
+    ('created_at', 'datetime'),
+))
+
+SUSARS = Table('susars', SUSAR, (
+    ('id', 'int'),
+    ('participant_id', 'int'),
+    ('severity', 'code'),
+    ('outcome', 'code'),
+    ('follow_up_required', 'bool'),
+    ('has_notes', 'bool'),
+    ('onset_date', 'datetime'),
+    ('detection_date', 'datetime'),
+    ('created_at', 'datetime'),
+), annotations=(
+    ('has_notes', lambda: ExpressionWrapper(Q(follow_up_notes__gt=''), output_field=BooleanField())),
+))
+
+TABLES = (PARTICIPANTS, SUSARS)
+
+DTYPES = {'int': np.int64, 'bool': np.bool_, 'code': np.int32, 'date': 'datetime64[s]', 'datetime': 'datetime64[us]'}
+
+
+def snapshot_dir():
+    """Snapshot directory of the participants' database, so databases never share one"""
+    connection = connections[router.db_for_read(Participant)]
+    digest = hashlib.md5(str(connection.settings_dict['NAME']).encode()).hexdigest()[:12]
+    return Path(getattr(settings, 'CLINTRACK_SNAPSHOT_DIR', 'archive/snapshot')) / f'{connection.alias}-{digest}'
+
+
+def enabled():
+    return getattr(settings, 'CLINTRACK_SNAPSHOT_ENABLED', True)
+
+
+# ============================================
+# Manifest
+# ============================================
+
+def read_manifest():
+    path = snapshot_dir() / MANIFEST
+    if not path.exists():
+        return None
+    return _load_manifest(str(path), path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=1)
+def _load_manifest(path, mtime_ns):
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def _write_manifest(manifest):
+    path = snapshot_dir() / MANIFEST
+    temporary = path.with_suffix('.tmp')
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=1)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+
+def _lock(directory):
+    """Take the refresh lock, False if another refresh holds it"""
+    path = directory / LOCK
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        try:
+            if time.time() - path.stat().st_mtime < LOCK_TIMEOUT:
+                return False
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        return _lock(directory)
+
+
+# ============================================
+# Refreshing
+# ============================================
+
+def _encode(values, dictionary):
+    """``int32`` codes of ``values`` in ``dictionary``, extended with values it lacks"""
+    values = values.fillna('').astype(str)
+    dictionary = dictionary + sorted(set(values.unique()) - set(dictionary))
+    return pd.Categorical(values, categories=dictionary).codes.astype(np.int32), dictionary
+
+
+def _fetch(table, dictionaries, since=None):
+    """
+    Arrays of the rows of ``table`` updated at or after ``since`` (every
+    row when ``None``), sorted by id, and the newest ``updated_at`` read
+    """
+    queryset = table.queryset()
+    if since is not None:
+        queryset = queryset.filter(updated_at__gte=since)
+    frame = column_frame(
+        queryset, *[name for name, _ in table.columns], 'updated_at',
+        dates=table.kind('date'), datetimes=table.kind('datetime'), booleans=table.kind('bool'),
+    )
+
+    arrays = {}
+    for name, kind in table.columns:
+        if kind == 'int':
+            arrays[name] = pd.to_numeric(frame[name]).fillna(0).to_numpy(np.int64)
+        elif kind == 'code':
+            arrays[name], dictionaries[name] = _encode(frame[name], dictionaries.get(name, []))
+        else:
+            arrays[name] = frame[name].to_numpy().astype(DTYPES[kind])
+
+    order = np.argsort(arrays['id'], kind='stable')
+    newest = pd.to_datetime(frame['updated_at'], format='ISO8601', utc=True).max()
+    return {name: values[order] for name, values in arrays.items()}, newest
+
+
+def _merge(old, new):
+    """``old`` arrays with the rows of ``new`` added or replacing theirs, by id"""
+    keep = ~np.isin(old['id'], new['id'])
+    merged = {name: np.concatenate([old[name][keep], new[name]]) for name in old}
+    order = np.argsort(merged['id'], kind='stable')
+    return {name: values[order] for name, values in merged.items()}
+
+
+def _same(old, new):
+    return len(old['id']) == len(new['id']) and all(
+        np.array_equal(old[name], new[name], equal_nan=old[name].dtype.kind == 'M') for name in old
+    )
+
+
+def _load_arrays(table, entry):
+    directory = snapshot_dir() / entry['path']
+    return {name: np.load(directory / f'{name}.npy', mmap_mode='r') for name, _ in table.columns}
+
+
+def _write_arrays(table, arrays):
+    path = f'{table.name}-{timezone.now():%Y%m%dT%H%M%S%f}'
+    directory = snapshot_dir() / path
+    directory.mkdir(parents=True)
+    for name, values in arrays.items():
+        with open(directory / f'{name}.npy', 'wb') as handle:
+            np.save(handle, values)
+            handle.flush()
+            os.fsync(handle.fileno())
+    return path
+
+
+def _refresh_table(table, entry):
+    """New manifest entry for ``table``, the number of rows read and whether anything changed"""
+    dictionaries = dict(entry['dictionaries']) if entry else {}
+    watermark = entry['watermark'] if entry else None
+    since = datetime.fromisoformat(watermark) - WATERMARK_OVERLAP if watermark else None
+    changed, newest = _fetch(table, dictionaries, since)
+
+    old = _load_arrays(table, entry) if entry else None
+    arrays = _merge(old, changed) if old is not None else changed
+
+    # Deleted rows: the id list is only read when the counts disagree
+    if len(arrays['id']) != table.model.objects.count():
+        live = np.fromiter(table.model.objects.order_by().values_list('id', flat=True), dtype=np.int64)
+        keep = np.isin(arrays['id'], live)
+        arrays = {name: values[keep] for name, values in arrays.items()}
+
+    if pd.notna(newest):
+        watermark = max(filter(None, [watermark, newest.isoformat()]), key=datetime.fromisoformat)
+    read = len(changed['id'])
+    if old is not None and _same(old, arrays):
+        return {**entry, 'watermark': watermark}, read, False
+
+    return {
+        'path': _write_arrays(table, arrays),
+        'previous': entry['path'] if entry else None,
+        'rows': len(arrays['id']),
+        'watermark': watermark,
+        'dictionaries': dictionaries,
+    }, read, True
+
+
+def refresh(full=False):
+    """
+    Bring the snapshot up to date, rebuilding it from scratch if ``full``.
+
+    Returns ``{table: (rows read, rows held)}``, or ``None`` when another
+    refresh is already running. Cached contexts are invalidated when any
+    table changed.
+    """
+    directory = snapshot_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    if not _lock(directory):
+        return None
+
+    try:
+        manifest = read_manifest()
+        time_zone = timezone.get_current_timezone_name()
+        previous = {} if full or manifest is None or manifest['time_zone'] != time_zone else manifest['tables']
+
+        tables, summary, changed = {}, {}, False
+        for table in TABLES:
+            entry, read, table_changed = _refresh_table(table, previous.get(table.name))
+            tables[table.name] = entry
+            summary[table.name] = (read, entry['rows'])
+            changed = changed or table_changed
+
+        _write_manifest({
+            'version': 1,
+            'time_zone': time_zone,
+            'refreshed_at': timezone.now().isoformat(),
+            'tables': tables,
+        })
+
+        # Keep the previous generation for readers that opened the old manifest
+        keep = {entry[key] for entry in tables.values() for key in ('path', 'previous') if entry.get(key)}
+        for child in directory.iterdir():
+            if child.is_dir() and child.name not in keep:
+                shutil.rmtree(child, ignore_errors=True)
+    finally:
+        (directory / LOCK).unlink(missing_ok=True)
+
+    if changed:
+        invalidate_contexts()
+    return summary
+
+
+# ============================================
+# Reading
+# ============================================
+
+@dataclass
+class Snapshot:
+    participants: pd.DataFrame
+    susars: pd.DataFrame
+    refreshed_at: datetime
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def _frame(table, entry):
+    arrays = _load_arrays(table, entry)
+    return pd.DataFrame({
+        name: pd.Categorical.from_codes(arrays[name], categories=entry['dictionaries'][name])
+        if kind == 'code' else arrays[name]
+        for name, kind in table.columns
+    }, copy=False)
+
+
+def _load(manifest):
+    """DataFrames over the memory-mapped arrays of ``manifest``, built once per process"""
+    key = tuple(manifest['tables'][table.name]['path'] for table in TABLES)
+    with _loaded_lock:
+        if _loaded.get('key') != key:
+            participants = _frame(PARTICIPANTS, manifest['tables'][PARTICIPANTS.name])
+            susars = _frame(SUSARS, manifest['tables'][SUSARS.name])
+
+            # SUSARs take the study of their participant as of this snapshot
+            ids, studies = participants.id.to_numpy(), participants.study_id.to_numpy()
+            owners = susars.participant_id.to_numpy()
+            study = np.zeros(len(owners), dtype=np.int64)
+            if len(ids):
+                position = np.searchsorted(ids, owners).clip(0, len(ids) - 1)
+                study = np.where(ids[position] == owners, studies[position], 0)
+
+            _loaded.update(key=key, frames=(participants, susars.assign(study=study)))
+        participants, susars = _loaded['frames']
+    return Snapshot(participants, susars, datetime.fromisoformat(manifest['refreshed_at']))
+
+
+def _stale(manifest):
+    if manifest is None or manifest['time_zone'] != timezone.get_current_timezone_name():
+        return True
+    age = timezone.now() - datetime.fromisoformat(manifest['refreshed_at'])
+    return age > timedelta(seconds=getattr(settings, 'CLINTRACK_SNAPSHOT_MAX_AGE', 60))
+
+
+_refreshing = threading.Lock()
+
+
+def _refresh_in_background():
+    """Start a refresh thread unless this process is already running one"""
+    if not _refreshing.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            refresh()
+        except Exception:
+            logger.exception('Background snapshot refresh failed')
+        finally:
+            connections.close_all()
+            _refreshing.release()
+
+    threading.Thread(target=run, name='clintrack-snapshot', daemon=True).start()
+
+
+def current():
+    """
+    The snapshot, possibly up to one refresh behind: one older than
+    ``CLINTRACK_SNAPSHOT_MAX_AGE`` seconds is returned while a background
+    refresh runs. ``None`` when snapshots are disabled or none has been
+    built yet.
+    """
+    if not enabled():
+        return None
+    manifest = read_manifest()
+    if _stale(manifest):
+        if getattr(settings, 'CLINTRACK_SNAPSHOT_REFRESH_ASYNC', True):
+            _refresh_in_background()
+        else:
+            refresh()
+            manifest = read_manifest()
+    if manifest is None or manifest['time_zone'] != timezone.get_current_timezone_name():
+        return None
+    return _load(manifest)
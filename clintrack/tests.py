@@ -1,3 +1,1119 @@
-from django.test import TestCase
+from datetime import date, timedelta
+import csv
+import io
+import json
+import logging
+from pathlib import Path
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Q, QuerySet
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, audit, search, segments, snapshot
+from .audit import TargetCache, resolve_targets, suspend_capture
+from .cache import VERSION_KEY, cached_context, context_version, invalidate_contexts
+from .cohorts import age_histogram, elapsed_stats, lost_to_follow_up
+from .metrics import collect_dashboard_metrics, participant_counts, study_stats
+from .pagination import InvalidCursor, KeysetPaginator, TieredKeysetPaginator
+from .profiling import LOGGER_NAME, QueryProfile, QueryProfilerMiddleware, fingerprint, profile_queries
+from .models import (
+    User, Study, Participant, SUSAR, StaffAttendance, AuditLog, AuditLogArchive,
+    DailyEnrollmentRollup, DailySUSARRollup,
+)
+from .rollups import rebuild_rollups
+from .views import coordinator_dashboard_stats
+from .writer import BufferedWriter, defer_write
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False, CLINTRACK_SNAPSHOT_ENABLED=False)
+class QueryPlanTests(TestCase):
+    """The SUSAR and attendance views reach their rows through the indexes added for them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', password='x', role='admin')
+        study = Study.objects.create(name='Plan Study', code='PLAN')
+        participant = Participant.objects.create(
+            participant_id='PLAN-001', study=study, first_name='Ann', last_name='Otieno',
+            location='Kisumu', status='active',
+        )
+        now = timezone.now()
+        for number, severity in enumerate(['mild', 'moderate', 'severe', 'life_threatening']):
+            SUSAR.objects.create(
+                susar_id=f'SUSAR-{number}', participant=participant, event_description='Event',
+                onset_date=now - timedelta(days=number), severity=severity,
+                actions_taken='None', follow_up_required=number % 2 == 0,
+            )
+        for hours in range(4):
+            StaffAttendance.objects.create(
+                staff=cls.user, login_time=now - timedelta(hours=hours),
+                logout_time=None if hours == 0 else now - timedelta(hours=hours, minutes=-30),
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def plans(self, table, method, url, data=None):
+        """EXPLAIN QUERY PLAN of every SELECT/UPDATE against ``table`` run by one request"""
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if not many and sql.lstrip().upper().startswith(('SELECT', 'UPDATE')) and f'"{table}"' in sql:
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = getattr(self.client, method)(url, data or {})
+        self.assertLess(response.status_code, 400)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plans.append(' / '.join(row[-1] for row in cursor.fetchall()))
+        return plans
+
+    def assertUsesIndex(self, plans, index):
+        self.assertTrue(
+            any(f'INDEX {index}' in plan for plan in plans),
+            f'{index} not used by any of:\n' + '\n'.join(plans),
+        )
+
+    def test_susars_pending(self):
+        plans = self.plans('susars', 'get', reverse('susars_pending'))
+        self.assertUsesIndex(plans, 'susar_pending_onset_idx')
+
+    def test_susars_list_severity_filter(self):
+        plans = self.plans('susars', 'get', reverse('susars_list'), {'severity': 'severe'})
+        self.assertUsesIndex(plans, 'susar_severity_onset_idx')
+
+    def test_coordinator_dashboard(self):
+        plans = self.plans('susars', 'get', reverse('coordinator_dashboard'))
+        self.assertUsesIndex(plans, 'susar_pending_onset_idx')
+        self.assertUsesIndex(plans, 'susar_pending_severity_idx')
+
+    def test_reports_read_susars_once(self):
+        # Every SUSAR chart comes from one columnar read; the other query
+        # is the recent SUSARs table
+        plans = self.plans('susars', 'get', reverse('reports_index'))
+        self.assertEqual(len(plans), 2, plans)
+        self.assertUsesIndex(plans, 'susar_keyset_idx')
+
+    def test_logout(self):
+        plans = self.plans('staff_attendance', 'get', reverse('logout'))
+        self.assertUsesIndex(plans, 'attendance_open_idx')
+
+    def test_revoke_all_sessions(self):
+        plans = self.plans('staff_attendance', 'post', reverse('revoke_all_sessions'))
+        self.assertUsesIndex(plans, 'attendance_open_idx')
+
+    def test_users_settings(self):
+        plans = self.plans('staff_attendance', 'get', reverse('users_settings'))
+        self.assertUsesIndex(plans, 'attendance_open_idx')
+        self.assertUsesIndex(plans, 'attendance_staff_login_idx')
+
+    def test_attendance_list(self):
+        plans = self.plans('staff_attendance', 'get', reverse('attendance_list'))
+        self.assertUsesIndex(plans, 'attendance_keyset_idx')
+
+    def test_coordinator_breakdown_counts_each_participant_once(self):
+        # One participant with four SUSARs
+        study_data = json.loads(coordinator_dashboard_stats()['study_data_json'])
+        self.assertEqual((study_data['participant_counts'], study_data['susar_counts']), ([1], [4]))
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class SnapshotTests(TestCase):
+    """The analytics snapshot follows the tables and gives the same figures"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('analyst', password='x', role='admin')
+        cls.study = Study.objects.create(name='Snap Study', code='SNAP')
+        other = Study.objects.create(name='Other Study', code='OTHER')
+        cls.participants = [
+            Participant.objects.create(
+                participant_id=f'SNAP-{number:03}', study=study, first_name='Ann', last_name='Otieno',
+                location=location, status=status, gender=gender, created_by=cls.user,
+                date_of_birth=date(1990 - number, 1, 1), enrollment_date=date(2026, 1 + number, 1),
+            )
+            for number, (study, location, status, gender) in enumerate([
+                (cls.study, 'Kilifi', 'active', 'F'),
+                (cls.study, 'Kilifi', 'completed', 'M'),
+                (cls.study, 'Mtwapa', 'lost', 'F'),
+                (other, 'Nyali', 'active', 'M'),
+            ])
+        ]
+        SUSAR.objects.create(
+            susar_id='SNAP-SUSAR', participant=cls.participants[3], event_description='Event',
+            onset_date=timezone.now(), severity='severe', actions_taken='None', follow_up_notes='Called',
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(
+            CLINTRACK_SNAPSHOT_DIR=directory.name, CLINTRACK_SNAPSHOT_MAX_AGE=3600,
+            CLINTRACK_SNAPSHOT_REFRESH_ASYNC=False,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def test_incremental_refresh(self):
+        self.assertEqual(snapshot.refresh(), {'participants': (4, 4), 'susars': (1, 1)})
+
+        # Rows last updated before the watermark are not read again
+        Participant.objects.filter(pk__in=[p.pk for p in self.participants[1:]]).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        first = self.participants[0]
+        first.status = 'withdrawn'
+        first.save()
+        self.assertEqual(snapshot.refresh()['participants'], (1, 4))
+        participants = snapshot.current().participants.set_index('id')
+        self.assertEqual(participants.status[first.pk], 'withdrawn')
+
+        Participant.objects.filter(pk=self.participants[2].pk).delete()
+        self.assertEqual(snapshot.refresh()['participants'], (1, 3))
+        self.assertNotIn(self.participants[2].pk, snapshot.current().participants.id.tolist())
+
+    def test_queryset_update_is_picked_up(self):
+        Participant.objects.exclude(pk=self.participants[0].pk).update(
+            updated_at=timezone.now() - timedelta(days=1)
+        )
+        snapshot.refresh()
+        # update() stamps updated_at, so the row is read again with the recent one
+        Participant.objects.filter(pk=self.participants[1].pk).update(status='withdrawn')
+        self.assertEqual(snapshot.refresh()['participants'], (2, 4))
+        participants = snapshot.current().participants.set_index('id')
+        self.assertEqual(participants.status[self.participants[1].pk], 'withdrawn')
+
+    def test_stale_snapshot_is_served_while_refreshing(self):
+        snapshot.refresh()
+        Participant.objects.filter(pk=self.participants[0].pk).update(status='withdrawn')
+        with override_settings(CLINTRACK_SNAPSHOT_MAX_AGE=0, CLINTRACK_SNAPSHOT_REFRESH_ASYNC=True), \
+                mock.patch.object(snapshot, '_refresh_in_background') as refresh:
+            participants = snapshot.current().participants.set_index('id')
+        refresh.assert_called_once_with()
+        self.assertEqual(participants.status[self.participants[0].pk], 'active')
+
+    def test_one_snapshot_per_database(self):
+        with mock.patch.dict(connection.settings_dict, NAME='other.sqlite3'):
+            other = snapshot.snapshot_dir()
+        self.assertNotEqual(snapshot.snapshot_dir(), other)
+        self.assertEqual(snapshot.snapshot_dir().parent, other.parent)
+
+    def test_susars_follow_their_participant(self):
+        susars = snapshot.current().susars
+        self.assertEqual(susars.study.tolist(), [self.participants[3].study_id])
+        self.assertEqual(susars.has_notes.tolist(), [True])
+
+    def test_figures_match_the_tables(self):
+        now = timezone.now()
+        from_snapshot = (
+            collect_dashboard_metrics(user=self.user, now=now), study_stats(),
+            study_stats([self.study.pk]), participant_counts('location'),
+        )
+        with override_settings(CLINTRACK_SNAPSHOT_ENABLED=False):
+            from_tables = (
+                collect_dashboard_metrics(user=self.user, now=now), study_stats(),
+                study_stats([self.study.pk]), participant_counts('location'),
+            )
+        self.assertEqual(from_snapshot, from_tables)
+
+    def test_reports_only_look_up_rows(self):
+        snapshot.refresh()
+        self.client.force_login(self.user)
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if '"participants"' in sql or '"susars"' in sql:
+                statements.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(reverse('reports_index'))
+        self.assertEqual(response.status_code, 200)
+        # Besides the grouped lost-to-follow-up query, only the recent SUSARs
+        # table and its participants are read from the tables
+        grouped = [sql for sql in statements if ' GROUP BY ' in sql]
+        self.assertEqual(len(grouped), 1)
+        self.assertIn('"participants"."status" = %s', grouped[0])
+        self.assertTrue(all(' LIMIT ' in sql for sql in statements if sql not in grouped), statements)
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class ContextCacheTests(TestCase):
+    """Cached dashboard contexts are dropped when the data behind them changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cached', password='x', role='staff')
+        cls.study = Study.objects.create(name='Cached Study', code='CCH')
+        cls.participant = Participant.objects.create(
+            participant_id='CCH-001', study=cls.study, first_name='Ann', last_name='Otieno', location='Kisumu',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.builds = 0
+
+    def context(self):
+        def build():
+            self.builds += 1
+            return {'builds': self.builds}
+        return cached_context('staff_dashboard', build, role='staff', user=self.user)
+
+    def test_saves_invalidate_the_dashboard_context(self):
+        writes = {
+            'participant': lambda: Participant.objects.filter(pk=self.participant.pk).first().save(),
+            'susar': lambda: SUSAR.objects.create(
+                susar_id='CCH-S1', participant=self.participant, event_description='Event',
+                onset_date=timezone.now(), severity='mild', actions_taken='None',
+            ),
+            'attendance': lambda: StaffAttendance.objects.create(staff=self.user, login_time=timezone.now()),
+        }
+        self.assertEqual(self.context(), self.context())
+        for name, write in writes.items():
+            with self.subTest(name):
+                builds = self.builds
+                write()
+                self.assertEqual(self.context(), {'builds': builds + 1})
+                self.assertEqual(self.context(), {'builds': builds + 1})
+
+    def test_evicted_version_does_not_revive_old_entries(self):
+        self.context()
+        version = context_version()
+        invalidate_contexts()
+        cache.delete(VERSION_KEY)
+        self.assertGreater(context_version(), version + 1)
+        cache.delete(VERSION_KEY)
+        invalidate_contexts()
+        self.assertGreater(context_version(), version + 1)
+        self.assertEqual(self.context(), {'builds': 2})
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class RollupTests(TestCase):
+    """Signal-maintained rollups agree with a rebuild from the raw tables"""
+
+    def rollup_rows(self):
+        return sorted(
+            DailySUSARRollup.objects.filter(Q(onsets__gt=0) | Q(detections__gt=0)).values_list(
+                'study__code', 'day', 'severity', 'outcome', 'onsets', 'detections'
+            )
+        )
+
+    def test_susar_counts_follow_participant_to_new_study(self):
+        first = Study.objects.create(name='First', code='FIRST')
+        second = Study.objects.create(name='Second', code='SECOND')
+        participant = Participant.objects.create(
+            participant_id='ROLL-001', study=first, first_name='Ann', last_name='Otieno', location='Kilifi',
+        )
+        SUSAR.objects.create(
+            susar_id='ROLL-SUSAR', participant=participant, event_description='Event',
+            onset_date=timezone.now() - timedelta(days=2), severity='severe', actions_taken='None',
+        )
+        self.assertEqual({row[0] for row in self.rollup_rows()}, {'FIRST'})
+
+        participant.study = second
+        participant.save()
+        maintained = self.rollup_rows()
+        self.assertEqual({row[0] for row in maintained}, {'SECOND'})
+
+        rebuild_rollups()
+        self.assertEqual(self.rollup_rows(), maintained)
+
+    def enrollment_rows(self):
+        return sorted(
+            DailyEnrollmentRollup.objects.filter(enrollments__gt=0).values_list('study__code', 'day', 'enrollments')
+        )
+
+    def test_edits_and_deletes_match_a_rebuild(self):
+        study = Study.objects.create(name='Rolling', code='ROLL')
+        participants = [
+            Participant.objects.create(
+                participant_id=f'ROLL-1{number}', study=study, first_name='Ann', last_name='Otieno',
+                location='Kilifi', enrollment_date=date(2026, 3, 1 + number),
+            )
+            for number in range(3)
+        ]
+        susar = SUSAR.objects.create(
+            susar_id='ROLL-S1', participant=participants[0], event_description='Event',
+            onset_date=timezone.now() - timedelta(days=3), severity='mild', actions_taken='None',
+        )
+        participants[1].enrollment_date = date(2026, 3, 1)
+        participants[1].save()
+        participants[2].delete()
+        susar.severity = 'severe'
+        susar.outcome = 'recovered'
+        susar.save()
+        maintained = self.enrollment_rows(), self.rollup_rows()
+        self.assertEqual(maintained[0], [('ROLL', date(2026, 3, 1), 2)])
+
+        rebuild_rollups()
+        self.assertEqual((self.enrollment_rows(), self.rollup_rows()), maintained)
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class SearchTests(TestCase):
+    """Participant search by id, name, phone and sound-alike spelling"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('searcher', password='x', role='admin')
+        cls.kilifi = Study.objects.create(name='Kilifi Study', code='KLF')
+        cls.mombasa = Study.objects.create(name='Mombasa Study', code='MSA')
+        people = [
+            ('KLF001-0042', cls.kilifi, 'Akinyi', 'Otieno', '+254712345678'),
+            ('KLF001-0043', cls.kilifi, 'Akinyi', 'Wanjiru', '+254722000111'),
+            ('KLF001-0044', cls.kilifi, 'Akinyi', 'Kamau', '+254733000222'),
+            ('MSA001-0001', cls.mombasa, 'Akinyi', 'Mwangi', '+254744000333'),
+        ]
+        cls.participants = [
+            Participant.objects.create(
+                participant_id=participant_id, study=study, first_name=first_name, last_name=last_name,
+                primary_phone=phone, location='Kilifi', status='active',
+            )
+            for participant_id, study, first_name, last_name, phone in people
+        ]
+
+    def ids(self, queryset):
+        return [participant.participant_id for participant in queryset]
+
+    def test_numeric_id_fragment(self):
+        # Digits-only text is also a phone search, but must still match ids
+        found = search.search_participants(Participant.objects.all(), '0042')
+        self.assertEqual(self.ids(found), ['KLF001-0042'])
+
+    def test_phone_in_local_format(self):
+        for text in ['0712 345 678', '0712-345678', '345678', '+254712345678']:
+            found = search.search_participants(Participant.objects.all(), text)
+            self.assertEqual(self.ids(found), ['KLF001-0042'], text)
+
+    def test_name_search_ranks_and_filters(self):
+        found = search.search_participants(Participant.objects.all(), 'akin wanj')
+        self.assertEqual(self.ids(found), ['KLF001-0043'])
+        self.assertEqual(self.ids(search.search_participants(Participant.objects.all(), 'zzz')), [])
+
+    def test_filters_apply_before_result_limit(self):
+        match = search.build_match_expression(first_name='akinyi')
+        mombasa = Participant.objects.filter(study=self.mombasa)
+        self.assertEqual(search.ranked_participant_ids(match, mombasa, limit=1), [self.participants[3].pk])
+
+    def test_fuzzy_filters_apply_before_candidate_limit(self):
+        mombasa = Participant.objects.filter(study=self.mombasa)
+        # KLF001-0042 scores best on both names but is outside the filter
+        with mock.patch.object(search, 'FUZZY_CANDIDATE_LIMIT', 1):
+            found = search.fuzzy_search_participants(mombasa, first_name='Akinyi', last_name='Otieno')
+        self.assertEqual(self.ids(found), ['MSA001-0001'])
+
+    def test_fuzzy_spelling_variants(self):
+        found = search.fuzzy_search_participants(Participant.objects.all(), last_name='Wanjiro')
+        self.assertEqual(self.ids(found)[0], 'KLF001-0043')
+
+    def test_participant_list_filters_search_results(self):
+        self.client.force_login(self.user)
+        with mock.patch.object(search, 'SEARCH_RESULT_LIMIT', 1):
+            response = self.client.get(reverse('participant_list'), {'search': 'akinyi', 'study': self.mombasa.pk})
+        self.assertEqual(self.ids(response.context['page_obj']), ['MSA001-0001'])
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class PaginationTests(TestCase):
+    """Keyset pages and their cached totals"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pager', password='x', role='admin')
+        for number in range(3):
+            Study.objects.create(name=f'Study {number}', code=f'S{number}')
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, paginator):
+        """Every page forwards from the first, then backwards from the last"""
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        backwards = [pages[-1]]
+        while backwards[-1].has_previous():
+            backwards.append(paginator.page(backwards[-1].previous_cursor))
+        return [list(page) for page in pages], [list(page) for page in reversed(backwards)]
+
+    def test_cursors_walk_forwards_and_back(self):
+        for number in range(3, 7):
+            Study.objects.create(name=f'Study {number}', code=f'S{number}')
+        studies = Study.objects.filter(code__startswith='S')
+        forwards, backwards = self.walk(KeysetPaginator(studies, 3, ('-id',)))
+        self.assertEqual([len(page) for page in forwards], [3, 3, 1])
+        self.assertEqual(sum(forwards, []), list(studies.order_by('-id')))
+        self.assertEqual(backwards, forwards)
+
+    def test_bad_cursor_falls_back_to_the_first_page(self):
+        paginator = KeysetPaginator(Study.objects.all(), 2, ('-id',))
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+        self.assertEqual(list(paginator.get_page('not-a-cursor')), list(paginator.page()))
+
+    def test_tiered_pages_merge_live_archived_and_segment_rows(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        now = timezone.now()
+        with override_settings(CLINTRACK_AUDIT_SEGMENT_DIR=directory.name):
+            # Hours ago per tier, interleaved so every page mixes tiers
+            for hours in (1, 4):
+                AuditLog.objects.create(action='view', model_name='Live', object_id=str(hours),
+                                        timestamp=now - timedelta(hours=hours))
+            for hours in (2, 5):
+                AuditLogArchive.objects.create(id=50_000 + hours, action='view', model_name='Archived',
+                                               object_id=str(hours), timestamp=now - timedelta(hours=hours))
+            segments.write_segment('audit-paging.seg', [
+                (60_000 + hours, None, now - timedelta(hours=hours), 'view', 'Segment', str(hours), None, None)
+                for hours in (3, 6)
+            ])
+            paginator = TieredKeysetPaginator(
+                AuditLog.objects.filter(model_name='Live'), 2, ('-timestamp', '-id'),
+                sources=[AuditLogArchive.objects.all(), segments.SegmentSource()], estimate_count=True,
+            )
+            forwards, backwards = self.walk(paginator)
+            count = paginator.count
+
+        self.assertEqual([[log.object_id for log in page] for page in forwards], [['1', '2'], ['3', '4'], ['5', '6']])
+        self.assertEqual(
+            [[log.model_name for log in page] for page in backwards],
+            [[log.model_name for log in page] for page in forwards],
+        )
+        self.assertEqual(count, 6)
+
+    def test_cached_total_survives_writes(self):
+        studies = Study.objects.filter(code__startswith='S')
+        self.assertEqual(KeysetPaginator(studies, 2, ('-id',), estimate_count=True).count, 3)
+        Study.objects.create(name='Study 3', code='S3')
+        # Same filter: the cached total is reused until it expires
+        self.assertEqual(KeysetPaginator(studies, 2, ('-id',), estimate_count=True).count, 3)
+        self.assertEqual(KeysetPaginator(studies.filter(code='S3'), 2, ('-id',), estimate_count=True).count, 1)
+
+    def test_audit_total_is_opt_in(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('audit_logs'))
+        self.assertIsNone(response.context['page_obj'].paginator.count)
+        response = self.client.get(reverse('audit_logs'), {'total': '1'})
+        self.assertEqual(response.context['page_obj'].paginator.count, AuditLog.objects.count())
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class ExportTests(TestCase):
+    """Streamed CSV / JSON Lines exports"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = {
+            role: User.objects.create_user(f'exporter-{role}', password='x', role=role)
+            for role in ['admin', 'coordinator', 'staff', 'viewer']
+        }
+        study = Study.objects.create(name='Export Study', code='EXP')
+        Participant.objects.create(
+            participant_id='EXP-001', study=study, first_name='Ann', last_name='Otieno',
+            location='Kisumu', status='active',
+        )
+        Participant.objects.create(
+            participant_id='EXP-002', study=study, first_name='Ben, Jr', last_name='Mwangi',
+            location='Kisumu', status='withdrawn', gender='M', date_of_birth=date(1990, 5, 17),
+        )
+
+    def export(self, role, dataset, **params):
+        self.client.force_login(self.users[role])
+        return self.client.get(reverse('export_records', args=[dataset]), params)
+
+    def test_viewers_and_staff_cannot_export(self):
+        for role in ['staff', 'viewer']:
+            for dataset in ['participants', 'susars']:
+                response = self.export(role, dataset)
+                self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_csv_shows_choice_labels_and_quotes_values(self):
+        response = self.export('admin', 'participants', status='withdrawn')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        header, row = rows[0], dict(zip(rows[0], rows[1]))
+        self.assertEqual(header[:3], ['Participant ID', 'Study', 'First Name'])
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+            (row['First Name'], row['Gender'], row['Status'], row['Date of Birth']),
+            ('Ben, Jr', 'Male', 'Withdrawn', '1990-05-17'),
+        )
+
+    def test_jsonl_streams_one_object_per_row(self):
+        response = self.export('admin', 'participants', format='jsonl')
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row['Participant ID'] for row in rows], ['EXP-002', 'EXP-001'])
+        self.assertEqual(rows[1]['Gender'], 'Prefer not to say')
+
+    def test_unknown_dataset_or_format(self):
+        self.assertEqual(self.export('admin', 'studies').status_code, 404)
+        self.assertEqual(self.export('admin', 'participants', format='xlsx').status_code, 404)
+
+    def test_coordinators_export_participants(self):
+        response = self.export('coordinator', 'participants')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'EXP-001', b''.join(response.streaming_content))
+        response = self.export('coordinator', 'audit')
+        self.assertRedirects(response, reverse('dashboard'), fetch_redirect_response=False)
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class AuditTierTests(TestCase):
+    """Audit history in the live table, the archive table and segment files"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(CLINTRACK_AUDIT_SEGMENT_DIR=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('auditor', password='x', role='admin')
+        now = timezone.now()
+        AuditLog.objects.create(user=self.user, action='update', model_name='Live', object_id='1')
+        AuditLogArchive.objects.create(
+            id=10_000, user=self.user, action='update', model_name='Archived', object_id='2',
+            timestamp=now - timedelta(days=60),
+        )
+        segments.write_segment('audit-test.seg', [
+            (20_000, self.user.pk, now - timedelta(days=200), 'create', 'Segment', '3', None, None),
+        ])
+
+    def exported(self, response):
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_activity_log_includes_archived_entries(self):
+        self.client.force_login(self.user)
+        lines = self.exported(self.client.get(reverse('download_activity_log')))
+        self.assertEqual([line.split(',')[2] for line in lines[1:]], ['Live', 'Archived', 'Segment'])
+
+    def test_audit_export_reads_every_tier(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_records', args=['audit']), {'format': 'jsonl'})
+        rows = [json.loads(line) for line in self.exported(response)]
+        self.assertEqual([row['Model'] for row in rows], ['Live', 'Archived', 'Segment'])
+        self.assertEqual({row['User'] for row in rows}, {'auditor'})
+
+    def test_segment_reads_seek_and_decode_only_returned_rows(self):
+        start = timezone.now() - timedelta(days=400)
+        rows = [
+            (30_000 + number, self.user.pk, start + timedelta(hours=number), 'update', 'Many', str(number),
+             {'number': number}, '10.0.0.1')
+            for number in range(10)
+        ]
+        with mock.patch.object(segments, 'BLOCK_ROWS', 4):
+            segments.write_segment('audit-many.seg', rows)
+        before = (rows[7][2], rows[7][0])
+        with mock.patch.object(segments.Segment, 'column', autospec=True, side_effect=segments.Segment.column) as column:
+            found = segments.read_segments(before=before, after=(rows[1][2], rows[1][0]), limit=3)
+        self.assertEqual([entry.changes for entry in found], [{'number': 6}, {'number': 5}, {'number': 4}])
+        self.assertNotIn('changes', [call.args[1] for call in column.call_args_list])
+
+        oldest = segments.read_segments(after=(rows[1][2], rows[1][0]), limit=2, newest_first=False)
+        self.assertEqual([entry.object_id for entry in oldest], ['2', '3'])
+
+    def test_archive_segments_in_batches(self):
+        start = timezone.now() - timedelta(days=400)
+        for number in range(5):
+            AuditLog.objects.create(
+                user=self.user, action='create', model_name='Old', object_id=str(number),
+                timestamp=start + timedelta(minutes=number),
+            )
+        with mock.patch('clintrack.management.commands.archive_audit_segments.SEGMENT_ROWS', 2):
+            call_command('archive_audit_segments', older_than_days=30, stdout=io.StringIO())
+        self.assertFalse(AuditLog.objects.filter(model_name='Old').exists())
+        self.assertFalse(AuditLogArchive.objects.exists())
+        # Three batches of the old month, one for the archived entry
+        names = [entry['file'] for entry in segments.read_manifest()['segments']]
+        self.assertEqual(len([name for name in names if name != 'audit-test.seg']), 4)
+        archived = segments.read_segments(self.user.pk, newest_first=False)
+        self.assertEqual([entry.model_name for entry in archived], ['Old'] * 5 + ['Segment', 'Archived'])
+
+    def test_report_audit_summary_counts_every_tier(self):
+        now = timezone.now()
+        summary = analytics.audit_summary(now - timedelta(days=365), now + timedelta(days=1))
+        self.assertEqual(summary, [{'action': 'update', 'count': 2}, {'action': 'create', 'count': 1}])
+        summary = analytics.audit_summary(now - timedelta(days=90), now + timedelta(days=1))
+        self.assertEqual(summary, [{'action': 'update', 'count': 2}])
+
+
+class AnalyticsTests(TestCase):
+    """Report computations over participant frames"""
+
+    def test_daily_series_is_daily_up_to_the_point_limit(self):
+        start = pd.Timestamp('2024-01-01')
+        days = pd.Series(pd.to_datetime(['2024-01-01', '2024-12-31', '2024-12-31']))
+        # 2024 has 366 days, exactly REPORT_MAX_DAILY_POINTS
+        series = analytics.daily_series(days, start, pd.Timestamp('2024-12-31'))
+        self.assertEqual(len(series), 366)
+        self.assertEqual(series[-1], {'date': '2024-12-31', 'count': 2})
+        series = analytics.daily_series(days, start, pd.Timestamp('2025-01-01'))
+        self.assertEqual(len(series), 53)
+        self.assertEqual(sum(point['count'] for point in series), 3)
+
+
+class WriterTests(TestCase):
+    """Buffered audit and attendance inserts and the spool they fall back to"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('writer', password='x', role='staff')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = Path(directory.name) / 'spool.jsonl'
+        settings = override_settings(CLINTRACK_WRITE_SPOOL=str(self.spool))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # Rows are queued directly so no background thread is started
+        self.writer = BufferedWriter()
+
+    def test_flush_inserts_queued_rows_in_one_batch_per_model(self):
+        for number in range(3):
+            self.writer.queue.put(AuditLog(user=self.user, action='view', model_name='User', object_id=str(number)))
+        self.writer.queue.put(StaffAttendance(staff=self.user, login_time=timezone.now()))
+        with self.assertNumQueries(4):  # savepoint, two inserts, release
+            self.assertEqual(self.writer.flush(), 4)
+        self.assertEqual(AuditLog.objects.filter(model_name='User').count(), 3)
+        self.assertEqual(self.writer.flush(), 0)
+
+    def test_failed_batch_is_spooled_and_replayed(self):
+        # The spool stores timestamps to the millisecond (DjangoJSONEncoder)
+        moment = timezone.now() - timedelta(minutes=5)
+        moment = moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+        self.writer.queue.put(AuditLog(
+            user=self.user, action='update', model_name='Participant', object_id='7',
+            changes={'status': {'from': 'active', 'to': 'lost'}}, ip_address='10.0.0.1', timestamp=moment,
+        ))
+        with mock.patch.object(QuerySet, 'bulk_create', side_effect=OperationalError('database is locked')), \
+                self.assertLogs('clintrack.writer', 'ERROR'):
+            self.writer.flush()
+        self.assertFalse(AuditLog.objects.exists())
+        self.assertEqual(len(self.spool.read_text().splitlines()), 1)
+
+        self.assertEqual(self.writer.replay_spool(), 1)
+        entry = AuditLog.objects.get()
+        self.assertEqual((entry.user, entry.timestamp, entry.ip_address), (self.user, moment, '10.0.0.1'))
+        self.assertEqual(entry.changes, {'status': {'from': 'active', 'to': 'lost'}})
+        self.assertFalse(self.spool.exists())
+        self.assertEqual(self.writer.replay_spool(), 0)
+
+    def test_replay_loses_the_race_for_the_spool_quietly(self):
+        self.spool.write_text('')
+        # Another process renames the spool between any check and our rename
+        with mock.patch.object(Path, 'replace', side_effect=FileNotFoundError):
+            self.assertEqual(self.writer.replay_spool(), 0)
+
+    @override_settings(CLINTRACK_WRITE_ASYNC=False)
+    def test_synchronous_mode_saves_at_once(self):
+        defer_write(StaffAttendance(staff=self.user, login_time=timezone.now()))
+        self.assertTrue(StaffAttendance.objects.filter(staff=self.user).exists())
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class AuditCaptureTests(TestCase):
+    """Saves, deletes and queryset updates record what changed"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.study = Study.objects.create(name='Audit Study', code='AUD')
+
+    def create(self, number, **fields):
+        return Participant.objects.create(
+            participant_id=f'AUD-{number:03}', study=self.study, first_name='Ann', last_name='Otieno',
+            location='Kilifi', **fields,
+        )
+
+    def entries(self, action):
+        return list(AuditLog.objects.filter(model_name='Participant', action=action).order_by('id'))
+
+    def test_save_records_only_changed_fields(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            participant = self.create(1)
+        created = self.entries('create')[0]
+        self.assertEqual(created.changes['first_name'], 'Ann')
+        self.assertNotIn('updated_at', created.changes)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            participant.first_name = 'Anne'
+            participant.status = 'lost'
+            participant.save()
+            participant.save()  # nothing changed since the previous save
+        [updated] = self.entries('update')
+        self.assertEqual(updated.object_id, str(participant.pk))
+        self.assertEqual(updated.changes, {
+            'first_name': {'from': 'Ann', 'to': 'Anne'}, 'status': {'from': 'screening', 'to': 'lost'},
+        })
+
+    def test_queryset_update_records_rows_that_changed(self):
+        screening = self.create(1)
+        self.create(2, status='completed')
+        with self.captureOnCommitCallbacks(execute=True):
+            Participant.objects.filter(study=self.study).update(status='completed')
+        # The row that already had the value is not logged
+        self.assertEqual(
+            [(entry.object_id, entry.changes) for entry in self.entries('update')],
+            [(str(screening.pk), {'status': {'from': 'screening', 'to': 'completed'}})],
+        )
+
+    def test_queryset_update_stamps_updated_at(self):
+        participant = self.create(1)
+        long_ago = timezone.now() - timedelta(days=30)
+        Participant.objects.filter(pk=participant.pk).update(updated_at=long_ago)
+        participant.refresh_from_db()
+        self.assertEqual(participant.updated_at, long_ago)
+
+        with suspend_capture():
+            Participant.objects.filter(pk=participant.pk).update(status='active')
+        participant.refresh_from_db()
+        self.assertGreater(participant.updated_at, long_ago + timedelta(days=29))
+
+    def test_save_compares_against_the_loaded_row(self):
+        participant = Participant.objects.get(pk=self.create(1).pk)
+        participant.status = 'active'
+        with CaptureQueriesContext(connection) as queries:
+            participant.save()
+        reads = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT') and 'FROM "participants"' in query['sql']
+        ]
+        self.assertEqual(reads, [])
+        self.assertEqual(participant._previous.status, 'screening')
+
+    def test_snapshot_follows_reloads_and_suspended_saves(self):
+        participant = self.create(1)
+        Participant.objects.filter(pk=participant.pk).update(status='active')
+        participant.refresh_from_db()
+        with suspend_capture():
+            participant.status = 'completed'
+            participant.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            participant.status = 'withdrawn'
+            participant.save()
+        self.assertEqual(participant._previous.status, 'completed')
+        self.assertEqual(self.entries('update')[-1].changes, {'status': {'from': 'completed', 'to': 'withdrawn'}})
+
+    def test_delete_and_suspended_capture(self):
+        participant = self.create(1)
+        pk = participant.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            with suspend_capture():
+                self.create(2)
+            participant.delete()
+        self.assertEqual([entry.object_id for entry in self.entries('delete')], [str(pk)])
+        self.assertEqual(self.entries('create'), [])
+
+    def test_archive_moves_whole_months(self):
+        now = timezone.now()
+        old = AuditLog.objects.create(action='view', model_name='Old', object_id='1', timestamp=now - timedelta(days=100))
+        recent = AuditLog.objects.create(action='view', model_name='Recent', object_id='2', timestamp=now)
+        call_command('archive_audit_logs', keep_months=1, stdout=io.StringIO())
+
+        archived = AuditLogArchive.objects.get()
+        self.assertEqual((archived.id, archived.model_name, archived.timestamp), (old.id, 'Old', old.timestamp))
+        self.assertEqual(list(AuditLog.objects.filter(model_name__in=['Old', 'Recent'])), [recent])
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False)
+class AuditTargetTests(TestCase):
+    """Audit log subjects are resolved in batches and remembered until they change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('resolver', password='x', role='admin')
+        cls.study = Study.objects.create(name='Target Study', code='TGT')
+        cls.participants = [
+            Participant.objects.create(
+                participant_id=f'TGT-{number}', study=cls.study, first_name='Ann', last_name='Otieno',
+                location='Kilifi',
+            )
+            for number in range(2)
+        ]
+
+    def setUp(self):
+        audit.target_cache.clear()
+        self.addCleanup(audit.target_cache.clear)
+
+    def logs(self, *targets):
+        return [AuditLog(action='view', model_name=name, object_id=str(pk)) for name, pk in targets]
+
+    def page(self):
+        return self.logs(
+            ('Participant', self.participants[0].pk), ('Participant', self.participants[1].pk),
+            ('Participant', self.participants[0].pk), ('Study', self.study.pk), ('User', self.user.pk),
+            ('Participant', 999_999), ('Session', 1), ('Study', 'abc'),
+        )
+
+    def test_one_query_per_model_then_none(self):
+        with self.assertNumQueries(3):
+            logs = resolve_targets(self.page())
+        self.assertEqual(
+            [(log.target_display, log.target_url_name) for log in logs],
+            [('TGT-0', 'participant_detail'), ('TGT-1', 'participant_detail'), ('TGT-0', 'participant_detail'),
+             ('TGT', 'study_detail'), ('resolver', None), (None, 'participant_detail'), (None, None), (None, None)],
+        )
+        # Missing objects are remembered too
+        with self.assertNumQueries(0):
+            self.assertEqual([log.target_display for log in resolve_targets(self.page())][:6],
+                             [log.target_display for log in logs][:6])
+
+    def test_saves_and_deletes_drop_cached_targets(self):
+        resolve_targets(self.page())
+        self.study.code = 'TGT2'
+        self.study.save()
+        participant = self.participants[1]
+        pk = participant.pk
+        participant.delete()
+        with self.assertNumQueries(2):
+            logs = resolve_targets(self.logs(('Study', self.study.pk), ('Participant', pk), ('User', self.user.pk)))
+        self.assertEqual([log.target_display for log in logs], ['TGT2', None, 'resolver'])
+
+    def test_lru_hits_and_evictions(self):
+        lru = TargetCache(2)
+        lru.set(('study', 1), 'A')
+        lru.set(('study', 2), 'B')
+        self.assertEqual(lru.get(('study', 1)), 'A')  # now the most recently used
+        lru.set(('study', 3), 'C')
+        self.assertEqual(len(lru), 2)
+        self.assertIs(lru.get(('study', 2)), audit._MISSING)
+        self.assertEqual((lru.get(('study', 1)), lru.get(('study', 3))), ('A', 'C'))
+        lru.set(('study', 3), None)
+        lru.discard(('study', 1))
+        self.assertEqual((len(lru), lru.get(('study', 3))), (1, None))
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False, CLINTRACK_QUERY_PROFILER=True)
+class ProfilerTests(TestCase):
+    """Per-request query headers, the JSON Lines log and its report"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('profiled', password='x', role='admin')
+        study = Study.objects.create(name='Profiled Study', code='PRO')
+        Participant.objects.create(
+            participant_id='PRO-001', study=study, first_name='Ann', last_name='Otieno', location='Kisumu',
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = Path(directory.name) / 'queries.jsonl'
+        settings = override_settings(CLINTRACK_QUERY_PROFILER_LOG=str(self.log))
+        settings.enable()
+        self.addCleanup(settings.disable)
+        # query_logger() attaches its file handler on first use
+        logger = logging.getLogger(LOGGER_NAME)
+        handlers = logger.handlers[:]
+        logger.handlers.clear()
+        self.addCleanup(setattr, logger, 'handlers', handlers)
+        self.addCleanup(lambda: [handler.close() for handler in logger.handlers])
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def entries(self):
+        return [json.loads(line) for line in self.log.read_text().splitlines()]
+
+    def test_headers_and_one_log_line_per_request(self):
+        response = self.client.get(reverse('participant_list'))
+        [entry] = self.entries()
+        self.assertGreater(entry['queries'], 0)
+        self.assertEqual(response['X-Query-Count'], str(entry['queries']))
+        self.assertEqual(response['X-Query-Duplicates'], str(entry['duplicates']))
+        self.assertIn(f'desc="{entry["queries"]} queries"', response['Server-Timing'])
+        self.assertEqual((entry['method'], entry['view'], entry['status']), ('GET', 'participant_list', 200))
+
+    def test_streamed_responses_are_logged_once_sent(self):
+        response = self.client.get(reverse('export_records', args=['participants']))
+        self.assertFalse(self.log.exists() and self.log.read_text())
+        b''.join(response.streaming_content)
+        [entry] = self.entries()
+        self.assertTrue(entry['streaming'])
+        self.assertGreater(entry['queries'], 0)
+
+    def test_repeated_statements_share_a_fingerprint(self):
+        first = fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'Ann' LIMIT 21")
+        second = fingerprint("SELECT *\n  FROM t WHERE id IN (%s) AND name = 'O''Neil' LIMIT 5")
+        self.assertEqual(first, second)
+        self.assertEqual(first[1], 'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+
+        profile = QueryProfile()
+        with profile_queries(profile):
+            for pk in range(3):
+                list(Participant.objects.filter(pk=pk))
+            Study.objects.count()
+        self.assertEqual((profile.count, profile.duplicates), (4, 2))
+        self.assertEqual([count for _, _, count in profile.repeated()], [3])
+
+    @override_settings(CLINTRACK_QUERY_PROFILER=False)
+    def test_disabled_profiler_is_dropped(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            QueryProfilerMiddleware(lambda request: None)
+        response = self.client.get(reverse('participant_list'))
+        self.assertFalse(response.has_header('X-Query-Count'))
+
+    def test_query_report_ranks_endpoints(self):
+        def line(view, queries, db_ms, duplicates=0):
+            return json.dumps({
+                'method': 'GET', 'path': f'/{view}/', 'view': view, 'queries': queries, 'db_ms': db_ms,
+                'duplicates': duplicates, 'total_ms': db_ms * 2,
+                'repeated': [{'fingerprint': 'abc', 'count': duplicates + 1, 'sql': 'SELECT ?'}] if duplicates else [],
+                'slowest': [],
+            })
+
+        # The older entry is in a rotated file
+        Path(f'{self.log}.1').write_text(line('participant_list', 40, 5.0, duplicates=30) + '\n')
+        self.log.write_text('\n'.join([
+            line('participant_list', 20, 4.0, duplicates=10), line('dashboard', 5, 80.0), 'not json',
+        ]) + '\n')
+
+        def report(**options):
+            out = io.StringIO()
+            call_command('query_report', log=str(self.log), stdout=out, **options)
+            return out.getvalue().splitlines()
+
+        by_queries = report()
+        self.assertIn('3 requests across 2 endpoints', by_queries[0])
+        self.assertEqual([row.split()[:4] for row in by_queries[2:]], [
+            ['GET', 'participant_list', '2', '30.0'], ['GET', 'dashboard', '1', '5.0'],
+        ])
+        self.assertEqual(report(sort='db_ms')[2].split()[1], 'dashboard')
+        self.assertIn('repeated x42: SELECT ?', report(statements=True, limit=1)[3])
+        with self.assertRaises(CommandError):
+            call_command('query_report', log=str(self.log.with_name('missing.jsonl')), stdout=io.StringIO())
+
+
+@override_settings(CLINTRACK_WRITE_ASYNC=False, CLINTRACK_SNAPSHOT_ENABLED=False)
+class AdminChangelistTests(TestCase):
+    """Admin changelists run the same number of queries however many rows they show"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('changelists', password='x', role='admin')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = Study.objects.count()
+        now = timezone.now()
+        for number in range(start, start + count):
+            study = Study.objects.create(name=f'Admin Study {number}', code=f'ADM{number}')
+            participant = Participant.objects.create(
+                participant_id=f'ADM-{number:03}', study=study, first_name='Ann', last_name='Otieno',
+                location='Kilifi', created_by=self.admin,
+            )
+            SUSAR.objects.create(
+                susar_id=f'ADM-S{number}', participant=participant, event_description='Event',
+                onset_date=now, severity='mild', actions_taken='None', reported_by=self.admin,
+            )
+            AuditLog.objects.create(
+                user=self.admin, action='update', model_name='Participant', object_id=str(participant.pk),
+            )
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        # Session, user, two counts and the page (related rows joined in), plus
+        # the page's participant counts for studies, the study and county
+        # filters for participants, and the audit subjects, date hierarchy
+        # and model filter for audit logs
+        changelists = {'study': 6, 'participant': 7, 'susar': 5, 'auditlog': 9}
+        for rows in (2, 8):
+            self.add_rows(rows)
+            audit.target_cache.clear()
+            for model, queries in changelists.items():
+                with self.subTest(model=model, rows=rows), self.assertNumQueries(queries):
+                    response = self.client.get(reverse(f'admin:clintrack_{model}_changelist'))
+                    self.assertEqual(response.status_code, 200)
+
+
+class SeedDataTests(TestCase):
+    """Seeded datasets are reproducible"""
+
+    def seed(self):
+        call_command(
+            'seed_data', '--clear', '--bulk', participants=20, susars=3, staff=2, audit_logs=5, years=1,
+            seed=3, as_of=date(2026, 1, 1), stdout=io.StringIO(),
+        )
+        return (
+            list(Participant.objects.order_by('participant_id').values_list(
+                'participant_id', 'study__code', 'enrollment_date', 'created_at', 'status')),
+            list(SUSAR.objects.order_by('susar_id').values_list('susar_id', 'onset_date', 'created_at')),
+            list(StaffAttendance.objects.order_by('login_time').values_list('staff__username', 'login_time')),
+            list(AuditLog.objects.order_by('timestamp', 'action').values_list('action', 'timestamp')),
+        )
+
+    def test_seed_and_as_of_reproduce_the_dataset(self):
+        first = self.seed()
+        self.assertEqual(len(first[0]), 20)
+        self.assertTrue(all(row[2] < date(2026, 1, 1) for row in first[0]))
+        self.assertEqual(self.seed(), first)
+
+
+class CohortTests(TestCase):
+    """Age bins from participant frames and follow-up figures from the database"""
+
+    def frame(self, rows):
+        frame = pd.DataFrame(rows, columns=['study_id', 'status', 'gender', 'date_of_birth', 'enrollment_date'])
+        return frame.astype({'status': 'category', 'gender': 'category'}).assign(
+            date_of_birth=pd.to_datetime(frame.date_of_birth),
+            enrollment_date=pd.to_datetime(frame.enrollment_date),
+        )
+
+    def test_exact_ages_fall_in_the_right_bins(self):
+        as_of = date(2026, 6, 15)
+        participants = self.frame([
+            (1, 'active', 'F', '2008-06-16', None),  # 17 until tomorrow
+            (1, 'active', 'M', '2008-06-15', None),  # 18 today
+            (2, 'active', 'F', '1996-02-29', None),  # 30
+            (2, 'active', 'F', '1965-06-15', None),  # 61 today
+            (2, 'active', 'U', None, None),
+        ])
+        ages = age_histogram(participants, edges=(18, 31, 46, 61), as_of=as_of)
+        self.assertEqual(ages.labels, ['<18', '18-30', '31-45', '46-60', '>60'])
+        self.assertEqual(ages.counts, [1, 2, 0, 0, 1])
+        self.assertEqual(ages.unknown, 1)
+        self.assertEqual(ages.by_study, {1: [1, 1, 0, 0, 0], 2: [0, 1, 0, 0, 1]})
+        self.assertEqual(ages.by_gender['F'], [1, 1, 0, 0, 1])
+        self.assertEqual(ages.rows()[1], {'label': '18-30', 'count': 2})
+
+    def test_no_dates_of_birth(self):
+        ages = age_histogram(self.frame([(1, 'active', 'U', None, None)]), edges=(18,), as_of=date(2026, 1, 1))
+        self.assertEqual((ages.counts, ages.unknown), ([0, 0], 1))
+
+    def test_lost_to_follow_up_per_study_in_one_query(self):
+        one, two = Study.objects.create(name='One', code='ONE'), Study.objects.create(name='Two', code='TWO')
+        for number, (study, status, enrolled) in enumerate([
+            (one, 'lost', date(2026, 1, 1)), (one, 'lost', date(2026, 1, 11)),
+            (two, 'lost', date(2026, 1, 21)), (two, 'active', date(2025, 1, 1)),
+        ]):
+            Participant.objects.create(
+                participant_id=f'LOST-{number}', study=study, first_name='Ann', last_name='Otieno',
+                location='Kilifi', status=status, enrollment_date=enrolled,
+            )
+        with self.assertNumQueries(1):
+            lost = lost_to_follow_up(as_of=date(2026, 1, 31))
+        self.assertEqual(lost, [
+            {'study__name': 'One', 'count': 2, 'avg_enrollment_days': 25.0},
+            {'study__name': 'Two', 'count': 1, 'avg_enrollment_days': 10.0},
+        ])
+        stats = elapsed_stats(Participant.objects.all(), 'enrollment_date', ['status'], as_of=date(2026, 1, 31))
+        self.assertEqual(stats[1], {'status': 'active', 'count': 1, 'avg_days': 395.0, 'min_days': 395.0,
+                                    'max_days': 395.0})
@@ -75,6 +75,9 @@ urlpatterns = [
     # Audit Logs
     path('audit/', views.audit_logs, name='audit_logs'),
     
+    # Exports
+    path('exports/<str:dataset>/', views.export_records, name='export_records'),
+    
     # Reports
     path('reports/', views.reports_index, name='reports_index'),
 ]
@@ -6,17 +6,21 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count, Q, Avg
-from django.db.models.functions import TruncMonth, TruncWeek
+from django.db.models import Count, Avg
+from django.db.models.functions import TruncWeek
 from django.utils import timezone
 from datetime import timedelta, datetime
 from django.http import JsonResponse
 from .models import User, Study, Participant, SUSAR, StaffAttendance, AuditLog
+from .metrics import collect_dashboard_metrics, participant_counts, study_stats
+from . import analytics, rollups
+from .cache import cached_context
+from .writer import defer_write, flush_writes
 from django.contrib.auth import get_user_model
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q, Avg
-from django.db.models.functions import TruncMonth, TruncWeek, TruncDay
+from django.db.models import Count, Avg
+from django.db.models.functions import TruncWeek
 from django.utils import timezone
 from datetime import timedelta
 import json
@@ -44,21 +48,20 @@ def login_view(request):
         if user is not None:
             login(request, user)
             
-            # Log attendance
-            StaffAttendance.objects.create(
+            # Log attendance and audit off the request path
+            defer_write(StaffAttendance(
                 staff=user,
                 login_time=timezone.now(),
                 ip_address=get_client_ip(request)
-            )
+            ))
             
-            # Log audit
-            AuditLog.objects.create(
+            defer_write(AuditLog(
                 user=user,
                 action='view',
                 model_name='User',
                 object_id=str(user.id),
                 ip_address=get_client_ip(request)
-            )
+            ))
             
             messages.success(request, f'Welcome back, {user.first_name or user.username}!')
             
@@ -75,6 +78,9 @@ def logout_view(request):
     Handle user logout and update attendance
     """
     if request.user.is_authenticated:
+        # The login's attendance row may still be queued
+        flush_writes()
+        
         # Update last attendance record
         try:
             last_attendance = StaffAttendance.objects.filter(
@@ -121,6 +127,29 @@ def admin_dashboard(request):
     """
     Administrator Dashboard - Full system overview with analytics
     """
+    context = cached_context('admin_dashboard', admin_dashboard_stats, role='admin')
+    
+    # === RECENT PARTICIPANTS ===
+    recent_participants = Participant.objects.select_related(
+        'study', 'created_by'
+    ).order_by('-created_at')[:7]
+    
+    # === UPCOMING FOLLOW-UPS (Mock data - you can create a FollowUp model) ===
+    upcoming_followups = []  # Placeholder - implement based on your follow-up system
+    
+    context.update({
+        'today': timezone.now().date(),
+        'recent_participants': recent_participants,
+        'upcoming_followups': upcoming_followups,
+    })
+    
+    return render(request, 'dashboards/admin_dashboard.html', context)
+
+
+def admin_dashboard_stats():
+    """
+    Cacheable statistics and chart data for the administrator dashboard
+    """
     # Date filters
     end_date = timezone.now()
     start_date = end_date - timedelta(days=365)
@@ -128,43 +157,10 @@ def admin_dashboard(request):
     last_7_days = end_date - timedelta(days=7)
     
     # === KEY METRICS ===
-    total_participants = Participant.objects.count()
-    active_participants = Participant.objects.filter(status='active').count()
-    completed_participants = Participant.objects.filter(status='completed').count()
-    screening_participants = Participant.objects.filter(status='screening').count()
-    lost_participants = Participant.objects.filter(status='lost').count()
-    withdrawn_participants = Participant.objects.filter(status='withdrawn').count()
-    
-    active_studies = Study.objects.filter(is_active=True).count()
-    total_studies = Study.objects.count()
-    
-    total_susars = SUSAR.objects.count()
-    pending_susars = SUSAR.objects.filter(follow_up_required=True).count()
-    critical_susars = SUSAR.objects.filter(
-        severity__in=['severe', 'life_threatening', 'fatal']
-    ).count()
-    
-    # Monthly participants (last 30 days)
-    monthly_participants = Participant.objects.filter(
-        created_at__gte=last_30_days
-    ).count()
-    
-    # Calculate growth percentage
-    previous_month = last_30_days - timedelta(days=30)
-    previous_month_count = Participant.objects.filter(
-        created_at__gte=previous_month,
-        created_at__lt=last_30_days
-    ).count()
-    
-    if previous_month_count > 0:
-        monthly_growth = round(((monthly_participants - previous_month_count) / previous_month_count) * 100, 1)
-    else:
-        monthly_growth = 100 if monthly_participants > 0 else 0
+    metrics = collect_dashboard_metrics(now=end_date)
     
     # === PARTICIPANT STATUS BREAKDOWN (for doughnut chart) ===
-    status_breakdown = Participant.objects.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    status_breakdown = metrics.participants.status_breakdown
     
     status_data = {
         'labels': [item['status'].title() for item in status_breakdown],
@@ -184,9 +180,7 @@ def admin_dashboard(request):
     }
     
     # === GENDER DISTRIBUTION (for doughnut chart) ===
-    gender_breakdown = Participant.objects.values('gender').annotate(
-        count=Count('id')
-    )
+    gender_breakdown = participant_counts('gender')
     
     gender_map = {'M': 'Male', 'F': 'Female', 'O': 'Other', 'U': 'Not Specified'}
     gender_data = {
@@ -196,19 +190,12 @@ def admin_dashboard(request):
     }
     
     # === ENROLLMENT TRENDS - Last 30 days (for line chart) ===
-    enrollment_daily = Participant.objects.filter(
-        enrollment_date__gte=last_30_days
-    ).annotate(
-        day=TruncDay('enrollment_date')
-    ).values('day').annotate(
-        count=Count('id')
-    ).order_by('day')
+    enrollment_dict = rollups.daily_enrollments(start=last_30_days)
     
     # Fill in missing days with 0
     enrollment_trend_labels = []
     enrollment_trend_data = []
     current_date = last_30_days.date()
-    enrollment_dict = {item['day']: item['count'] for item in enrollment_daily}
     
     while current_date <= end_date.date():
         enrollment_trend_labels.append(current_date.strftime('%b %d'))
@@ -221,18 +208,11 @@ def admin_dashboard(request):
     }
     
     # === SUSAR TRENDS - Last 30 days (for bar chart) ===
-    susar_daily = SUSAR.objects.filter(
-        onset_date__gte=last_30_days
-    ).annotate(
-        day=TruncDay('onset_date')
-    ).values('day').annotate(
-        count=Count('id')
-    ).order_by('day')
+    susar_dict = rollups.daily_susars(start=last_30_days)
     
     susar_trend_labels = []
     susar_trend_data = []
     current_date = last_30_days.date()
-    susar_dict = {item['day']: item['count'] for item in susar_daily}
     
     while current_date <= end_date.date():
         susar_trend_labels.append(current_date.strftime('%b %d'))
@@ -245,13 +225,7 @@ def admin_dashboard(request):
     }
     
     # === ENROLLMENT BY MONTH - Last 12 months (for main chart) ===
-    enrollment_monthly = Participant.objects.filter(
-        enrollment_date__gte=start_date
-    ).annotate(
-        month=TruncMonth('enrollment_date')
-    ).values('month').annotate(
-        count=Count('id')
-    ).order_by('month')
+    enrollment_monthly = rollups.monthly_enrollments(start=start_date)
     
     monthly_labels = []
     monthly_data = []
@@ -272,18 +246,8 @@ def admin_dashboard(request):
         'data': monthly_data
     }
     
-    # === RECENT PARTICIPANTS ===
-    recent_participants = Participant.objects.select_related(
-        'study', 'created_by'
-    ).order_by('-created_at')[:7]
-    
-    # === UPCOMING FOLLOW-UPS (Mock data - you can create a FollowUp model) ===
-    upcoming_followups = []  # Placeholder - implement based on your follow-up system
-    
     # === TOP LOCATIONS ===
-    top_locations = Participant.objects.values('location').annotate(
-        count=Count('id')
-    ).order_by('-count')[:5]
+    top_locations = participant_counts('location', limit=5)
     
     # === STAFF ACTIVITY ===
     staff_activity = User.objects.filter(
@@ -292,24 +256,24 @@ def admin_dashboard(request):
         login_count=Count('attendances')
     ).order_by('-login_count')[:5]
     
-    context = {
-        'today': timezone.now().date(),
+    return {
         'user_role': 'Administrator',
         
         # Key Metrics
-        'total_participants': total_participants,
-        'active_participants': active_participants,
-        'completed_participants': completed_participants,
-        'screening_participants': screening_participants,
-        'lost_participants': lost_participants,
-        'withdrawn_participants': withdrawn_participants,
-        'active_studies': active_studies,
-        'total_studies': total_studies,
-        'total_susars': total_susars,
-        'pending_susars': pending_susars,
-        'critical_susars': critical_susars,
-        'monthly_participants': monthly_participants,
-        'monthly_growth': monthly_growth,
+        'metrics': metrics,
+        'total_participants': metrics.participants.total,
+        'active_participants': metrics.participants.active,
+        'completed_participants': metrics.participants.completed,
+        'screening_participants': metrics.participants.screening,
+        'lost_participants': metrics.participants.lost,
+        'withdrawn_participants': metrics.participants.withdrawn,
+        'active_studies': metrics.studies.active,
+        'total_studies': metrics.studies.total,
+        'total_susars': metrics.susars.total,
+        'pending_susars': metrics.susars.pending_follow_up,
+        'critical_susars': metrics.susars.critical,
+        'monthly_participants': metrics.participants.created_last_30_days,
+        'monthly_growth': metrics.participants.monthly_growth,
         
         # Chart Data (as JSON for JavaScript)
         'status_data': json.dumps(status_data),
@@ -320,61 +284,73 @@ def admin_dashboard(request):
         'enrollment_monthly_trend': json.dumps(enrollment_monthly_trend),
         
         # Lists
-        'recent_participants': recent_participants,
-        'upcoming_followups': upcoming_followups,
-        'top_locations': top_locations,
-        'staff_activity': staff_activity,
+        'top_locations': list(top_locations),
+        'staff_activity': list(staff_activity),
     }
-    
-    return render(request, 'dashboards/admin_dashboard.html', context)
 
 @login_required
 def coordinator_dashboard(request):
     """
     Study Coordinator Dashboard - Study management and participant oversight
     """
+    context = cached_context('coordinator_dashboard', coordinator_dashboard_stats, role='coordinator')
+    
+    # === RECENT SUSARS REQUIRING FOLLOW-UP ===
+    pending_susars_list = SUSAR.objects.filter(
+        follow_up_required=True
+    ).select_related('participant', 'reported_by').order_by('-onset_date')[:10]
+    
+    # === RECENT PARTICIPANTS ===
+    recent_participants = Participant.objects.select_related('study').order_by('-created_at')[:10]
+    
+    context.update({
+        'pending_susars_list': pending_susars_list,
+        'recent_participants': recent_participants,
+    })
+    
+    return render(request, 'dashboards/coordinator_dashboard.html', context)
+
+
+def coordinator_dashboard_stats():
+    """
+    Cacheable statistics and chart data for the study coordinator dashboard
+    """
     end_date = timezone.now()
-    last_30_days = end_date - timedelta(days=30)
-    last_7_days = end_date - timedelta(days=7)
     
     # === KEY METRICS ===
-    total_participants = Participant.objects.count()
-    active_participants = Participant.objects.filter(status='active').count()
-    screening_participants = Participant.objects.filter(status='screening').count()
-    total_susars = SUSAR.objects.count()
-    pending_susars = SUSAR.objects.filter(
-        follow_up_required=True,
-        outcome__in=['recovering', 'not_recovered', 'unknown']
-    ).count()
+    metrics = collect_dashboard_metrics(now=end_date)
     
     # === WEEKLY ENROLLMENT (Last 8 weeks) ===
-    eight_weeks_ago = end_date - timedelta(weeks=8)
-    
     # Generate weekly enrollment data for chart
     weekly_data = []
     weekly_labels = []
     
     # Create list of last 8 weeks
+    this_week_start = end_date - timedelta(days=end_date.weekday())  # Start of week (Monday)
+    enrollment_by_day = rollups.daily_enrollments(
+        start=this_week_start - timedelta(weeks=7),
+        end=this_week_start + timedelta(days=6)
+    )
+    
     for i in range(8):
-        week_start = end_date - timedelta(weeks=i)
-        week_start = week_start - timedelta(days=week_start.weekday())  # Start of week (Monday)
-        week_end = week_start + timedelta(days=6)
-        
-        week_participants = Participant.objects.filter(
-            enrollment_date__gte=week_start.date(),
-            enrollment_date__lte=week_end.date()
-        ).count()
+        week_start = this_week_start - timedelta(weeks=i)
+        week_days = [(week_start + timedelta(days=d)).date() for d in range(7)]
+        week_participants = sum(enrollment_by_day.get(day, 0) for day in week_days)
         
         weekly_data.insert(0, week_participants)
         weekly_labels.insert(0, f"W{week_start.isocalendar()[1]}")
     
     # === STUDY BREAKDOWN ===
-    study_breakdown = Study.objects.annotate(
-        total=Count('participants'),
-        active=Count('participants', filter=Q(participants__status='active')),
-        screening=Count('participants', filter=Q(participants__status='screening')),
-        susars=Count('participants__susars')
+    study_breakdown = list(Study.objects.order_by('pk'))
+    stats = study_stats()
+    susar_counts = dict(
+        SUSAR.objects.order_by().values_list('participant__study').annotate(count=Count('id'))
     )
+    for study in study_breakdown:
+        study.total = stats[study.pk].total
+        study.active = stats[study.pk].active
+        study.screening = stats[study.pk].screening
+        study.susars = susar_counts.get(study.pk, 0)
     
     # Prepare study data for chart
     study_data = {
@@ -400,7 +376,7 @@ def coordinator_dashboard(request):
         study_data['colors'].append(study_colors[i % len(study_colors)])
     
     # === STATUS BREAKDOWN ===
-    status_breakdown = Participant.objects.values('status').annotate(count=Count('id'))
+    status_breakdown = metrics.participants.status_breakdown
     
     # Prepare status data for chart
     status_data = {
@@ -427,6 +403,11 @@ def coordinator_dashboard(request):
     # === MONTHLY SUSAR TREND ===
     monthly_susar_data = []
     monthly_susar_labels = []
+    detections_by_day = rollups.daily_susars(
+        start=(end_date - timedelta(days=150)).replace(day=1),
+        end=end_date,
+        counter='detections'
+    )
     
     for i in range(6):  # Last 6 months
         month_start = end_date - timedelta(days=30*i)
@@ -437,10 +418,10 @@ def coordinator_dashboard(request):
             next_month = month_start.replace(day=28) + timedelta(days=4)
             month_end = next_month - timedelta(days=next_month.day)
         
-        month_susars = SUSAR.objects.filter(
-            detection_date__gte=month_start,
-            detection_date__lte=month_end
-        ).count()
+        month_susars = sum(
+            count for day, count in detections_by_day.items()
+            if month_start.date() <= day <= month_end.date()
+        )
         
         monthly_susar_data.insert(0, month_susars)
         monthly_susar_labels.insert(0, month_start.strftime('%b'))
@@ -470,24 +451,15 @@ def coordinator_dashboard(request):
         severity_data['data'].append(item['count'])
         severity_data['colors'].append(severity_colors.get(severity_key, 'rgba(160, 160, 160, 0.8)'))
     
-    # === RECENT SUSARS REQUIRING FOLLOW-UP ===
-    pending_susars_list = SUSAR.objects.filter(
-        follow_up_required=True
-    ).select_related('participant', 'reported_by').order_by('-onset_date')[:10]
-    
-    # === RECENT PARTICIPANTS ===
-    recent_participants = Participant.objects.select_related('study').order_by('-created_at')[:10]
-    
-    context = {
+    return {
         'user_role': 'Study Coordinator',
-        'total_participants': total_participants,
-        'active_participants': active_participants,
-        'screening_participants': screening_participants,
-        'total_susars': total_susars,
-        'pending_susars': pending_susars,
+        'metrics': metrics,
+        'total_participants': metrics.participants.total,
+        'active_participants': metrics.participants.active,
+        'screening_participants': metrics.participants.screening,
+        'total_susars': metrics.susars.total,
+        'pending_susars': metrics.susars.pending_unresolved,
         'study_breakdown': study_breakdown,
-        'pending_susars_list': pending_susars_list,
-        'recent_participants': recent_participants,
         'status_breakdown': status_breakdown,
         
         # Chart Data
@@ -499,41 +471,18 @@ def coordinator_dashboard(request):
         'monthly_susar_labels': monthly_susar_labels,
         'severity_data_json': json.dumps(severity_data),
     }
-    
-    return render(request, 'dashboards/coordinator_dashboard.html', context)
 
 @login_required
 def staff_dashboard(request):
     """
     Research Staff Dashboard - Daily operations and participant management
     """
-    end_date = timezone.now()
-    last_7_days = end_date - timedelta(days=7)
-    today = end_date.date()
-    
-    # === MY METRICS ===
-    my_participants = Participant.objects.filter(created_by=request.user).count()
-    my_recent_participants = Participant.objects.filter(
-        created_by=request.user,
-        created_at__gte=last_7_days
-    ).count()
-    
-    # === TODAY'S ACTIVITIES ===
-    participants_today = Participant.objects.filter(
-        created_at__date=today
-    ).count()
-    
-    susars_today = SUSAR.objects.filter(
-        detection_date__date=today
-    ).count()
-    
-    # === QUICK STATS ===
-    total_active = Participant.objects.filter(status='active').count()
-    total_screening = Participant.objects.filter(status='screening').count()
-    pending_followups = SUSAR.objects.filter(
-        follow_up_required=True,
-        outcome__in=['recovering', 'not_recovered']
-    ).count()
+    context = cached_context(
+        'staff_dashboard',
+        lambda: staff_dashboard_stats(request.user),
+        role='staff',
+        user=request.user
+    )
     
     # === MY RECENT PARTICIPANTS ===
     my_recent_list = Participant.objects.filter(
@@ -544,65 +493,85 @@ def staff_dashboard(request):
     recent_participants = Participant.objects.select_related('study', 'created_by').order_by('-created_at')[:5]
     recent_susars = SUSAR.objects.select_related('participant', 'reported_by').order_by('-created_at')[:5]
     
-    # === STUDY BREAKDOWN ===
-    study_stats = Study.objects.annotate(
-        total=Count('participants'),
-        active=Count('participants', filter=Q(participants__status='active'))
-    )
-    
-    context = {
-        'user_role': 'Research Staff',
-        'my_participants': my_participants,
-        'my_recent_participants': my_recent_participants,
-        'participants_today': participants_today,
-        'susars_today': susars_today,
-        'total_active': total_active,
-        'total_screening': total_screening,
-        'pending_followups': pending_followups,
+    context.update({
         'my_recent_list': my_recent_list,
         'recent_participants': recent_participants,
         'recent_susars': recent_susars,
-        'study_stats': study_stats,
-    }
+    })
     
     return render(request, 'dashboards/staff_dashboard.html', context)
 
 
+def staff_dashboard_stats(user):
+    """
+    Cacheable statistics for a research staff member's dashboard
+    """
+    end_date = timezone.now()
+    
+    # === MY METRICS, TODAY'S ACTIVITIES AND QUICK STATS ===
+    metrics = collect_dashboard_metrics(user=user, now=end_date)
+    
+    # === STUDY BREAKDOWN ===
+    studies = list(Study.objects.order_by('pk'))
+    stats = study_stats()
+    for study in studies:
+        study.total = stats[study.pk].total
+        study.active = stats[study.pk].active
+    
+    return {
+        'user_role': 'Research Staff',
+        'metrics': metrics,
+        'my_participants': metrics.participants.mine,
+        'my_recent_participants': metrics.participants.mine_last_7_days,
+        'participants_today': metrics.participants.created_today,
+        'susars_today': metrics.susars.detected_today,
+        'total_active': metrics.participants.active,
+        'total_screening': metrics.participants.screening,
+        'pending_followups': metrics.susars.pending_in_recovery,
+        'study_stats': studies,
+    }
+
+
 @login_required
 def viewer_dashboard(request):
     """
     Viewer Dashboard - Read-only overview
     """
+    context = cached_context('viewer_dashboard', viewer_dashboard_stats, role='viewer')
+    
+    # === RECENT PARTICIPANTS ===
+    context['recent_participants'] = Participant.objects.select_related('study').order_by('-created_at')[:10]
+    
+    return render(request, 'dashboards/viewer_dashboard.html', context)
+
+
+def viewer_dashboard_stats():
+    """
+    Cacheable statistics for the read-only viewer dashboard
+    """
     # === SUMMARY METRICS ===
-    total_participants = Participant.objects.count()
-    active_participants = Participant.objects.filter(status='active').count()
-    total_studies = Study.objects.filter(is_active=True).count()
-    total_susars = SUSAR.objects.count()
+    metrics = collect_dashboard_metrics()
     
     # === STUDY BREAKDOWN ===
-    study_breakdown = Study.objects.annotate(
-        participant_count=Count('participants'),
-        active_count=Count('participants', filter=Q(participants__status='active'))
-    )
+    study_breakdown = list(Study.objects.order_by('pk'))
+    stats = study_stats()
+    for study in study_breakdown:
+        study.participant_count = stats[study.pk].total
+        study.active_count = stats[study.pk].active
     
     # === STATUS BREAKDOWN ===
-    status_breakdown = Participant.objects.values('status').annotate(count=Count('id'))
-    
-    # === RECENT PARTICIPANTS ===
-    recent_participants = Participant.objects.select_related('study').order_by('-created_at')[:10]
+    status_breakdown = metrics.participants.status_breakdown
     
-    context = {
+    return {
         'user_role': 'Viewer',
-        'total_participants': total_participants,
-        'active_participants': active_participants,
-        'total_studies': total_studies,
-        'total_susars': total_susars,
+        'metrics': metrics,
+        'total_participants': metrics.participants.total,
+        'active_participants': metrics.participants.active,
+        'total_studies': metrics.studies.active,
+        'total_susars': metrics.susars.total,
         'study_breakdown': study_breakdown,
         'status_breakdown': status_breakdown,
-        'recent_participants': recent_participants,
     }
-    
-    return render(request, 'dashboards/viewer_dashboard.html', context)
 
 
 # ============================================
@@ -617,13 +586,7 @@ def enrollment_chart_data(request):
     months = int(request.GET.get('months', 12))
     start_date = timezone.now() - timedelta(days=months * 30)
     
-    data = Participant.objects.filter(
-        enrollment_date__gte=start_date.date()
-    ).annotate(
-        month=TruncMonth('enrollment_date')
-    ).values('month').annotate(
-        count=Count('id')
-    ).order_by('month')
+    data = rollups.monthly_enrollments(start=start_date)
     
     chart_data = {
         'labels': [item['month'].strftime('%b %Y') for item in data],
@@ -641,13 +604,7 @@ def susar_chart_data(request):
     months = int(request.GET.get('months', 12))
     start_date = timezone.now() - timedelta(days=months * 30)
     
-    data = SUSAR.objects.filter(
-        onset_date__gte=start_date
-    ).annotate(
-        month=TruncMonth('onset_date')
-    ).values('month').annotate(
-        count=Count('id')
-    ).order_by('month')
+    data = rollups.monthly_susars(start=start_date)
     
     chart_data = {
         'labels': [item['month'].strftime('%b %Y') for item in data],
@@ -662,9 +619,7 @@ def status_chart_data(request):
     """
     API endpoint for participant status distribution
     """
-    data = Participant.objects.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
+    data = participant_counts('status')
     
     chart_data = {
         'labels': [item['status'].title() for item in data],
@@ -697,7 +652,7 @@ def get_client_ip(request):
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
+from django.db.models import Count
 from django.core.paginator import Paginator
 from django.http import JsonResponse
 from .models import Participant, Study, SUSAR, User, StaffAttendance, AuditLog
@@ -705,6 +660,8 @@ from .forms import (
     ParticipantForm, StudyForm, SUSARForm, 
     UserForm, StaffAttendanceForm
 )
+from .search import search_participants, filter_participants, fuzzy_search_participants
+from .pagination import KeysetPaginator
 
 # ============================================
 # PARTICIPANT VIEWS
@@ -720,29 +677,30 @@ def participant_list(request):
     study_filter = request.GET.get('study', '')
     status_filter = request.GET.get('status', '')
     
-    if search:
-        participants = participants.filter(
-            Q(participant_id__icontains=search) |
-            Q(first_name__icontains=search) |
-            Q(last_name__icontains=search) |
-            Q(primary_phone__icontains=search)
-        )
-    
     if study_filter:
         participants = participants.filter(study_id=study_filter)
     
     if status_filter:
         participants = participants.filter(status=status_filter)
     
-    # Pagination
-    paginator = Paginator(participants, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # After the filters, so ranked matches are drawn from the filtered rows
+    if search:
+        participants = search_participants(participants, search)
+    
+    # Pagination: search results come back in rank order, so only the
+    # unsearched list can be paged by cursor
+    if search:
+        paginator = Paginator(participants, 20)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    else:
+        paginator = KeysetPaginator(participants, 20, ('-created_at', '-id'), estimate_count=True)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
     
     studies = Study.objects.filter(is_active=True)
     
     context = {
         'page_obj': page_obj,
+        'cursor_mode': not search,
         'studies': studies,
         'search': search,
         'study_filter': study_filter,
@@ -833,26 +791,30 @@ def participant_search(request):
     results = []
     
     if request.method == 'GET' and request.GET:
-        query = Q()
-        
-        participant_id = request.GET.get('participant_id', '')
-        first_name = request.GET.get('first_name', '')
-        last_name = request.GET.get('last_name', '')
-        phone = request.GET.get('phone', '')
-        location = request.GET.get('location', '')
-        
-        if participant_id:
-            query &= Q(participant_id__icontains=participant_id)
-        if first_name:
-            query &= Q(first_name__icontains=first_name)
-        if last_name:
-            query &= Q(last_name__icontains=last_name)
-        if phone:
-            query &= Q(primary_phone__icontains=phone) | Q(secondary_phone__icontains=phone)
-        if location:
-            query &= Q(location__icontains=location)
+        participants = Participant.objects.select_related('study')
         
-        results = Participant.objects.filter(query).select_related('study')[:50]
+        if request.GET.get('mode') == 'fuzzy':
+            # Names and location by sound/spelling, ID and phone as usual
+            participants = filter_participants(
+                participants,
+                participant_id=request.GET.get('participant_id', ''),
+                phone=request.GET.get('phone', ''),
+            )
+            results = fuzzy_search_participants(
+                participants,
+                first_name=request.GET.get('first_name', ''),
+                last_name=request.GET.get('last_name', ''),
+                location=request.GET.get('location', ''),
+            )[:50]
+        else:
+            results = filter_participants(
+                participants,
+                participant_id=request.GET.get('participant_id', ''),
+                first_name=request.GET.get('first_name', ''),
+                last_name=request.GET.get('last_name', ''),
+                phone=request.GET.get('phone', ''),
+                location=request.GET.get('location', ''),
+            )[:50]
     
     context = {'results': results}
     return render(request, 'participants/participant_search.html', context)
@@ -878,13 +840,7 @@ def study_detail(request, pk):
     """View study details"""
     study = get_object_or_404(Study, pk=pk)
     participants = study.participants.all()[:20]
-    
-    stats = {
-        'total': study.participants.count(),
-        'active': study.participants.filter(status='active').count(),
-        'completed': study.participants.filter(status='completed').count(),
-        'screening': study.participants.filter(status='screening').count(),
-    }
+    stats = study_stats([study.pk])[study.pk]
     
     context = {
         'study': study,
@@ -955,9 +911,8 @@ def susars_list(request):
     if follow_up_filter == 'pending':
         susars = susars.filter(follow_up_required=True)
     
-    paginator = Paginator(susars, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(susars, 20, ('-onset_date', '-id'), estimate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
@@ -1082,19 +1037,23 @@ def users_profile(request):
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count, Q, Avg, Max, Min, Sum
-from django.db.models.functions import TruncMonth, TruncWeek, ExtractMonth, TruncDay
+from django.db.models import Count, Avg, Max, Min, Sum
+from django.db.models.functions import TruncWeek, ExtractMonth
 from django.utils import timezone
 from datetime import timedelta, datetime
 import json
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, Http404
 from django.views.decorators.http import require_POST, require_GET
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
-import csv
 from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
 
-from .models import User, Study, Participant, SUSAR, StaffAttendance, AuditLog
+from .models import User, Study, Participant, SUSAR, StaffAttendance, AuditLog, AuditLogArchive
+from .exports import DATASETS, EXPORT_FORMATS, streaming_export
+from .audit import resolve_targets
+from .pagination import TieredKeysetPaginator
+from .segments import SegmentSource
 
 # ============================================
 # USER SETTINGS VIEWS
@@ -1193,7 +1152,7 @@ def update_profile(request):
     user.save()
     
     # Log the change
-    AuditLog.objects.create(
+    defer_write(AuditLog(
         user=user,
         action='update',
         model_name='User',
@@ -1205,7 +1164,7 @@ def update_profile(request):
             'phone_number': phone_number
         },
         ip_address=request.META.get('REMOTE_ADDR')
-    )
+    ))
     
     messages.success(request, 'Profile updated successfully.')
     return redirect('users_settings')
@@ -1246,14 +1205,14 @@ def update_password(request):
     update_session_auth_hash(request, user)
     
     # Log the change
-    AuditLog.objects.create(
+    defer_write(AuditLog(
         user=user,
         action='update',
         model_name='User',
         object_id=str(user.id),
         changes={'password': 'updated'},
         ip_address=request.META.get('REMOTE_ADDR')
-    )
+    ))
     
     messages.success(request, 'Password updated successfully.')
     return redirect('users_settings')
@@ -1390,8 +1349,11 @@ def export_personal_data(request):
             'duration': str(attendance.duration) if attendance.duration else None,
         })
     
-    # Add audit logs
-    audit_logs = AuditLog.objects.filter(user=user).order_by('-timestamp')[:100]
+    # Add audit logs, continuing into archived history when the live table has fewer
+    audit_logs = TieredKeysetPaginator(
+        AuditLog.objects.filter(user=user), 100, ('-timestamp', '-id'),
+        sources=[AuditLogArchive.objects.filter(user=user), SegmentSource(user.id)],
+    ).page()
     for log in audit_logs:
         user_data['audit_logs'].append({
             'timestamp': log.timestamp.isoformat(),
@@ -1413,27 +1375,17 @@ def download_activity_log(request):
     """Download user activity log as CSV"""
     user = request.user
     
-    # Get user's audit logs
-    audit_logs = AuditLog.objects.filter(user=user).order_by('-timestamp')
-    
-    # Create CSV response
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="activity-log-{user.username}-{timezone.now().date()}.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Timestamp', 'Action', 'Model', 'Object ID', 'Changes', 'IP Address'])
-    
-    for log in audit_logs:
-        writer.writerow([
-            log.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            log.get_action_display(),
-            log.model_name,
-            log.object_id,
-            str(log.changes) if log.changes else '',
-            str(log.ip_address) if log.ip_address else ''
-        ])
+    # Get user's audit logs, archived ones included
+    audit_logs = AuditLog.objects.filter(user=user)
+    dataset = DATASETS['audit'].select(
+        'Timestamp', 'Action', 'Model', 'Object ID', 'Changes', 'IP Address'
+    )
     
-    return response
+    return streaming_export(
+        audit_logs, dataset, 'csv',
+        filename=f'activity-log-{user.username}-{timezone.now().date()}',
+        sources=[AuditLogArchive.objects.filter(user=user), SegmentSource(user.id)],
+    )
 
 @login_required
 @require_POST
@@ -1459,14 +1411,14 @@ def delete_account(request):
     user.save()
     
     # Log the action
-    AuditLog.objects.create(
+    defer_write(AuditLog(
         user=user,
         action='delete',
         model_name='User',
         object_id=str(user.id),
         changes={'status': 'deactivated'},
         ip_address=request.META.get('REMOTE_ADDR')
-    )
+    ))
     
     # Logout user
     from django.contrib.auth import logout
@@ -1510,9 +1462,8 @@ def attendance_list(request):
         attendance_qs = attendance_qs.filter(logout_time__isnull=False)
     
     # Pagination
-    paginator = Paginator(attendance_qs, 25)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(attendance_qs, 25, ('-login_time', '-id'), estimate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Calculate statistics
     today = timezone.now().date()
@@ -1621,9 +1572,8 @@ def attendance_list(request):
     
     attendances = StaffAttendance.objects.select_related('staff').all()
     
-    paginator = Paginator(attendances, 30)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    paginator = KeysetPaginator(attendances, 30, ('-login_time', '-id'), estimate_count=True)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {'page_obj': page_obj}
     return render(request, 'attendance/attendance_list.html', context)
@@ -1641,15 +1591,80 @@ def audit_logs(request):
         return redirect('dashboard')
     
     logs = AuditLog.objects.select_related('user').all()
+    archived = AuditLogArchive.objects.select_related('user').all()
     
-    paginator = Paginator(logs, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Counting every tier is expensive, so the total is shown on request
+    paginator = TieredKeysetPaginator(
+        logs, 50, ('-timestamp', '-id'),
+        sources=[archived, SegmentSource()], estimate_count=request.GET.get('total') == '1',
+    )
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    resolve_targets(page_obj.object_list)
     
     context = {'page_obj': page_obj}
     return render(request, 'audit/audit_logs.html', context)
 
 
+# ============================================
+# EXPORT VIEWS
+# ============================================
+
+# Exports restricted to administrators, like their list views
+ADMIN_ONLY_EXPORTS = ['attendance', 'audit']
+
+
+@login_required
+def export_records(request, dataset):
+    """Stream participants, SUSARs, attendance or audit logs as CSV or JSON Lines"""
+    export_format = request.GET.get('format', 'csv')
+    if dataset not in DATASETS or export_format not in EXPORT_FORMATS:
+        raise Http404('Unknown export')
+    
+    if request.user.role not in ['admin', 'coordinator']:
+        messages.error(request, 'You do not have permission to export data.')
+        return redirect('dashboard')
+    
+    if dataset in ADMIN_ONLY_EXPORTS and request.user.role != 'admin':
+        messages.error(request, 'Only administrators can export this data.')
+        return redirect('dashboard')
+    
+    queryset = DATASETS[dataset].model.objects.all()
+    
+    # Same filters as the list views
+    if dataset == 'participants':
+        if request.GET.get('study'):
+            queryset = queryset.filter(study_id=request.GET['study'])
+        if request.GET.get('status'):
+            queryset = queryset.filter(status=request.GET['status'])
+    elif dataset == 'susars':
+        if request.GET.get('severity'):
+            queryset = queryset.filter(severity=request.GET['severity'])
+        if request.GET.get('follow_up') == 'pending':
+            queryset = queryset.filter(follow_up_required=True)
+    elif dataset == 'attendance':
+        try:
+            if request.GET.get('start_date'):
+                queryset = queryset.filter(login_time__date__gte=request.GET['start_date'])
+            if request.GET.get('end_date'):
+                queryset = queryset.filter(login_time__date__lte=request.GET['end_date'])
+        except ValidationError:
+            raise Http404('Invalid date')
+        if request.GET.get('role'):
+            queryset = queryset.filter(staff__role=request.GET['role'])
+        if request.GET.get('status') == 'active':
+            queryset = queryset.filter(logout_time__isnull=True)
+        elif request.GET.get('status') == 'completed':
+            queryset = queryset.filter(logout_time__isnull=False)
+    
+    # Audit history continues into the archive table and segment files
+    sources = ()
+    if dataset == 'audit':
+        queryset = queryset.select_related('user')
+        sources = [AuditLogArchive.objects.select_related('user'), SegmentSource()]
+    
+    return streaming_export(queryset, dataset, export_format, sources=sources)
+
+
 # ============================================
 # REPORTS VIEWS
 # ============================================
@@ -1657,8 +1672,7 @@ from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import Q, Count, Avg, F, ExpressionWrapper, DurationField
-from django.db.models.functions import TruncMonth
+from django.db.models import Count, Avg, ExpressionWrapper, DurationField
 from datetime import timedelta
 import json
 
@@ -1680,277 +1694,29 @@ def reports_index(request):
     if not end_date:
         end_date = timezone.now().strftime('%Y-%m-%d')
     
-    # Convert to datetime objects
-    start_datetime = timezone.datetime.strptime(start_date, '%Y-%m-%d')
-    end_datetime = timezone.datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-    
-    # Base querysets with filters
-    participants_qs = Participant.objects.filter(
-        created_at__gte=start_datetime,
-        created_at__lte=end_datetime
-    )
-    
-    susars_qs = SUSAR.objects.filter(
-        created_at__gte=start_datetime,
-        created_at__lte=end_datetime
+    context = cached_context(
+        'reports_index',
+        lambda: reports_index_stats(start_date, end_date, study_id),
+        study=study_id,
+        start=start_date,
+        end=end_date
     )
     
-    # Filter by study if specified
-    if study_id:
-        participants_qs = participants_qs.filter(study_id=study_id)
-        susars_qs = susars_qs.filter(participant__study_id=study_id)
-    
-    # 1. PARTICIPANT ENROLLMENT TRENDS
-    # Daily enrollment
-    daily_enrollment = []
-    for i in range((end_datetime - start_datetime).days):
-        date = start_datetime + timedelta(days=i)
-        count = Participant.objects.filter(enrollment_date=date.date()).count()
-        daily_enrollment.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'count': count
-        })
-    
-    # Monthly enrollment
-    monthly_enrollment = Participant.objects.filter(
-        enrollment_date__gte=start_datetime.date(),
-        enrollment_date__lte=end_datetime.date()
-    ).annotate(
-        month=TruncMonth('enrollment_date')
-    ).values('month').annotate(
-        count=Count('id')
-    ).order_by('month')
-    
-    # 2. PARTICIPANT STATUS DISTRIBUTION
-    status_distribution = Participant.objects.values('status').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # 3. STUDY-WISE PARTICIPANT DISTRIBUTION
-    study_distribution = Study.objects.annotate(
-        participant_count=Count('participants'),
-        active_count=Count('participants', filter=Q(participants__status='active')),
-        completed_count=Count('participants', filter=Q(participants__status='completed'))
-    ).order_by('-participant_count')
-    
-    # 4. GENDER DISTRIBUTION
-    gender_distribution = Participant.objects.values('gender').annotate(
-        count=Count('id')
-    )
-    
-    # 5. AGE DISTRIBUTION
-    age_distribution = []
-    age_ranges = [
-        ('<18', Q(date_of_birth__gte=timezone.now() - timedelta(days=18*365))),
-        ('18-30', Q(date_of_birth__lt=timezone.now() - timedelta(days=18*365)) & 
-                  Q(date_of_birth__gte=timezone.now() - timedelta(days=30*365))),
-        ('31-45', Q(date_of_birth__lt=timezone.now() - timedelta(days=30*365)) & 
-                  Q(date_of_birth__gte=timezone.now() - timedelta(days=45*365))),
-        ('46-60', Q(date_of_birth__lt=timezone.now() - timedelta(days=45*365)) & 
-                  Q(date_of_birth__gte=timezone.now() - timedelta(days=60*365))),
-        ('>60', Q(date_of_birth__lt=timezone.now() - timedelta(days=60*365)))
-    ]
-    
-    for label, query in age_ranges:
-        count = Participant.objects.filter(query).count()
-        age_distribution.append({'label': label, 'count': count})
-    
-    # 6. SUSAR ANALYSIS
-    susar_severity_distribution = SUSAR.objects.values('severity').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    susar_outcome_distribution = SUSAR.objects.values('outcome').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Monthly SUSAR trend
-    monthly_susar_trend = SUSAR.objects.filter(
-        created_at__gte=start_datetime,
-        created_at__lte=end_datetime
-    ).annotate(
-        month=TruncMonth('created_at')
-    ).values('month').annotate(
-        count=Count('id')
-    ).order_by('month')
-    
-    # 7. ATTENDANCE ANALYSIS
-    staff_attendance = StaffAttendance.objects.filter(
-        login_time__gte=start_datetime,
-        login_time__lte=end_datetime
-    ).values('staff__username').annotate(
-        login_count=Count('id'),
-        avg_duration=Avg(F('logout_time') - F('login_time'))
-    ).order_by('-login_count')[:10]
-    
-    # 8. STUDY COMPLETION RATES
-    study_completion = []
-    for study in Study.objects.filter(is_active=True):
-        total = study.participants.count()
-        completed = study.participants.filter(status='completed').count()
-        if total > 0:
-            completion_rate = (completed / total) * 100
-            study_completion.append({
-                'study': study.name,
-                'code': study.code,
-                'total': total,
-                'completed': completed,
-                'completion_rate': round(completion_rate, 1)
-            })
-    
-    # 9. LOST TO FOLLOW-UP ANALYSIS
-    # Calculate days since enrollment for lost participants
-    lost_analysis = Participant.objects.filter(status='lost').values(
-        'study__name'
-    ).annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Calculate average enrollment days separately for each study
-    for item in lost_analysis:
-        study_name = item['study__name']
-        lost_participants = Participant.objects.filter(
-            status='lost',
-            study__name=study_name
-        )
-        
-        # Calculate average days since enrollment
-        total_days = 0
-        participant_count = 0
-        for participant in lost_participants:
-            if participant.enrollment_date:
-                days_diff = (timezone.now().date() - participant.enrollment_date).days
-                total_days += days_diff
-                participant_count += 1
-        
-        if participant_count > 0:
-            item['avg_enrollment_days'] = round(total_days / participant_count, 1)
-        else:
-            item['avg_enrollment_days'] = 0
-    
-    # 10. AUDIT LOG SUMMARY
-    audit_summary = AuditLog.objects.filter(
-        timestamp__gte=start_datetime,
-        timestamp__lte=end_datetime
-    ).values('action').annotate(
-        count=Count('id')
-    ).order_by('-count')
-    
-    # Prepare data for charts
-    context = {
+    context.update({
         # Filter parameters
         'start_date': start_date,
         'end_date': end_date,
         'study_id': study_id,
         'studies': Study.objects.all(),
         
-        # Chart data
-        'daily_enrollment': json.dumps(daily_enrollment),
-        'monthly_enrollment': json.dumps(list(monthly_enrollment), default=str),
-        'status_distribution': json.dumps(list(status_distribution)),
-        'study_distribution': json.dumps([
-            {
-                'name': study.name,
-                'code': study.code,
-                'total': study.participant_count,
-                'active': study.active_count,
-                'completed': study.completed_count
-            } for study in study_distribution
-        ]),
-        'gender_distribution': json.dumps(list(gender_distribution)),
-        'age_distribution': json.dumps(age_distribution),
-        'susar_severity_distribution': json.dumps(list(susar_severity_distribution)),
-        'susar_outcome_distribution': json.dumps(list(susar_outcome_distribution)),
-        'monthly_susar_trend': json.dumps(list(monthly_susar_trend), default=str),
-        'staff_attendance': json.dumps([
-            {
-                'staff': item['staff__username'],
-                'login_count': item['login_count'],
-                'avg_duration': item['avg_duration'].total_seconds() / 3600 if item['avg_duration'] else 0
-            } for item in staff_attendance
-        ]),
-        'study_completion': json.dumps(study_completion),
-        'lost_analysis': json.dumps(list(lost_analysis), default=str),
-        'audit_summary': json.dumps(list(audit_summary)),
-        
-        # Summary statistics
-        'total_participants': participants_qs.count(),
-        'total_susars': susars_qs.count(),
-        'avg_participants_per_study': round(participants_qs.count() / max(Study.objects.count(), 1), 1),
-        'participant_growth_rate': calculate_growth_rate(participants_qs, 'enrollment_date'),
-        'susar_resolution_rate': calculate_susar_resolution_rate(susars_qs),
-        'avg_study_duration': calculate_avg_study_duration(),
-        'follow_up_compliance': calculate_follow_up_compliance(susars_qs),
-        
         # Data for tables
-        'top_studies': study_distribution[:5],
         'recent_susars': SUSAR.objects.order_by('-onset_date')[:10],
         'recent_participants': Participant.objects.order_by('-created_at')[:10],
-        'staff_activity': staff_attendance,
-    }
+    })
     
     return render(request, 'reports/reports_index.html', context)
 
 
-# Helper functions for calculations
-def calculate_growth_rate(queryset, date_field):
-    """Calculate month-over-month growth rate"""
-    current_month = timezone.now().month
-    previous_month = current_month - 1 if current_month > 1 else 12
-    
-    current_count = queryset.filter(
-        **{f'{date_field}__month': current_month}
-    ).count()
-    
-    previous_count = queryset.filter(
-        **{f'{date_field}__month': previous_month}
-    ).count()
-    
-    if previous_count > 0:
-        return round(((current_count - previous_count) / previous_count) * 100, 1)
-    return 0.0
-
-def calculate_susar_resolution_rate(susars_qs):
-    """Calculate SUSAR resolution rate"""
-    resolved = susars_qs.filter(
-        Q(outcome='recovered') | Q(outcome='recovered_sequelae')
-    ).count()
-    
-    total = susars_qs.count()
-    
-    if total > 0:
-        return round((resolved / total) * 100, 1)
-    return 0.0
-
-def calculate_avg_study_duration():
-    """Calculate average study duration in days"""
-    from django.db.models import Avg
-    from django.db.models.functions import Cast
-    from django.db.models import IntegerField
-    
-    studies = Study.objects.filter(start_date__isnull=False, end_date__isnull=False)
-    
-    total_days = 0
-    count = 0
-    
-    for study in studies:
-        duration = (study.end_date - study.start_date).days
-        total_days += duration
-        count += 1
-    
-    if count > 0:
-        return round(total_days / count, 1)
-    return 0.0
-
-def calculate_follow_up_compliance(susars_qs):
-    """Calculate follow-up compliance rate"""
-    with_follow_up = susars_qs.filter(
-        follow_up_required=True,
-        follow_up_notes__isnull=False
-    ).exclude(follow_up_notes='').count()
-    
-    total_follow_up = susars_qs.filter(follow_up_required=True).count()
-    
-    if total_follow_up > 0:
-        return round((with_follow_up / total_follow_up) * 100, 1)
-    return 0.0
\ No newline at end of file
+def reports_index_stats(start_date, end_date, study_id=None):
+    """Cacheable chart data and summary statistics for the reports dashboard"""
+    return analytics.report_stats(start_date, end_date, study_id)
@@ -0,0 +1,204 @@
+# ============================================
+# writer.py - ClinTrack Buffered Writer
+# ============================================
+
+"""
+Buffered, off-request inserts for audit logs and staff attendance.
+
+Views hand unsaved ``AuditLog`` / ``StaffAttendance`` instances to
+``defer_write``, which only puts them on an in-process queue. A background
+thread drains the queue with one ``bulk_create`` per model when
+``CLINTRACK_WRITE_BATCH_SIZE`` rows are waiting or every
+``CLINTRACK_WRITE_FLUSH_INTERVAL`` seconds, so a burst of logins becomes a
+few short write transactions instead of one per request.
+
+Rows that cannot be written (the database is locked or gone, or the
+process is exiting) are appended to the ``CLINTRACK_WRITE_SPOOL`` JSON Lines
+file and replayed the next time the writer starts. Pending rows are flushed
+at interpreter exit.
+
+Set ``CLINTRACK_WRITE_ASYNC = False`` (e.g. in tests) to save immediately.
+"""
+
+import atexit
+import json
+import logging
+import queue
+import threading
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+
+from .cache import invalidate_contexts
+from .models import StaffAttendance
+
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class BufferedWriter:
+    """Queue of unsaved model instances written in batches by a daemon thread"""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._registered = False
+
+    @property
+    def batch_size(self):
+        return _setting('CLINTRACK_WRITE_BATCH_SIZE', 200)
+
+    @property
+    def interval(self):
+        return _setting('CLINTRACK_WRITE_FLUSH_INTERVAL', 1.0)
+
+    @property
+    def spool_path(self):
+        return Path(_setting('CLINTRACK_WRITE_SPOOL', 'logs/write-spool.jsonl'))
+
+    # ----- producer side -----
+
+    def write(self, instance):
+        if not _setting('CLINTRACK_WRITE_ASYNC', True):
+            instance.save()
+            return
+        self._ensure_started()
+        self.queue.put(instance)
+        if self.queue.qsize() >= self.batch_size:
+            self._wake.set()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping.clear()
+                self._thread = threading.Thread(
+                    target=self._run, name='clintrack-writer', daemon=True
+                )
+                self._thread.start()
+                if not self._registered:
+                    atexit.register(self.stop)
+                    self._registered = True
+
+    # ----- consumer side -----
+
+    def _run(self):
+        close_old_connections()
+        self.replay_spool()
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            # Drop this thread's connection if it has gone stale between batches
+            close_old_connections()
+            self.flush()
+        connection.close()
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self.queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def flush(self):
+        """Write every queued row now; returns how many were taken off the queue"""
+        with self._flush_lock:
+            rows = self._drain()
+            if rows:
+                if not self._insert(rows):
+                    self._spool(rows)
+            return len(rows)
+
+    def _insert(self, rows):
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(type(row), []).append(row)
+        try:
+            with transaction.atomic():
+                for model, instances in by_model.items():
+                    model.objects.bulk_create(instances, batch_size=self.batch_size)
+        except Exception:
+            logger.exception('Buffered write of %d rows failed; spooling them', len(rows))
+            return False
+
+        # bulk_create skips post_save, which normally invalidates attendance stats
+        if StaffAttendance in by_model:
+            invalidate_contexts()
+        return True
+
+    def stop(self, timeout=5):
+        """Stop the thread and write (or spool) whatever is still queued"""
+        self._stopping.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.flush()
+
+    # ----- durable fallback -----
+
+    def _spool(self, rows):
+        path = self.spool_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as handle:
+            for row in rows:
+                fields = {
+                    field.attname: field.value_from_object(row)
+                    for field in row._meta.concrete_fields if not field.primary_key
+                }
+                handle.write(json.dumps(
+                    {'model': row._meta.label_lower, 'fields': fields}, cls=DjangoJSONEncoder
+                ) + '\n')
+
+    def replay_spool(self):
+        """Insert rows spooled by an earlier failure; returns how many were written"""
+        path = self.spool_path
+        replaying = path.with_name(path.name + '.replaying')
+        try:
+            path.replace(replaying)
+        except FileNotFoundError:
+            # Nothing spooled, or another process took the file first
+            return 0
+
+        rows = []
+        with open(replaying, encoding='utf-8') as handle:
+            for line in handle:
+                record = json.loads(line)
+                model = apps.get_model(record['model'])
+                fields = {field.attname: field for field in model._meta.concrete_fields}
+                rows.append(model(**{
+                    name: fields[name].to_python(value)
+                    for name, value in record['fields'].items()
+                }))
+
+        with self._flush_lock:
+            if not self._insert(rows):
+                self._spool(rows)
+        replaying.unlink()
+        return len(rows)
+
+
+buffered_writer = BufferedWriter()
+
+
+def defer_write(instance):
+    """Save ``instance`` (an AuditLog or StaffAttendance) off the request path"""
+    buffered_writer.write(instance)
+
+
+def flush_writes():
+    """Write every deferred row before continuing"""
+    return buffered_writer.flush()